@@ -49,10 +49,26 @@ log_error() {
     echo -e "${RED}[ERROR]${NC} $1"
 }
 
+# 步骤标记（机器可读，后端据此更新进度并记录每个步骤的起止时间）：
+#   ::step id=<步骤号> name=<名称>::          步骤开始（上一个步骤随之结束）
+#   ::step-end id=<步骤号> status=<ok|failed>::  步骤结束
+CURRENT_STEP=""
+log_step() {
+    CURRENT_STEP="$1"
+    echo "::step id=$1 name=$2::"
+}
+
+log_step_end() {
+    echo "::step-end id=$1 status=${2:-ok}::"
+}
+
 # 检查错误并退出
 check_error() {
     if [ $? -ne 0 ]; then
         log_error "$1"
+        if [ -n "$CURRENT_STEP" ]; then
+            log_step_end "$CURRENT_STEP" failed
+        fi
         exit 1
     fi
 }
@@ -164,9 +180,11 @@ log_info "TASK_MODE: '${TASK_MODE}'"
 # ============================================
 # Step 0: prepare
 # ============================================
+log_step 0 prepare
 log_info "Step 0: ????..."
 
 if [ "$TASK_MODE" = "web" ]; then
+    log_step 1 web
     log_info "Step 1: ?? Web ??..."
     TEMPLATE_DIR="/workspace/templates/Tubbim"
     if [ ! -d "$TEMPLATE_DIR" ]; then
@@ -276,6 +294,7 @@ else
 fi
 if [ "$TASK_MODE" != "web" ]; then
 # ============================================
+log_step 1 web
 log_info "Step 1: 构建 Web 项目..."
 
 # 完整重装依赖的函数
@@ -638,6 +657,7 @@ NODE
 # ============================================
 # 步骤 2: 初始化 Capacitor
 # ============================================
+log_step 2 capacitor
 log_info "Step 2: 初始化 Capacitor..."
 
 # 检查是否已安装Capacitor
@@ -693,6 +713,7 @@ log_success "Capacitor 初始化完成"
 # ============================================
 # 步骤 3: 添加 Android 平台
 # ============================================
+log_step 3 android-platform
 log_info "Step 3: 添加 Android 平台..."
 
 # 检查是否已安装android平台
@@ -716,6 +737,7 @@ log_success "Android 平台添加完成"
 # ============================================
 # 步骤 4: 设置应用图标
 # ============================================
+log_step 4 icons
 log_info "Step 4: 设置应用图标..."
 
 # 安装 @capacitor/assets
@@ -761,6 +783,7 @@ fi
 # ============================================
 # 步骤 5: 同步代码
 # ============================================
+log_step 5 sync
 log_info "Step 5: 同步代码到 Android 项目..."
 
 npx cap sync android
@@ -1570,6 +1593,7 @@ NODE
 # ============================================
 # 步骤 6: 配置 Android 项目
 # ============================================
+log_step 6 android-config
 log_info "Step 6: 配置 Android 项目..."
 
 # 创建 local.properties
@@ -1607,8 +1631,10 @@ if [ "$OUTPUT_FORMAT" != "apk" ] && [ "$OUTPUT_FORMAT" != "aab" ]; then
 fi
 
 if [ "$OUTPUT_FORMAT" = "aab" ]; then
+    log_step 7 gradle
     log_info "Step 7: 构建 Release AAB..."
 else
+    log_step 7 gradle
     log_info "Step 7: 构建 Release APK..."
 fi
 
@@ -1657,6 +1683,13 @@ allprojects {
 EOF
 GRADLE_INIT_ARGS=(--init-script "$GRADLE_INIT_SCRIPT")
 
+# 按 BUILD_LOG_LEVEL 选择 Gradle 日志参数（quiet 保留警告，info 输出详细日志）
+case "${BUILD_LOG_LEVEL:-info}" in
+    quiet) GRADLE_LOG_ARGS=(--warn) ;;
+    normal) GRADLE_LOG_ARGS=() ;;
+    *) GRADLE_LOG_ARGS=(--info) ;;
+esac
+
 # 构建 release APK（带详细日志和优化参数）
 log_info "开始 Gradle 构建（可能需要几分钟下载依赖）..."
 
@@ -1664,8 +1697,8 @@ log_info "开始 Gradle 构建（可能需要几分钟下载依赖）..."
 export GRADLE_OPTS="-Xmx2g -XX:MaxMetaspaceSize=512m -XX:+HeapDumpOnOutOfMemoryError"
 
 if [ "$OUTPUT_FORMAT" = "aab" ]; then
-    # 执行构建，添加 --info 查看详细日志，--stacktrace 查看错误栈
-    ./gradlew bundleRelease "${GRADLE_INIT_ARGS[@]}" \
+    # 执行构建，日志参数见 GRADLE_LOG_ARGS，--stacktrace 查看错误栈
+    ./gradlew bundleRelease "${GRADLE_INIT_ARGS[@]}" "${GRADLE_LOG_ARGS[@]}" \
         --no-daemon \
         --stacktrace \
         --warning-mode all \
@@ -1685,8 +1718,8 @@ if [ "$OUTPUT_FORMAT" = "aab" ]; then
 
     log_success "AAB 构建完成: $AAB_PATH"
 else
-    # 执行构建，添加 --info 查看详细日志，--stacktrace 查看错误栈
-    ./gradlew assembleRelease "${GRADLE_INIT_ARGS[@]}" \
+    # 执行构建，日志参数见 GRADLE_LOG_ARGS，--stacktrace 查看错误栈
+    ./gradlew assembleRelease "${GRADLE_INIT_ARGS[@]}" "${GRADLE_LOG_ARGS[@]}" \
         --no-daemon \
         --stacktrace \
         --warning-mode all \
@@ -1717,6 +1750,7 @@ cd ..
 # ============================================
 # 步骤 8: 生成/使用密钥库
 # ============================================
+log_step 8 keystore
 log_info "Step 8: 准备签名密钥..."
 
 KEYSTORE_FILE="$KEYSTORE_DIR/release.keystore"
@@ -1771,8 +1805,10 @@ fi
 # 步骤 9: 对齐 APK / 准备 AAB 输出
 # ============================================
 if [ "$OUTPUT_FORMAT" = "aab" ]; then
+    log_step 9 artifact
     log_info "Step 9: 准备 AAB 输出..."
 else
+    log_step 9 artifact
     log_info "Step 9: 对齐 APK (zipalign)..."
 fi
 
@@ -1805,6 +1841,7 @@ fi
 # 步骤 10: 签名 APK / AAB
 # ============================================
 if [ "$OUTPUT_FORMAT" = "aab" ]; then
+    log_step 10 sign
     log_info "Step 10: 签名 AAB (jarsigner)..."
 
     # AAB 使用 jarsigner（AAB 本质是 zip/jar 格式）
@@ -1827,6 +1864,7 @@ if [ "$OUTPUT_FORMAT" = "aab" ]; then
     log_success "AAB 签名完成"
     FINAL_OUTPUT="$SIGNED_AAB"
 else
+    log_step 10 sign
     log_info "Step 10: 签名 APK (apksigner)..."
 
     apksigner sign \
@@ -1855,6 +1893,7 @@ fi
 # ============================================
 log_info "清理临时文件..."
 rm -f "$UNSIGNED_APK" "$ALIGNED_APK" "$UNSIGNED_AAB" 2>/dev/null || true
+log_step_end 10 ok
 
 # ============================================
 # 完成
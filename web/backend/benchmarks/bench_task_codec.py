@@ -0,0 +1,99 @@
+"""
+任务编解码微基准：对比旧路径（model_dump + json.dumps(indent=2) / BuildTaskResponse 校验）
+与 task_codec 快速路径在 N 个任务上的编码、解码吞吐
+
+用法（在 web/backend 目录下）：
+    python benchmarks/bench_task_codec.py [任务数，默认 10000]
+"""
+import json
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from models import BuildStatus, BuildTask, BuildTaskResponse, BuildTaskSummary, TaskRecord  # noqa: E402
+import task_codec  # noqa: E402
+from task_store import task_from_dict, task_from_json  # noqa: E402
+
+
+def make_models(count: int) -> list:
+    base = datetime(2025, 1, 1)
+    tasks = []
+    for i in range(count):
+        created = base + timedelta(seconds=i)
+        tasks.append(BuildTask(
+            id=str(uuid.uuid4()),
+            client_id=f"client_{i % 20}",
+            config={
+                "app_name": f"App {i}",
+                "package_name": f"com.example.app{i}",
+                "version_name": "1.0.0",
+                "version_code": i + 1,
+                "permissions": ["camera", "microphone"],
+            },
+            status=BuildStatus.SUCCESS,
+            created_at=created,
+            updated_at=created + timedelta(minutes=3),
+            progress=100,
+            message="APK 构建成功",
+            download_url="/api/download/x",
+            output_filename=f"app{i}.apk",
+        ))
+    return tasks
+
+
+def make_tasks(count: int) -> list:
+    return [TaskRecord.from_model(task) for task in make_models(count)]
+
+
+def legacy_task_to_dict(task: BuildTask) -> dict:
+    data = task.model_dump()
+    data["status"] = task.status.value
+    data["created_at"] = task.created_at.isoformat()
+    data["updated_at"] = task.updated_at.isoformat()
+    return data
+
+
+def bench(label: str, func, count: int) -> float:
+    started = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - started
+    print(f"  {label:<44} {elapsed * 1000:9.1f} ms  {count / elapsed:12,.0f} 个/秒")
+    return elapsed
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    models = make_models(count)
+    tasks = [TaskRecord.from_model(task) for task in models]
+    print(f"任务数: {count}，JSON 编码后端: {task_codec.JSON_CODEC}")
+
+    print("持久化编码")
+    bench("旧: model_dump + json.dumps(indent=2)", lambda: json.dumps(
+        [legacy_task_to_dict(task) for task in models], ensure_ascii=False, indent=2), count)
+    bench("新: task_to_dict + 紧凑编码", lambda: task_codec.dumps(
+        [task_codec.task_to_dict(task) for task in tasks]), count)
+    bench("新: encode_task（SQLite 逐行）", lambda: [task_codec.encode_task(task) for task in tasks], count)
+
+    legacy_rows = [json.dumps(legacy_task_to_dict(task), ensure_ascii=False) for task in models]
+    rows = [task_codec.encode_task(task) for task in tasks]
+    print("持久化解码")
+    bench("旧: json.loads + BuildTask 校验", lambda: [BuildTask(**json.loads(row)) for row in legacy_rows], count)
+    bench("新: json.loads + task_from_dict", lambda: [task_from_dict(json.loads(row)) for row in rows], count)
+    bench("新: task_from_json", lambda: [task_from_json(row) for row in rows], count)
+
+    print("API 响应")
+    bench("旧: BuildTaskResponse 校验 + 序列化", lambda: json.dumps(
+        [BuildTaskResponse.model_validate(task).model_dump(mode="json") for task in models]), count)
+    bench("旧: BuildTaskSummary 校验 + 序列化", lambda: json.dumps(
+        [BuildTaskSummary.model_validate(task).model_dump(mode="json") for task in models]), count)
+    cache = task_codec.TaskBodyCache(task_codec.encode_task_summary)
+    bench("新: 摘要编码（缓存未命中）", lambda: cache.get_many(tasks, lambda task_id: 1), count)
+    bench("新: 摘要编码（缓存命中，只拼接字节）", lambda: cache.get_many(tasks, lambda task_id: 1), count)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+构建日志写入微基准：对比旧路径（每行 open-append-close）与 TaskLogWriter（保持打开、批量写入）的行/秒
+
+用法（在 web/backend 目录下）：
+    python benchmarks/bench_task_logs.py [行数，默认 50000]
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from task_logs import TaskLogWriter  # noqa: E402
+
+
+def make_lines(count: int) -> list:
+    return [
+        f"[12:00:{i % 60:02d}] > Task :app:compileReleaseJavaWithJavac UP-TO-DATE (line {i}) "
+        f"Skipping task ':app:mergeReleaseResources' as it is up-to-date."
+        for i in range(count)
+    ]
+
+
+def bench(label: str, func, count: int) -> float:
+    started = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - started
+    print(f"  {label:<40} {elapsed * 1000:9.1f} ms  {count / elapsed:12,.0f} 行/秒")
+    return elapsed
+
+
+def write_legacy(path: Path, lines: list) -> None:
+    for line in lines:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+def write_buffered(path: Path, lines: list) -> None:
+    with TaskLogWriter(path) as writer:
+        for line in lines:
+            writer.write(line)
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    lines = make_lines(count)
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = Path(tmp) / "legacy.log"
+        buffered_path = Path(tmp) / "buffered.log"
+        print(f"日志行数: {count}")
+        bench("旧: 每行 open-append-close", lambda: write_legacy(legacy_path, lines), count)
+        bench("新: TaskLogWriter 批量写入", lambda: write_buffered(buffered_path, lines), count)
+        assert legacy_path.read_bytes() == buffered_path.read_bytes()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+构建并发与准入控制
+- APK_BUILDER_MAX_CONCURRENT_BUILDS：构建工作线程数（默认 1；auto 按 CPU 核数和内存能容纳的构建数计算）
+- 每个构建的声明占用 APK_BUILDER_BUILD_MEMORY / APK_BUILDER_BUILD_CPUS（默认 6g / 4，同时用作 Docker 的 --memory / --cpus）
+- 工作线程取到任务后，只有当空闲内存（/proc/meminfo 的 MemAvailable）和空闲 CPU（核数减 1 分钟负载）
+  能容纳一个构建时才开始，否则任务保持排队并定期重试
+- 刚开始的构建还没有真正占用资源，准入后 APK_BUILDER_ADMISSION_SETTLE 秒内按声明占用预留，避免一次放行过多
+- 没有构建在运行时总是准入，单个构建超出机器配置时仍按原样构建
+"""
+import os
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from system_info import available_memory_bytes, load_average, total_memory_bytes
+
+_SIZE_UNITS = {"b": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+
+
+def parse_size(text: str) -> int:
+    """解析 Docker 风格的内存大小（6g / 512m / 纯数字为字节）"""
+    text = (text or "").strip().lower().rstrip("b") or "0"
+    unit = _SIZE_UNITS.get(text[-1])
+    if unit is None:
+        return int(float(text))
+    return int(float(text[:-1]) * unit)
+
+
+BUILD_MEMORY = os.getenv("APK_BUILDER_BUILD_MEMORY", "6g").strip() or "6g"
+BUILD_CPUS = os.getenv("APK_BUILDER_BUILD_CPUS", "4").strip() or "4"
+ADMISSION_SETTLE = float(os.getenv("APK_BUILDER_ADMISSION_SETTLE", "60"))
+ADMISSION_POLL_INTERVAL = float(os.getenv("APK_BUILDER_ADMISSION_POLL_INTERVAL", "5"))
+
+
+def resolve_max_builds(value: str, memory_bytes: int, cpus: float) -> int:
+    value = (value or "1").strip().lower()
+    if value == "auto":
+        limits = [(os.cpu_count() or 1) // max(1, int(cpus))]
+        total = total_memory_bytes()
+        if total and memory_bytes > 0:
+            limits.append(total // memory_bytes)
+        return max(1, min(limits))
+    try:
+        return max(1, int(value))
+    except ValueError:
+        return 1
+
+
+def _gb(value: float) -> str:
+    return f"{value / (1024 ** 3):.1f} GB"
+
+
+class AdmissionController:
+    """按声明占用判断当前机器能否再开始一个构建"""
+
+    def __init__(
+        self,
+        memory_bytes: int,
+        cpus: float,
+        settle: float = ADMISSION_SETTLE,
+        poll_interval: float = ADMISSION_POLL_INTERVAL,
+    ):
+        self.memory_bytes = memory_bytes
+        self.cpus = cpus
+        self.settle = settle
+        self.poll_interval = max(0.1, poll_interval)
+        self._admitted: List[float] = []  # 最近准入的时间（预留期内）
+        self._lock = threading.Lock()
+        self.stats = {"admitted": 0, "deferred": 0}
+
+    def try_admit(self, running: int) -> Tuple[bool, str]:
+        """running 为正在运行的构建数；返回 (是否准入, 不准入的原因)"""
+        with self._lock:
+            now = time.monotonic()
+            self._admitted = [ts for ts in self._admitted if now - ts < self.settle]
+            if running > 0:
+                reason = self._check_resources(min(running, len(self._admitted)))
+                if reason:
+                    self.stats["deferred"] += 1
+                    return False, reason
+            self._admitted.append(now)
+            self.stats["admitted"] += 1
+            return True, ""
+
+    def _check_resources(self, settling: int) -> Optional[str]:
+        free_memory = available_memory_bytes()
+        if free_memory is not None:
+            free_memory -= settling * self.memory_bytes
+            if free_memory < self.memory_bytes:
+                return f"等待空闲内存（可用 {_gb(max(0, free_memory))}，每个构建需要 {_gb(self.memory_bytes)}）"
+        load = load_average()
+        if load is not None:
+            free_cpus = (os.cpu_count() or 1) - load - settling * self.cpus
+            if free_cpus < self.cpus:
+                return f"等待空闲 CPU（空闲 {max(0.0, free_cpus):.1f} 核，每个构建需要 {self.cpus:g} 核）"
+        return None
+
+    def metrics(self) -> dict:
+        return {
+            **self.stats,
+            "build_memory": self.memory_bytes,
+            "build_cpus": self.cpus,
+            "available_memory": available_memory_bytes(),
+            "load_average": load_average(),
+        }
+
+
+BUILD_MEMORY_BYTES = parse_size(BUILD_MEMORY)
+MAX_CONCURRENT_BUILDS = resolve_max_builds(
+    os.getenv("APK_BUILDER_MAX_CONCURRENT_BUILDS", "1"), BUILD_MEMORY_BYTES, float(BUILD_CPUS)
+)
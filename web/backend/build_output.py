@@ -0,0 +1,159 @@
+"""
+构建工具输出的级别过滤和完整捕获
+Gradle / npm 的每一行原始输出都写入压缩文件 logs/<task_id>.log.raw.gz（事后排查用），
+只有达到输出级别的行才继续进入日志文件、内存中的日志尾部和前端推送，减少大型构建时逐行处理的开销：
+- quiet：只保留警告、错误和步骤标记
+- normal：再加上 Gradle 生命周期输出（> Task、BUILD SUCCESSFUL 等）和 npm 的普通输出
+- info（默认）：全部输出（与之前相同），省略输出需要显式设置 quiet / normal
+输出级别同时决定工具本身的日志参数（Gradle --warn / 默认 / --info，npm loglevel warn / notice / info），
+工具不再产生被过滤掉的输出，Python 侧也不用逐行读取和判断这些行；级别过滤只处理工具仍然输出的部分
+本地构建按调用的命令区分 Gradle / npm；Docker 构建按当前步骤区分（Step 7 为 Gradle，Step 1-5 为 npm），
+构建脚本自己输出的 [INFO] / [WARNING] 等行始终按生命周期输出处理
+"""
+import gzip
+import os
+import re
+import threading
+from pathlib import Path
+from typing import List, Optional
+
+from task_logs import ParsedLine, classify_line
+
+LEVEL_INFO = 0
+LEVEL_LIFECYCLE = 1
+LEVEL_WARNING = 2
+LEVEL_ERROR = 3
+
+VERBOSITY_LEVELS = {"quiet": LEVEL_WARNING, "normal": LEVEL_LIFECYCLE, "info": LEVEL_INFO}
+
+
+def select_verbosity(name: str) -> str:
+    """APK_BUILDER_BUILD_LOG_LEVEL：quiet / normal / info（默认），无法识别时使用 info"""
+    name = (name or "info").strip().lower()
+    return name if name in VERBOSITY_LEVELS else "info"
+
+
+BUILD_LOG_LEVEL = select_verbosity(os.getenv("APK_BUILDER_BUILD_LOG_LEVEL", "info"))
+
+# 各输出级别对应的工具参数；quiet 仍保留警告，Gradle 用 --warn 而不是 -q
+_GRADLE_LOG_ARGS = {"quiet": ["--warn"], "normal": [], "info": ["--info"]}
+_NPM_LOG_LEVELS = {"quiet": "warn", "normal": "notice", "info": "info"}
+
+
+def gradle_log_args(verbosity: str = BUILD_LOG_LEVEL) -> List[str]:
+    return list(_GRADLE_LOG_ARGS[select_verbosity(verbosity)])
+
+
+def tool_log_env(verbosity: str = BUILD_LOG_LEVEL) -> dict:
+    """传给构建进程的环境变量：BUILD_LOG_LEVEL（build.sh / local_builder 选择 Gradle 参数）和 npm / npx 的 loglevel"""
+    verbosity = select_verbosity(verbosity)
+    return {"BUILD_LOG_LEVEL": verbosity, "NPM_CONFIG_LOGLEVEL": _NPM_LOG_LEVELS[verbosity]}
+
+# Gradle --info 下仍属于生命周期（默认级别）的输出
+_GRADLE_LIFECYCLE = re.compile(
+    r"^(?:> (?:Task|Configure|Transform) |BUILD (?:SUCCESSFUL|FAILED)|\d+ actionable tasks?|"
+    r"Deprecated Gradle features|Starting a Gradle Daemon|Welcome to Gradle|"
+    r"\* (?:What went wrong|Try|Get more help|Exception is))"
+)
+# 进入失败说明后，后续的说明和堆栈全部保留
+_GRADLE_FAILURE = ("FAILURE:", "* What went wrong")
+_NPM_INFO_PREFIXES = ("npm info ", "npm http ", "npm verb ", "npm sill ", "npm timing ")
+# build.sh 的 log_info / log_warning 等输出（可能带颜色控制符）
+_SCRIPT_LINE = re.compile(r"^(?:\x1b\[[\d;]*m)?\[(?:INFO|SUCCESS|WARNING|ERROR)\]")
+_NPM_STEPS = frozenset((1, 2, 3, 4, 5))
+_GRADLE_STEPS = frozenset((7,))
+
+
+def script_output_tool(line: str, step: Optional[int]) -> Optional[str]:
+    """Docker 构建脚本输出的来源：按当前步骤判断是 Gradle 还是 npm，脚本自身的日志返回 None"""
+    if step is None or _SCRIPT_LINE.match(line):
+        return None
+    if step in _GRADLE_STEPS:
+        return "gradle"
+    if step in _NPM_STEPS:
+        return "npm"
+    return None
+
+
+def output_level(line: str, tool: Optional[str] = None, parsed: Optional[ParsedLine] = None) -> int:
+    """
+    单行输出的级别；tool 为 "gradle" / "npm" / None（未知来源，例如 Docker 构建脚本的输出），
+    parsed 为调用方已解析的结果（见 task_logs.parse_line）
+    """
+    if line.startswith("e: "):
+        return LEVEL_ERROR
+    if line.startswith("w: "):
+        return LEVEL_WARNING
+    if tool is None and line.startswith("$ "):
+        # local_builder 输出的命令行本身，任何级别下都保留
+        return LEVEL_WARNING
+    mark = classify_line(line, parsed)
+    if mark is not None:
+        # 步骤标记决定进度和日志分段，任何级别下都保留
+        return LEVEL_WARNING if mark[0] == "warning" else LEVEL_ERROR
+    if line.startswith(_NPM_INFO_PREFIXES):
+        return LEVEL_INFO
+    if tool == "gradle":
+        return LEVEL_LIFECYCLE if _GRADLE_LIFECYCLE.match(line) else LEVEL_INFO
+    return LEVEL_LIFECYCLE
+
+
+class BuildOutputCapture:
+    """
+    单个任务的原始输出捕获，作为 on_output(line, tool[, parsed]) 回调使用：
+    每一行都写入 gzip 文件，返回值表示这一行是否需要转发到构建日志
+    """
+
+    def __init__(self, path: Path, verbosity: str = BUILD_LOG_LEVEL, buffer_bytes: int = 256 * 1024):
+        self.path = Path(path)
+        self.verbosity = select_verbosity(verbosity)
+        self.threshold = VERBOSITY_LEVELS[self.verbosity]
+        self.buffer_bytes = buffer_bytes
+        self.lines = 0
+        self.forwarded = 0
+        self._failure = False
+        self._file = None
+        self._pending: List[bytes] = []
+        self._pending_bytes = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, line: str, tool: Optional[str] = None, parsed: Optional[ParsedLine] = None) -> bool:
+        data = (line + "\n").encode("utf-8", errors="replace")
+        with self._lock:
+            self.lines += 1
+            self._pending.append(data)
+            self._pending_bytes += len(data)
+            if self._pending_bytes >= self.buffer_bytes:
+                self._flush_locked()
+        if self.threshold == LEVEL_INFO:
+            forward = True
+        elif self._failure:
+            forward = True
+        else:
+            if tool == "gradle" and line.startswith(_GRADLE_FAILURE):
+                self._failure = True
+            forward = self._failure or output_level(line, tool, parsed) >= self.threshold
+        if forward:
+            self.forwarded += 1
+        return forward
+
+    @property
+    def dropped(self) -> int:
+        return self.lines - self.forwarded
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush_locked()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _flush_locked(self) -> None:
+        if not self._pending:
+            return
+        if self._file is None:
+            # 重新构建时追加为新的 gzip member，zcat 可以直接读取整个文件
+            self._file = gzip.open(self.path, "ab", compresslevel=6)
+        self._file.write(b"".join(self._pending))
+        self._pending.clear()
+        self._pending_bytes = 0
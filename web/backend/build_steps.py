@@ -0,0 +1,146 @@
+"""
+构建步骤协议
+构建脚本（apk-worker/scripts/build.sh）和本地构建（local_builder）在步骤开始 / 结束时输出一行机器可读的标记：
+    ::step id=7 name=gradle::
+    ::step-end id=7 status=ok::
+没有显式结束的步骤在下一个步骤开始时结束。旧版构建脚本的自由文本标记（log_info "Step 7: ..."、
+log_success "APK 构建完成"）仍然识别，但只认行首的 [INFO] / [SUCCESS] 前缀（可带时间戳和颜色控制符），
+Gradle / npm 等工具输出中出现的 "Step 3" 不会被当作步骤切换；所有标记由同一个预编译正则一次匹配
+"""
+import re
+import time
+from typing import List, Optional
+
+STEP_NAMES = {
+    0: "prepare",
+    1: "web",
+    2: "capacitor",
+    3: "android-platform",
+    4: "icons",
+    5: "sync",
+    6: "android-config",
+    7: "gradle",
+    8: "keystore",
+    9: "artifact",
+    10: "sign",
+}
+
+# Docker 构建中各步骤开始时上报的进度（本地构建在 local_builder 中直接上报）
+STEP_PROGRESS = {
+    0: (15, "准备工作..."),
+    1: (25, "构建Web项目..."),
+    2: (35, "初始化Capacitor..."),
+    3: (45, "添加Android平台..."),
+    4: (55, "设置应用图标..."),
+    5: (60, "同步代码..."),
+    6: (65, "配置Android项目..."),
+    7: (70, "构建 Release 产物..."),
+    8: (80, "准备签名密钥..."),
+    9: (85, "处理构建产物..."),
+    10: (90, "签名构建产物..."),
+}
+DONE_PROGRESS = (95, "构建完成，正在处理输出...")
+
+# build.sh 的 log_info / log_success 前缀，构建日志中前面可能还有 "[HH:MM:SS] " 时间戳
+_LEGACY_PREFIX = r"^(?:\[\d{2}:\d{2}:\d{2}\] )?(?:\x1b\[[\d;]*m)?\[(?:INFO|SUCCESS)\](?:\x1b\[[\d;]*m)? "
+
+MARKER_PATTERN = re.compile(
+    r"::step(?P<end>-end)? id=(?P<id>\d+)(?: name=(?P<name>[\w.-]+))?(?: status=(?P<status>\w+))?::"
+    r"|" + _LEGACY_PREFIX + r"(?:Step (?P<legacy>\d+)\b|.*?(?P<done>APK|AAB) 构建完成)"
+)
+
+
+def format_step_start(step_id: int, name: Optional[str] = None) -> str:
+    return f"::step id={step_id} name={name or STEP_NAMES.get(step_id, 'step')}::"
+
+
+def format_step_end(step_id: int, status: str = "ok") -> str:
+    return f"::step-end id={step_id} status={status}::"
+
+
+class StepMarker:
+    """日志行中的步骤标记；kind 为 start / end / done（产物构建完成）"""
+
+    __slots__ = ("kind", "step", "name", "status", "legacy")
+
+    def __init__(self, kind: str, step: Optional[int], name: Optional[str] = None, status: Optional[str] = None, legacy: bool = False):
+        self.kind = kind
+        self.step = step
+        self.name = name
+        self.status = status
+        self.legacy = legacy
+
+
+def match_step_marker(line: str) -> Optional[StepMarker]:
+    # 绝大多数行不含任何标记，先用子串查找跳过正则
+    if "::step" not in line and "Step " not in line and "构建完成" not in line:
+        return None
+    match = MARKER_PATTERN.search(line)
+    if match is None:
+        return None
+    if match.group("id") is not None:
+        step = int(match.group("id"))
+        if match.group("end"):
+            return StepMarker("end", step, STEP_NAMES.get(step), match.group("status") or "ok")
+        return StepMarker("start", step, match.group("name") or STEP_NAMES.get(step))
+    if match.group("legacy") is not None:
+        step = int(match.group("legacy"))
+        return StepMarker("start", step, STEP_NAMES.get(step), legacy=True)
+    return StepMarker("done", None, legacy=True)
+
+
+class StepEvent:
+    __slots__ = ("type", "step", "name", "status", "timestamp")
+
+    def __init__(self, type: str, step: Optional[int], name: Optional[str] = None, status: Optional[str] = None):
+        self.type = type
+        self.step = step
+        self.name = name
+        self.status = status
+        self.timestamp = time.time()
+
+    def to_dict(self) -> dict:
+        return {"type": self.type, "step": self.step, "name": self.name, "status": self.status, "timestamp": self.timestamp}
+
+
+class StepTracker:
+    """
+    把日志行转换为步骤开始 / 结束事件：
+    新步骤开始时先结束当前步骤；同一步骤的重复标记（协议标记后紧跟的旧式 "Step N" 文本）被忽略
+    """
+
+    def __init__(self):
+        self.current: Optional[int] = None
+        self.current_name: Optional[str] = None
+        self.last: Optional[int] = None
+
+    def feed(self, line: str) -> List[StepEvent]:
+        marker = match_step_marker(line)
+        return self.apply(marker) if marker is not None else []
+
+    def apply(self, marker: StepMarker) -> List[StepEvent]:
+        if marker.kind == "done":
+            return [StepEvent("done", self.current, self.current_name)]
+        if marker.kind == "end":
+            if marker.step != self.current:
+                return []
+            return self.finish(marker.status or "ok")
+        if marker.step == self.current:
+            return []
+        if marker.legacy and self.last is not None and marker.step < self.last:
+            # 旧式文本（例如 "Step 0 done"）不会让步骤倒退
+            return []
+        events = self.finish("ok")
+        self.current = self.last = marker.step
+        self.current_name = marker.name
+        events.append(StepEvent("start", marker.step, marker.name))
+        return events
+
+    def finish(self, status: str) -> List[StepEvent]:
+        """结束当前步骤（构建结束时调用，status 为 ok / failed）"""
+        if self.current is None:
+            return []
+        event = StepEvent("end", self.current, self.current_name, status)
+        self.current = None
+        self.current_name = None
+        return [event]
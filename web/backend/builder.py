@@ -11,11 +11,20 @@ import time
 import queue
 from datetime import datetime
 from pathlib import Path
-from typing import Callable, Optional, List, Tuple
+from typing import Callable, Optional, List, Set, Tuple
 
 from local_builder import run_local_build
+from models import TaskStatus
+from task_logs import ParsedLine, TaskLogStore, parse_line
+from build_output import BuildOutputCapture, script_output_tool, tool_log_env
+from build_steps import DONE_PROGRESS, STEP_PROGRESS, StepTracker
+from build_admission import BUILD_CPUS, BUILD_MEMORY, BUILD_MEMORY_BYTES, MAX_CONCURRENT_BUILDS, AdmissionController
+from log_search import LogSearchIndex
+from task_gc import WORKSPACE_PRUNE_MODE, prune_workspace, task_dir_locks
+from task_events import TaskEventStream
+from event_bus import TaskEvent, TaskEventBus, TaskEventType
 import env_setup
-from admin_client import report_task_logs, upload_task_assets, report_task_status, flush_task_assets_queue
+from admin_client import report_task_logs, report_task_start, upload_task_assets, report_task_status, flush_task_assets_queue
 
 # 项目根目录
 PROJECT_ROOT = Path(__file__).parent.parent.parent
@@ -81,6 +90,15 @@ LOGS_DIR.mkdir(parents=True, exist_ok=True)
 TASKS_DIR.mkdir(parents=True, exist_ok=True)
 NPM_CACHE_DIR.mkdir(parents=True, exist_ok=True)
 
+# 构建日志（与任务状态分离，任务列表和持久化都不包含日志）
+task_log_store = TaskLogStore(LOGS_DIR)
+# 跨任务日志搜索（构建结束后在后台建立全文索引）
+log_search_index = LogSearchIndex(DATA_DIR / "log-search.db", task_log_store)
+# 任务状态和日志的实时推送（SSE）
+task_event_stream = TaskEventStream()
+# 任务事件总线：管理后台上报、实时推送等订阅者在各自线程中处理事件
+task_event_bus = TaskEventBus()
+
 
 def _parse_hex_color(raw: str) -> Optional[Tuple[int, int, int]]:
     value = (raw or "").strip().lstrip("#")
@@ -117,11 +135,39 @@ def _is_light_color(color: str) -> bool:
     return luminance >= 0.6
 
 
-def _silent_upload_task_assets(task_id: str, task, output_path: Optional[Path] = None) -> None:
+def _task_config_data(task) -> dict:
     try:
-        config_data = task.config.model_dump() if hasattr(task.config, "model_dump") else task.config.dict()
+        return task.config.model_dump() if hasattr(task.config, "model_dump") else task.config.dict()
     except Exception:
-        config_data = {}
+        return {}
+
+
+def _upload_task_inputs(task, start_time: str, report_start: bool = False) -> None:
+    """上报任务输入（创建/开始构建时）"""
+    config_data = _task_config_data(task)
+    zip_path = TASKS_DIR / task.id / "input" / "project.zip"
+    icon_path = TASKS_DIR / task.id / "input" / "logo.png"
+    zip_info = {}
+    if zip_path.exists():
+        zip_info = {"name": zip_path.name, "size": zip_path.stat().st_size}
+    if report_start:
+        report_task_start(task.id, task.client_id or "", start_time, zip_info, config_data)
+    upload_task_assets(
+        task.id,
+        task.client_id or "",
+        start_time,
+        zip_info,
+        config_data,
+        zip_path=str(zip_path) if zip_path.exists() else None,
+        icon_path=str(icon_path) if icon_path.exists() else None,
+        keystore_path=None,
+        keystore_info={},
+    )
+    flush_task_assets_queue()
+
+
+def _silent_upload_task_assets(task_id: str, task, output_path: Optional[Path] = None) -> None:
+    config_data = _task_config_data(task)
     task_dir = TASKS_DIR / task_id
     zip_path = task_dir / "input" / "project.zip"
     icon_path = task_dir / "input" / "logo.png"
@@ -163,6 +209,8 @@ class APKBuilder:
         self.builder_mode = os.getenv("APK_BUILDER_MODE", "").strip().lower()
         if not self.builder_mode:
             self.builder_mode = "local" if os.name == "nt" else "docker"
+        # 全局 Gradle wrapper 缓存在并发构建之间共享，复制和保存串行进行
+        self._wrapper_cache_lock = threading.Lock()
 
     def cancel_task(self, task_id: str) -> None:
         process = self.running_processes.get(task_id)
@@ -264,9 +312,11 @@ class APKBuilder:
         # volume 模式：Gradle 缓存由 Docker volume 持久化，不需要在这里做任何拷贝
         if GRADLE_CACHE_MODE == "task":
             task_gradle_dir.mkdir(parents=True, exist_ok=True)
-            self._copy_gradle_wrapper_cache(task_gradle_dir)
+            with self._wrapper_cache_lock:
+                self._copy_gradle_wrapper_cache(task_gradle_dir)
         
-        # 清理output目录（重试时需要）
+        # 清理output目录（重试时需要；工作目录可能已被回收删除）
+        task_output_dir.mkdir(parents=True, exist_ok=True)
         if task_output_dir.exists():
             for f in task_output_dir.iterdir():
                 if f.is_file():
@@ -320,6 +370,8 @@ class APKBuilder:
             "KEYSTORE_REUSED": "true" if keystore_reused else "false",
             "GRADLE_USER_HOME": str(DATA_DIR / "gradle-user-home"),
             "NPM_CONFIG_CACHE": npm_cache_dir,
+            # 输出级别映射到 Gradle / npm 自身的日志参数（见 build_output）
+            **tool_log_env(),
         }
 
         env.update(env_setup.get_env_overrides())
@@ -346,17 +398,31 @@ class APKBuilder:
             on_log: 日志回调 (log_line: str)
             on_complete: 完成回调 (success: bool, message: str, output_file: Optional[str])
         """
-        log_file = LOGS_DIR / f"{task_id}.log"
-        
-        def log(message: str):
-            """写入日志"""
+        # 日志文件在构建期间保持打开，批量写入；工具的原始输出完整写入压缩文件，只转发达到输出级别的行
+        log_writer = task_log_store.open_writer(task_id)
+        output_capture = BuildOutputCapture(task_log_store.capture_path(task_id))
+
+        def log(message: str, parsed: Optional[ParsedLine] = None):
+            """写入日志（parsed 为已经解析过的结果，写入器不再重复匹配）"""
             timestamp = datetime.now().strftime("%H:%M:%S")
             log_line = f"[{timestamp}] {message}"
-            with open(log_file, "a", encoding="utf-8") as f:
-                f.write(log_line + "\n")
+            log_writer.write(log_line, parsed)
             if on_log:
                 on_log(log_line)
 
+        def progress(value: int, message: str):
+            # 步骤切换时把缓冲的日志写入文件
+            log_writer.flush()
+            if on_progress:
+                on_progress(value, message)
+
+        def complete(success: bool, message: str, output_file: Optional[str]):
+            log_writer.finish_step("ok" if success else "failed")
+            self._close_output_capture(output_capture, log)
+            log_writer.close()
+            if on_complete:
+                on_complete(success, message, output_file)
+
         process = None
         try:
             log("========== 构建任务开始 ==========")
@@ -367,8 +433,7 @@ class APKBuilder:
             log(f"输出格式: {env.get('OUTPUT_FORMAT', 'N/A')}")
             log("")
             
-            if on_progress:
-                on_progress(5, "准备Docker环境...")
+            progress(5, "准备Docker环境...")
             log("Step 0: 准备Docker环境...")
             log(f"任务输入目录: {env.get('TASK_INPUT_DIR', 'N/A')}")
             log(f"任务输出目录: {env.get('TASK_OUTPUT_DIR', 'N/A')}")
@@ -418,7 +483,7 @@ class APKBuilder:
             cmd += task_mount_args
             cmd += ["-v", gradle_mount]  # Gradle缓存
             # 资源限制（Gradle构建需要较大内存）
-            cmd += ["--memory=6g", "--cpus=4"]
+            cmd += [f"--memory={BUILD_MEMORY}", f"--cpus={BUILD_CPUS}"]
             # 环境变量
             cmd += [
                 "-e",
@@ -448,6 +513,10 @@ class APKBuilder:
                 "-e",
                 f"PERMISSIONS={env.get('PERMISSIONS', '')}",
                 "-e",
+                f"BUILD_LOG_LEVEL={env.get('BUILD_LOG_LEVEL', 'info')}",
+                "-e",
+                f"NPM_CONFIG_LOGLEVEL={env.get('NPM_CONFIG_LOGLEVEL', 'info')}",
+                "-e",
                 f"KEYSTORE_PASSWORD={env['KEYSTORE_PASSWORD']}",
                 "-e",
                 f"KEY_ALIAS={env['KEY_ALIAS']}",
@@ -461,7 +530,8 @@ class APKBuilder:
             ]
             cmd += task_dir_env_args
             if task_data_volume:
-                cmd += ['-e', 'NPM_CONFIG_CACHE=/data/npm-cache']
+                slot = int(env.get('WORKER_SLOT') or 0)
+                cmd += ['-e', f"NPM_CONFIG_CACHE=/data/npm-cache-{slot}" if slot > 0 else 'NPM_CONFIG_CACHE=/data/npm-cache']
                 cmd += [
                     "-e",
                     f"PROJECT_DIR=/data/tasks/{task_id}/project",
@@ -482,8 +552,7 @@ class APKBuilder:
             process_env.update(env)
             process_env.update(env_setup.get_npm_config())
             
-            if on_progress:
-                on_progress(10, "启动Docker容器构建...")
+            progress(10, "启动Docker容器构建...")
             log("启动Docker容器...")
             log(f"工作目录: {APK_WORKER_DIR}")
             log("")
@@ -502,23 +571,8 @@ class APKBuilder:
             )
             self.running_processes[task_id] = process
             
-            # 读取输出并更新进度
-            progress_map = {
-                "Step 0": (15, "准备工作..."),
-                "Step 1": (25, "构建Web项目..."),
-                "Step 2": (35, "初始化Capacitor..."),
-                "Step 3": (45, "添加Android平台..."),
-                "Step 4": (55, "设置应用图标..."),
-                "Step 5": (60, "同步代码..."),
-                "Step 6": (65, "配置Android项目..."),
-                "Step 7": (70, "构建 Release 产物..."),
-                "Step 8": (80, "准备签名密钥..."),
-                "Step 9": (85, "处理构建产物..."),
-                "Step 10": (90, "签名构建产物..."),
-                "APK 构建完成": (95, "构建完成，正在处理输出..."),
-                "AAB 构建完成": (95, "构建完成，正在处理输出..."),
-            }
-            
+            # 读取输出并更新进度：步骤标记（::step id=N name=...::，兼容旧的 "Step N" 文本）由 build_steps 一次匹配
+            step_tracker = StepTracker()
             last_progress = 10
             build_completed = False
             
@@ -534,23 +588,24 @@ class APKBuilder:
                     if "Error response from daemon" in line or "dead or marked for removal" in line:
                         continue
                     
-                    # 写入日志
-                    log(line)
-                    # 打印时过滤非ASCII字符避免Windows终端编码问题
-                    safe_line = line.encode('ascii', errors='replace').decode('ascii')
-                    print(f"[Docker] {safe_line}")
-                    
-                    # 检测构建完成标志
-                    if "APK 构建完成" in line or "AAB 构建完成" in line:
-                        build_completed = True
-                    
-                    # 检查进度关键词
-                    for key, (prog, msg) in progress_map.items():
-                        if key in line:
-                            last_progress = prog
-                            if on_progress:
-                                on_progress(prog, msg)
-                            break
+                    # 每行只解析一次，结果交给步骤跟踪、输出级别过滤和日志写入器
+                    parsed = parse_line(line)
+                    for event in step_tracker.apply(parsed.marker) if parsed.marker is not None else ():
+                        if event.type == "start" and event.step in STEP_PROGRESS:
+                            last_progress, msg = STEP_PROGRESS[event.step]
+                            progress(last_progress, msg)
+                        elif event.type == "done":
+                            # 检测构建完成标志
+                            build_completed = True
+                            last_progress, msg = DONE_PROGRESS
+                            progress(last_progress, msg)
+
+                    # 原始输出全部写入压缩文件，低于输出级别的行不再写入日志
+                    if output_capture(line, script_output_tool(line, step_tracker.current), parsed):
+                        log(line, parsed)
+                        # 打印时过滤非ASCII字符避免Windows终端编码问题
+                        safe_line = line.encode('ascii', errors='replace').decode('ascii')
+                        print(f"[Docker] {safe_line}")
                 
                 # 如果构建已完成，退出循环
                 if build_completed and process.poll() is not None:
@@ -567,7 +622,8 @@ class APKBuilder:
                 if env.get("GRADLE_CACHE_MODE") == "task":
                     task_gradle_dir = TASKS_DIR / task_id / "gradle"
                     if task_gradle_dir.exists():
-                        self._save_gradle_wrapper_cache(task_gradle_dir)
+                        with self._wrapper_cache_lock:
+                            self._save_gradle_wrapper_cache(task_gradle_dir)
                 
                 output_format = (env.get("OUTPUT_FORMAT") or "apk").strip().lower()
                 if output_format == "aab":
@@ -590,21 +646,17 @@ class APKBuilder:
                     log(f"最终文件名: {final_filename}")
                     log("========== 构建成功 ==========")
                     
-                    if on_progress:
-                        on_progress(100, "构建成功！")
-                    if on_complete:
-                        on_complete(True, f"{artifact_label} 构建成功", final_filename)
+                    progress(100, "构建成功！")
+                    complete(True, f"{artifact_label} 构建成功", final_filename)
                 else:
                     log(f"错误: 构建完成但未找到 {artifact_label} 文件")
                     log(f"检查目录: {task_output_dir}")
                     log("========== 构建失败 ==========")
-                    if on_complete:
-                        on_complete(False, f"构建完成但未找到{artifact_label}文件", None)
+                    complete(False, f"构建完成但未找到{artifact_label}文件", None)
             else:
                 log(f"错误: Docker构建失败，退出码: {return_code}")
                 log("========== 构建失败 ==========")
-                if on_complete:
-                    on_complete(False, f"Docker构建失败，退出码: {return_code}", None)
+                complete(False, f"Docker构建失败，退出码: {return_code}", None)
                     
         except FileNotFoundError as e:
             if getattr(e, "filename", "") == "docker":
@@ -616,20 +668,28 @@ class APKBuilder:
                 error_msg = f"构建异常: {str(e)}"
             log(f"错误: {error_msg}")
             log("========== 构建异常 ==========")
-            if on_complete:
-                on_complete(False, error_msg, None)
+            complete(False, error_msg, None)
 
         except Exception as e:
             error_msg = f"构建异常: {str(e)}"
             log(f"错误: {error_msg}")
             log("========== 构建异常 ==========")
-            if on_complete:
-                on_complete(False, error_msg, None)
+            complete(False, error_msg, None)
         finally:
+            # 日志写入器由 complete() 关闭（在完成回调之前，归档订阅者才能处理日志）
+            output_capture.close()
             if process is not None:
                 self.running_processes.pop(task_id, None)
 
 
+    def _close_output_capture(self, capture: BuildOutputCapture, log: Callable[[str], None]) -> None:
+        capture.close()
+        if capture.dropped:
+            log(
+                f"[Log] 输出级别 {capture.verbosity}：工具输出 {capture.lines} 行，日志中省略 {capture.dropped} 行，"
+                f"完整输出见 {capture.path.name}"
+            )
+
     def run_local_build(
         self,
         task_id: str,
@@ -639,16 +699,31 @@ class APKBuilder:
         on_log: Optional[Callable[[str], None]] = None,
         on_complete: Optional[Callable[[bool, str, Optional[str]], None]] = None
     ):
-        log_file = LOGS_DIR / f"{task_id}.log"
+        # 日志文件在构建期间保持打开，批量写入；工具的原始输出完整写入压缩文件，只转发达到输出级别的行
+        log_writer = task_log_store.open_writer(task_id)
+        output_capture = BuildOutputCapture(task_log_store.capture_path(task_id))
 
-        def log(message: str):
+        def log(message: str, parsed: Optional[ParsedLine] = None):
+            """写入日志（parsed 为已经解析过的结果，写入器不再重复匹配）"""
             timestamp = datetime.now().strftime("%H:%M:%S")
             log_line = f"[{timestamp}] {message}"
-            with open(log_file, "a", encoding="utf-8") as f:
-                f.write(log_line + "\n")
+            log_writer.write(log_line, parsed)
             if on_log:
                 on_log(log_line)
 
+        def progress(value: int, message: str):
+            # 步骤切换时把缓冲的日志写入文件
+            log_writer.flush()
+            if on_progress:
+                on_progress(value, message)
+
+        def complete(success: bool, message: str, output_file: Optional[str]):
+            log_writer.finish_step("ok" if success else "failed")
+            self._close_output_capture(output_capture, log)
+            log_writer.close()
+            if on_complete:
+                on_complete(success, message, output_file)
+
         try:
             log("========== 构建任务开始 ==========")
             log(f"任务ID: {task_id}")
@@ -658,14 +733,21 @@ class APKBuilder:
             log(f"输出格式: {env.get('OUTPUT_FORMAT', 'N/A')}")
             log("")
 
-            if on_progress:
-                on_progress(5, "准备本地构建环境...")
+            progress(5, "准备本地构建环境...")
+
+            def on_output(line: str, tool: Optional[str]) -> bool:
+                # 工具输出每行只解析一次：过滤和写入日志都使用同一个结果，这里写入后返回 False
+                parsed = parse_line(line)
+                if output_capture(line, tool, parsed):
+                    log(line, parsed)
+                return False
 
             result = run_local_build(
                 env=env,
                 task_output_dir=task_output_dir,
-                on_progress=on_progress,
-                on_log=log
+                on_progress=progress,
+                on_log=log,
+                on_output=on_output,
             )
 
             output_file = result.get("output_file")
@@ -679,22 +761,36 @@ class APKBuilder:
                 log(f"{artifact_label} 文件已生成: {Path(output_file).name}")
                 log(f"最终文件名: {final_filename}")
                 log("========== 构建成功 ==========")
-                if on_progress:
-                    on_progress(100, "构建成功")
-                if on_complete:
-                    on_complete(True, f"{artifact_label} 构建成功", final_filename)
+                progress(100, "构建成功")
+                complete(True, f"{artifact_label} 构建成功", final_filename)
             else:
                 log(f"错误: 构建完成但未找到 {artifact_label} 文件")
                 log("========== 构建失败 ==========")
-                if on_complete:
-                    on_complete(False, f"构建完成但未找到{artifact_label}文件", None)
+                complete(False, f"构建完成但未找到{artifact_label}文件", None)
 
         except Exception as e:
             error_msg = f"构建异常: {str(e)}"
             log(f"错误: {error_msg}")
             log("========== 构建异常 ==========")
-            if on_complete:
-                on_complete(False, error_msg, None)
+            complete(False, error_msg, None)
+        finally:
+            # 日志写入器由 complete() 关闭（在完成回调之前，归档订阅者才能处理日志）
+            output_capture.close()
+
+    def isolate_worker_caches(self, env: dict, slot: int) -> dict:
+        """
+        并发构建时每个工作线程使用独立的 Gradle / npm 缓存，避免同时写入同一份缓存；
+        0 号工作线程沿用原来的缓存位置（单线程部署的缓存不受影响）
+        """
+        if slot <= 0:
+            return env
+        env = dict(env)
+        env["WORKER_SLOT"] = str(slot)
+        env["GRADLE_USER_HOME"] = f"{env['GRADLE_USER_HOME']}-{slot}"
+        env["NPM_CONFIG_CACHE"] = f"{env['NPM_CONFIG_CACHE'].rstrip('/')}-{slot}"
+        if env.get("GRADLE_CACHE_MODE") != "task":
+            env["GRADLE_CACHE_VOLUME"] = f"{env.get('GRADLE_CACHE_VOLUME') or GRADLE_CACHE_VOLUME}-{slot}"
+        return env
 
     def run_build(
         self,
@@ -730,25 +826,32 @@ class BuildTaskRunner:
     使用任务队列限制并发数，避免资源冲突
     """
     
-    # 最大并发构建数（建议设为1，避免Gradle缓存冲突）
-    MAX_CONCURRENT_BUILDS = 1
+    # 最大并发构建数（APK_BUILDER_MAX_CONCURRENT_BUILDS，见 build_admission；每个工作线程使用独立的 Gradle / npm 缓存）
+    MAX_CONCURRENT_BUILDS = MAX_CONCURRENT_BUILDS
     
-    def __init__(self, tasks_db: dict, on_state_change: Optional[Callable[[bool], None]] = None):
+    def __init__(
+        self,
+        tasks_db: dict,
+        on_state_change: Optional[Callable[[bool, Set[str]], None]] = None,
+        stop_event: Optional[threading.Event] = None,
+    ):
         self.tasks_db = tasks_db
+        # 应用退出时置位，后台清理工作目录不再限速等待
+        self.stop_event = stop_event if stop_event is not None else threading.Event()
         self.builder = APKBuilder()
         self.running_tasks = {}  # 正在运行的任务
         self.canceled_tasks = set()
         self.task_queue = queue.Queue()  # 等待队列
         self.queue_lock = threading.Lock()
         self.on_state_change = on_state_change
-        self._last_persist = 0.0
-        self._persist_interval = 1.0
+        self.admission = AdmissionController(BUILD_MEMORY_BYTES, float(BUILD_CPUS))
         
         # 启动工作线程（数量等于最大并发数）
         self.workers = []
         for i in range(self.MAX_CONCURRENT_BUILDS):
             worker = threading.Thread(
                 target=self._worker_loop,
+                args=(i,),
                 daemon=True,
                 name=f"BuildWorker-{i}"
             )
@@ -757,17 +860,115 @@ class BuildTaskRunner:
         
         print(f"[BuildTaskRunner] 已启动 {self.MAX_CONCURRENT_BUILDS} 个构建工作线程")
 
-    def _notify_state_change(self, force: bool = False) -> None:
+        task_event_bus.subscribe(
+            "admin",
+            self._report_task_event,
+            types=[TaskEventType.CREATED, TaskEventType.QUEUED, TaskEventType.COMPLETED],
+        )
+        # 日志事件太多、推送队列丢弃事件时，让前端重新拉取日志
+        task_event_bus.subscribe(
+            "stream",
+            self._stream_task_event,
+            types=[TaskEventType.LOG],
+            on_drop=lambda event: task_event_stream.publish_resync(event.client_id),
+        )
+        # 构建结束后在后台压缩日志
+        task_event_bus.subscribe("log-archive", self._archive_task_log, types=[TaskEventType.COMPLETED])
+        # 构建成功后在后台限速清理工作目录，不占用构建线程
+        if WORKSPACE_PRUNE_MODE != "off":
+            task_event_bus.subscribe("workspace-prune", self._prune_task_workspace, types=[TaskEventType.COMPLETED])
+        task_event_bus.subscribe(
+            "log-search",
+            lambda event: log_search_index.enqueue(event.task_id, event.client_id),
+            types=[TaskEventType.COMPLETED],
+        )
+
+    def _notify_state_change(self, *task_ids: str, force: bool = False) -> None:
+        # 只登记变化，合并与落盘由后台写线程负责
         if not self.on_state_change:
             return
-        now = time.monotonic()
-        if force or (now - self._last_persist) >= self._persist_interval:
-            self._last_persist = now
+        try:
+            self.on_state_change(force, set(task_ids))
+        except Exception:
+            pass
+    
+    def _report_task_event(self, event: TaskEvent) -> None:
+        """管理后台上报（在事件总线线程中执行，网络请求不占用构建线程）"""
+        task = self.tasks_db.get(event.task_id)
+        if task is None:
+            return
+        event_time = datetime.fromtimestamp(event.timestamp).isoformat()
+        if event.type == TaskEventType.CREATED:
+            _upload_task_inputs(task, event_time)
+            return
+        if event.type == TaskEventType.QUEUED:
+            _upload_task_inputs(task, event_time, report_start=True)
+            return
+
+        if event.data.get("canceled"):
+            return
+        output_file = event.data.get("output_file")
+        output_path = BACKEND_OUTPUT_DIR / output_file if output_file else None
+        try:
+            _silent_upload_task_assets(event.task_id, task, output_path=output_path)
+        except Exception:
+            pass
+        try:
+            flush_task_assets_queue()
+        except Exception:
+            pass
+        output_info = {}
+        if output_path is not None:
             try:
-                self.on_state_change(force)
+                if output_path.exists():
+                    output_info = {
+                        "name": output_path.name,
+                        "size": output_path.stat().st_size,
+                    }
             except Exception:
-                pass
-    
+                output_info = {}
+        try:
+            report_task_status(
+                event.task_id,
+                event.client_id,
+                event.data.get("status", ""),
+                event_time,
+                output_info=output_info,
+            )
+        except Exception:
+            pass
+
+        if not event.data.get("success"):
+            report_task_logs(event.task_id, event.client_id, "BUILD_FAILED", event.data.get("last_lines") or [])
+
+    def _stream_task_event(self, event: TaskEvent) -> None:
+        task_event_stream.publish_log(event.client_id, event.task_id, event.data.get("line", ""))
+
+    def _archive_task_log(self, event: TaskEvent) -> None:
+        # 构建线程仍在写日志时（如取消后进程尚未退出）会跳过，等它自己的完成事件
+        task_log_store.archive(event.task_id)
+
+    def _prune_task_workspace(self, event: TaskEvent) -> None:
+        """构建成功后清理工作目录（APK_BUILDER_WORKSPACE_PRUNE），清理失败不影响构建结果"""
+        if not event.data.get("success"):
+            return
+        # 完成事件发出时构建线程还持有任务目录，等它释放；之后若已开始新的构建，状态不再是 success
+        task_dir_locks.acquire(event.task_id)
+        try:
+            task = self.tasks_db.get(event.task_id)
+            if task is None or task.status != "success":
+                # 任务已被删除或重新开始构建
+                return
+            before, after = prune_workspace(TASKS_DIR / event.task_id, stop=self.stop_event)
+            print(
+                f"[Workspace] 任务 {event.task_id} 清理工作目录（{WORKSPACE_PRUNE_MODE}）: "
+                f"{before / 1024 / 1024:.1f} MB -> {after / 1024 / 1024:.1f} MB"
+            )
+        except Exception as e:
+            print(f"[Workspace] 任务 {event.task_id} 清理工作目录失败: {e}")
+        finally:
+            task_dir_locks.release(event.task_id)
+
     def start_build(self, task_id: str):
         """
         添加任务到构建队列
@@ -791,13 +992,33 @@ class BuildTaskRunner:
             task.message = f"排队中（前方有 {queue_size} 个任务）"
         else:
             task.message = "准备开始构建..."
-        self._notify_state_change(force=True)
+        self._notify_state_change(task_id, force=True)
         
         # 添加到队列
         self.task_queue.put(task_id)
+        task_event_bus.publish(TaskEventType.QUEUED, task_id, task.client_id, message=task.message)
         print(f"[BuildTaskRunner] 任务 {task_id} 已加入队列，当前队列长度: {self.task_queue.qsize()}")
     
-    def _worker_loop(self):
+    def _wait_for_admission(self, task_id: str, task, worker_name: str) -> bool:
+        """等待机器资源能容纳新的构建，准入后标记为运行中；等待期间任务被取消或删除时返回 False"""
+        last_reason = ""
+        while True:
+            if task_id not in self.tasks_db or task.status not in ["pending", "processing"]:
+                return False
+            with self.queue_lock:
+                admitted, reason = self.admission.try_admit(len(self.running_tasks))
+                if admitted:
+                    self.running_tasks[task_id] = threading.current_thread()
+                    return True
+            if reason != last_reason:
+                last_reason = reason
+                print(f"[{worker_name}] 任务 {task_id} {reason}")
+                task.message = f"排队中：{reason}"
+                task.touch()
+                self._notify_state_change(task_id)
+            time.sleep(self.admission.poll_interval)
+
+    def _worker_loop(self, slot: int = 0):
         """工作线程主循环，从队列取任务并执行"""
         worker_name = threading.current_thread().name
         print(f"[{worker_name}] 工作线程已启动")
@@ -821,16 +1042,25 @@ class BuildTaskRunner:
                     self.task_queue.task_done()
                     continue
                 
-                # 标记为运行中
-                with self.queue_lock:
-                    self.running_tasks[task_id] = threading.current_thread()
+                # 资源足够时才开始构建，同时标记为运行中
+                if not self._wait_for_admission(task_id, task, worker_name):
+                    print(f"[{worker_name}] 任务 {task_id} 在等待资源时已取消，跳过")
+                    self.task_queue.task_done()
+                    continue
                 
                 print(f"[{worker_name}] 开始处理任务 {task_id}")
                 
+                # 回收 / 构建后清理正在使用任务目录时等它们释放
+                task_dir_locks.acquire(task_id)
                 try:
-                    # 执行构建
-                    self._run_build(task_id)
+                    # 等待期间任务可能已被回收删除
+                    if task_id in self.tasks_db:
+                        # 执行构建
+                        self._run_build(task_id, slot)
+                    else:
+                        print(f"[{worker_name}] 任务 {task_id} 已被删除，跳过")
                 finally:
+                    task_dir_locks.release(task_id)
                     # 移除运行标记
                     with self.queue_lock:
                         if task_id in self.running_tasks:
@@ -848,21 +1078,27 @@ class BuildTaskRunner:
             "queue_size": self.task_queue.qsize(),
             "running_count": len(self.running_tasks),
             "running_tasks": list(self.running_tasks.keys()),
-            "max_concurrent": self.MAX_CONCURRENT_BUILDS
+            "max_concurrent": self.MAX_CONCURRENT_BUILDS,
+            "admission": self.admission.metrics(),
         }
 
     def cancel_running_tasks(self, client_id: str = "") -> list[str]:
         """取消正在运行或排队的任务"""
         canceled: list[str] = []
-        for task_id, task in list(self.tasks_db.items()):
-            if client_id and task.client_id and task.client_id != client_id:
+        # 先用任务摘要筛选，只解析排队中 / 运行中的任务
+        for summary in self.tasks_db.summaries():
+            if summary.status_code not in (TaskStatus.PENDING, TaskStatus.PROCESSING):
                 continue
-            if task.status not in ["pending", "processing"]:
+            if client_id and summary.client_id and summary.client_id != client_id:
+                continue
+            task_id = summary.id
+            task = self.tasks_db.get(task_id)
+            if task is None or task.status not in ["pending", "processing"]:
                 continue
             task.status = "failed"
             task.progress = 0
             task.message = "任务已取消"
-            task.updated_at = datetime.now()
+            task.touch()
             canceled.append(task_id)
             self.canceled_tasks.add(task_id)
             try:
@@ -870,7 +1106,7 @@ class BuildTaskRunner:
             except Exception:
                 pass
         if canceled:
-            self._notify_state_change(force=True)
+            self._notify_state_change(*canceled, force=True)
         return canceled
 
     def cancel_task(self, task_id: str, client_id: str = "") -> bool:
@@ -885,19 +1121,19 @@ class BuildTaskRunner:
         task.status = "failed"
         task.progress = 0
         task.message = "任务已取消"
-        task.updated_at = datetime.now()
+        task.touch()
         self.canceled_tasks.add(task_id)
         try:
             self.builder.cancel_task(task_id)
         except Exception:
             pass
-        self._notify_state_change(force=True)
+        self._notify_state_change(task_id, force=True)
         return True
     
-    def _run_build(self, task_id: str):
-        """执行构建（在后台线程中运行）"""
+    def _run_build(self, task_id: str, slot: int = 0):
+        """执行构建（在后台线程中运行，slot 为工作线程编号）"""
         task = self.tasks_db[task_id]
-        task.logs = []  # 初始化日志列表
+        task_log_store.reset(task_id)  # 初始化日志
         
         # 调试日志：输出任务配置中的 output_format
         output_format_from_config = getattr(task.config, "output_format", "apk")
@@ -906,27 +1142,27 @@ class BuildTaskRunner:
         def on_progress(progress: int, message: str):
             task.progress = progress
             task.message = message
-            task.updated_at = datetime.now()
-            self._notify_state_change()
+            task.touch()
+            self._notify_state_change(task_id)
+            task_event_bus.publish(TaskEventType.STEP, task_id, task.client_id, progress=progress, message=message)
         
         def on_log(log_line: str):
-            """添加日志"""
-            if not hasattr(task, 'logs') or task.logs is None:
-                task.logs = []
-            task.logs.append(log_line)
-            # 只保留最近500行日志
-            if len(task.logs) > 500:
-                task.logs = task.logs[-500:]
-            self._notify_state_change()
+            """添加日志（只进内存环形缓冲区和事件总线，不触发任务持久化）"""
+            task_log_store.append(task_id, log_line)
+            task_event_bus.publish(TaskEventType.LOG, task_id, task.client_id, line=log_line)
         
         def on_complete(success: bool, message: str, output_file: Optional[str]):
             if task_id in self.canceled_tasks:
                 task.status = "failed"
                 task.progress = 0
                 task.message = "任务已取消"
-                task.updated_at = datetime.now()
+                task.touch()
                 self.canceled_tasks.discard(task_id)
-                self._notify_state_change(force=True)
+                self._notify_state_change(task_id, force=True)
+                task_event_bus.publish(
+                    TaskEventType.COMPLETED, task_id, task.client_id,
+                    success=False, canceled=True, status="failed", message=task.message,
+                )
                 return
             if success:
                 task.status = "success"
@@ -937,66 +1173,34 @@ class BuildTaskRunner:
             else:
                 task.status = "failed"
                 task.message = message
-            task.updated_at = datetime.now()
-            self._notify_state_change(force=True)
+            task.touch()
+            self._notify_state_change(task_id, force=True)
             
             # 从运行任务中移除
             if task_id in self.running_tasks:
                 del self.running_tasks[task_id]
 
-            try:
-                output_path = BACKEND_OUTPUT_DIR / output_file if output_file else None
-                _silent_upload_task_assets(task_id, task, output_path=output_path)
-            except Exception:
-                pass
-            try:
-                flush_task_assets_queue()
-            except Exception:
-                pass
-            output_info = {}
-            if output_file:
+            # 上报交给事件总线的订阅者，失败时带上错误区域的日志（没有识别到错误行时用最后 50 行）
+            last_lines = []
+            if not success:
                 try:
-                    output_path = BACKEND_OUTPUT_DIR / output_file
-                    if output_path.exists():
-                        output_info = {
-                            "name": output_path.name,
-                            "size": output_path.stat().st_size,
-                        }
+                    last_lines = task_log_store.error_region(task_id, 50) or task_log_store.tail(task_id, 50)[0]
                 except Exception:
-                    output_info = {}
-            try:
-                report_task_status(
-                    task_id,
-                    task.client_id or "",
-                    task.status,
-                    task.updated_at.isoformat(),
-                    output_info=output_info,
-                )
-            except Exception:
-                pass
-
-            if not success:
-                last_lines = []
-                if hasattr(task, "logs") and task.logs:
-                    last_lines = task.logs[-50:]
-                else:
-                    log_file = LOGS_DIR / f"{task_id}.log"
-                    if log_file.exists():
-                        try:
-                            with open(log_file, "r", encoding="utf-8") as f:
-                                all_logs = f.readlines()
-                                last_lines = [line.strip() for line in all_logs[-50:]]
-                        except Exception:
-                            last_lines = []
-                report_task_logs(task_id, task.client_id or "", "BUILD_FAILED", last_lines or [])
+                    last_lines = []
+            task_event_bus.publish(
+                TaskEventType.COMPLETED, task_id, task.client_id,
+                success=success, canceled=False, status=task.status, message=message,
+                output_file=output_file, last_lines=last_lines,
+            )
         
         try:
             # 更新任务状态
             task.status = "processing"
             task.progress = 5
             task.message = "开始构建..."
-            task.updated_at = datetime.now()
-            self._notify_state_change(force=True)
+            task.touch()
+            self._notify_state_change(task_id, force=True)
+            task_event_bus.publish(TaskEventType.STARTED, task_id, task.client_id)
             
             # 准备构建环境
             env, task_output_dir = self.builder.prepare_build(
@@ -1019,6 +1223,7 @@ class BuildTaskRunner:
                 key_password=task.config.key_password,
                 reuse_keystore_from=task.reuse_keystore_from
             )
+            env = self.builder.isolate_worker_caches(env, slot)
             
             # 运行Docker构建
             self.builder.run_build(
@@ -1039,10 +1244,14 @@ class BuildTaskRunner:
 task_runner: Optional[BuildTaskRunner] = None
 
 
-def init_task_runner(tasks_db: dict, on_state_change: Optional[Callable[[bool], None]] = None):
+def init_task_runner(
+    tasks_db: dict,
+    on_state_change: Optional[Callable[[bool, Set[str]], None]] = None,
+    stop_event: Optional[threading.Event] = None,
+):
     """初始化任务运行器"""
     global task_runner
-    task_runner = BuildTaskRunner(tasks_db, on_state_change=on_state_change)
+    task_runner = BuildTaskRunner(tasks_db, on_state_change=on_state_change, stop_event=stop_event)
     return task_runner
 
 
@@ -0,0 +1,134 @@
+"""
+任务事件总线
+构建线程和请求处理只负责发布事件，订阅者（实时推送、管理后台上报等）在各自的线程中处理：
+- 每个订阅者有独立的有界队列和分发线程，慢订阅者（如网络上传）不会拖慢构建
+- 队列满时丢弃该订阅者的新事件并计数，发布方永不阻塞
+"""
+import queue
+import threading
+import time
+from enum import Enum
+from typing import Callable, Dict, Iterable, Optional
+
+
+class TaskEventType(str, Enum):
+    CREATED = "created"  # 任务已创建
+    QUEUED = "queued"  # 已加入构建队列
+    STARTED = "started"  # 工作线程开始构建
+    STEP = "step"  # 构建进度变化
+    LOG = "log"  # 新的日志行
+    COMPLETED = "completed"  # 构建结束（成功/失败/取消）
+
+
+class TaskEvent:
+    __slots__ = ("type", "task_id", "client_id", "data", "timestamp")
+
+    def __init__(self, type: TaskEventType, task_id: str, client_id: str = "", data: Optional[dict] = None):
+        self.type = type
+        self.task_id = task_id
+        self.client_id = client_id or ""
+        self.data = data or {}
+        self.timestamp = time.time()
+
+
+class _Subscription:
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[TaskEvent], None],
+        types: Optional[frozenset],
+        queue_size: int,
+        on_drop: Optional[Callable[[TaskEvent], None]] = None,
+    ):
+        self.name = name
+        self.handler = handler
+        self.on_drop = on_drop
+        self.types = types
+        self.queue: "queue.Queue[Optional[TaskEvent]]" = queue.Queue(maxsize=queue_size)
+        self.thread: Optional[threading.Thread] = None
+        self.dropped = 0
+
+
+class TaskEventBus:
+    def __init__(self, queue_size: int = 10000):
+        self.queue_size = queue_size
+        self._subscriptions: Dict[str, _Subscription] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(
+        self,
+        name: str,
+        handler: Callable[[TaskEvent], None],
+        types: Optional[Iterable[TaskEventType]] = None,
+        queue_size: Optional[int] = None,
+        on_drop: Optional[Callable[[TaskEvent], None]] = None,
+    ) -> None:
+        """
+        注册订阅者；types 为空时接收全部事件。同名订阅者会替换旧的。
+        on_drop 在队列已满、事件被丢弃时于发布方线程中调用（需要很快返回）
+        """
+        subscription = _Subscription(
+            name,
+            handler,
+            frozenset(types) if types else None,
+            queue_size or self.queue_size,
+            on_drop,
+        )
+        subscription.thread = threading.Thread(
+            target=self._dispatch,
+            args=(subscription,),
+            daemon=True,
+            name=f"TaskEvents-{name}",
+        )
+        with self._lock:
+            previous = self._subscriptions.get(name)
+            self._subscriptions[name] = subscription
+        if previous is not None:
+            self._stop(previous, timeout=0)
+        subscription.thread.start()
+
+    def publish(self, type: TaskEventType, task_id: str, client_id: str = "", **data) -> None:
+        event = TaskEvent(type, task_id, client_id, data)
+        with self._lock:
+            subscriptions = list(self._subscriptions.values())
+        for subscription in subscriptions:
+            if subscription.types is not None and type not in subscription.types:
+                continue
+            try:
+                subscription.queue.put_nowait(event)
+            except queue.Full:
+                if subscription.dropped == 0:
+                    print(f"[TaskEvents] 订阅者 {subscription.name} 处理过慢，开始丢弃事件")
+                subscription.dropped += 1
+                if subscription.on_drop is not None:
+                    try:
+                        subscription.on_drop(event)
+                    except Exception:
+                        pass
+
+    def close(self, timeout: float = 10.0) -> None:
+        """停止所有订阅者，等待已排队的事件处理完（最多 timeout 秒）"""
+        with self._lock:
+            subscriptions = list(self._subscriptions.values())
+            self._subscriptions.clear()
+        deadline = time.monotonic() + timeout
+        for subscription in subscriptions:
+            self._stop(subscription, timeout=max(0.0, deadline - time.monotonic()))
+
+    def _stop(self, subscription: _Subscription, timeout: float) -> None:
+        try:
+            subscription.queue.put(None, timeout=max(timeout, 0.1))
+        except queue.Full:
+            return
+        if subscription.thread and timeout > 0:
+            subscription.thread.join(timeout=timeout)
+
+    def _dispatch(self, subscription: _Subscription) -> None:
+        while True:
+            event = subscription.queue.get()
+            if event is None:
+                return
+            try:
+                subscription.handler(event)
+            except Exception as exc:
+                print(f"[TaskEvents] 订阅者 {subscription.name} 处理 {event.type.value} 事件失败: {exc}")
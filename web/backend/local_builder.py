@@ -3,6 +3,7 @@ import hashlib
 import os
 import shutil
 import subprocess
+import threading
 import zipfile
 import re
 import sys
@@ -10,6 +11,8 @@ from pathlib import Path
 from typing import Callable, Dict, Optional, Tuple
 
 import env_setup
+from build_output import gradle_log_args
+from build_steps import format_step_start
 
 
 def _log(on_log: Optional[Callable[[str], None]], message: str) -> None:
@@ -17,8 +20,21 @@ def _log(on_log: Optional[Callable[[str], None]], message: str) -> None:
         on_log(message)
 
 
-def _run_cmd(cmd, cwd=None, env=None, on_log=None) -> None:
-    _log(on_log, f"$ {' '.join(cmd)}")
+def _tool_name(executable: str) -> Optional[str]:
+    name = Path(executable).stem.lower()
+    if name == "gradlew":
+        return "gradle"
+    if name in ("npm", "npx"):
+        return "npm"
+    return None
+
+
+def _run_cmd(cmd, cwd=None, env=None, on_log=None, on_output=None) -> None:
+    """运行命令；on_output(line, tool) 接收每一行原始输出（包括命令行本身），返回 False 时这里不再写入构建日志"""
+    header = f"$ {' '.join(cmd)}"
+    tool = _tool_name(cmd[0])
+    if on_output is None or on_output(header, None):
+        _log(on_log, header)
     process = subprocess.Popen(
         cmd,
         cwd=cwd,
@@ -31,7 +47,9 @@ def _run_cmd(cmd, cwd=None, env=None, on_log=None) -> None:
     )
     if process.stdout:
         for line in process.stdout:
-            _log(on_log, line.rstrip())
+            line = line.rstrip()
+            if on_output is None or on_output(line, tool):
+                _log(on_log, line)
     return_code = process.wait()
     if return_code != 0:
         raise RuntimeError(f"command failed: {cmd[0]} (exit {return_code})")
@@ -56,7 +74,7 @@ def _resolve_node_tool(env: Dict[str, str], tool: str) -> str:
     return tool
 
 
-def _ensure_dep(pkg: Dict, env: Dict[str, str], name: str, dev: bool, on_log=None) -> None:
+def _ensure_dep(pkg: Dict, env: Dict[str, str], name: str, dev: bool, on_log=None, on_output=None) -> None:
     if _has_dep(pkg, name):
         return
     npm_cmd = _resolve_node_tool(env, "npm")
@@ -65,7 +83,7 @@ def _ensure_dep(pkg: Dict, env: Dict[str, str], name: str, dev: bool, on_log=Non
         install_cmd.append("-D")
     install_cmd.append(name)
     install_cmd.append("--legacy-peer-deps")
-    _run_cmd(install_cmd, cwd=pkg["_root"], env=env, on_log=on_log)
+    _run_cmd(install_cmd, cwd=pkg["_root"], env=env, on_log=on_log, on_output=on_output)
 
 def _hash_file(path: Path) -> str:
     digest = hashlib.sha256()
@@ -145,7 +163,16 @@ def _resolve_assets_bin(cache_root: Path) -> Optional[Path]:
         return fallback
     return None
 
-def _ensure_assets_cache(env: Dict[str, str], on_log=None) -> Optional[Tuple[Path, Path]]:
+# @capacitor/assets 的全局安装目录在并发构建之间共享，同一时间只允许一个 npm install
+_assets_cache_lock = threading.Lock()
+
+
+def _ensure_assets_cache(env: Dict[str, str], on_log=None, on_output=None) -> Optional[Tuple[Path, Path]]:
+    with _assets_cache_lock:
+        return _ensure_assets_cache_locked(env, on_log=on_log, on_output=on_output)
+
+
+def _ensure_assets_cache_locked(env: Dict[str, str], on_log=None, on_output=None) -> Optional[Tuple[Path, Path]]:
     cache_root = _assets_cache_root()
     cache_root.mkdir(parents=True, exist_ok=True)
     package_json = cache_root / "package.json"
@@ -158,22 +185,22 @@ def _ensure_assets_cache(env: Dict[str, str], on_log=None) -> Optional[Tuple[Pat
     if assets_bin:
         return assets_bin, cache_root
     npm_cmd = _resolve_node_tool(env, "npm")
-    _run_cmd([npm_cmd, "install", "-D", "@capacitor/assets", "--legacy-peer-deps"], cwd=cache_root, env=env, on_log=on_log)
+    _run_cmd([npm_cmd, "install", "-D", "@capacitor/assets", "--legacy-peer-deps"], cwd=cache_root, env=env, on_log=on_log, on_output=on_output)
     assets_bin = _resolve_assets_bin(cache_root)
     if assets_bin:
         return assets_bin, cache_root
     return None
 
-def _run_assets_generate(project_root: Path, env: Dict[str, str], npx_cmd: str, on_log=None) -> None:
-    cached = _ensure_assets_cache(env, on_log=on_log)
+def _run_assets_generate(project_root: Path, env: Dict[str, str], npx_cmd: str, on_log=None, on_output=None) -> None:
+    cached = _ensure_assets_cache(env, on_log=on_log, on_output=on_output)
     if cached:
         assets_bin, cache_root = cached
         assets_env = env.copy()
         assets_env["NODE_PATH"] = str(cache_root / "node_modules")
         assets_env["PATH"] = f"{assets_bin.parent}{os.pathsep}{assets_env.get('PATH', '')}"
-        _run_cmd([str(assets_bin), "generate", "--android"], cwd=project_root, env=assets_env, on_log=on_log)
+        _run_cmd([str(assets_bin), "generate", "--android"], cwd=project_root, env=assets_env, on_log=on_log, on_output=on_output)
         return
-    _run_cmd([npx_cmd, "@capacitor/assets", "generate", "--android"], cwd=project_root, env=env, on_log=on_log)
+    _run_cmd([npx_cmd, "@capacitor/assets", "generate", "--android"], cwd=project_root, env=env, on_log=on_log, on_output=on_output)
 
 
 def _find_android_home() -> Path:
@@ -673,7 +700,8 @@ def run_local_build(
     env: Dict[str, str],
     task_output_dir: Path,
     on_progress: Optional[Callable[[int, str], None]] = None,
-    on_log: Optional[Callable[[str], None]] = None
+    on_log: Optional[Callable[[str], None]] = None,
+    on_output: Optional[Callable[[str, Optional[str]], bool]] = None,
 ) -> Dict[str, str]:
     task_input_dir = Path(env["TASK_INPUT_DIR"])
     task_keystore_dir = Path(env["TASK_KEYSTORE_DIR"])
@@ -689,6 +717,12 @@ def run_local_build(
         if on_progress:
             on_progress(value, message)
 
+    def step(step_id: int, value: int, message: str) -> None:
+        # 先输出机器可读的步骤标记（见 build_steps），再上报进度和可读的步骤说明
+        _log(on_log, format_step_start(step_id))
+        progress(value, message)
+        _log(on_log, message)
+
     process_env = os.environ.copy()
     process_env.update(env)
     process_env.update(env_setup.get_npm_config())
@@ -714,15 +748,13 @@ def run_local_build(
     npm_cmd = _resolve_node_tool(process_env, "npm")
     npx_cmd = _resolve_node_tool(process_env, "npx")
 
-    progress(10, "Step 0: 准备工作...")
-    _log(on_log, "Step 0: 准备工作...")
+    step(0, 10, "Step 0: 准备工作...")
 
     task_mode = (env.get("TASK_MODE") or "convert").strip().lower()
     is_web_task = task_mode == "web"
 
     if is_web_task:
-        progress(25, "Step 1: 准备 Web 模板...")
-        _log(on_log, "Step 1: 准备 Web 模板...")
+        step(1, 25, "Step 1: 准备 Web 模板...")
 
         template_dir = _resolve_templates_root() / "Tubbim"
         if not template_dir.exists():
@@ -824,12 +856,11 @@ def run_local_build(
         pkg = _read_package_json(package_json)
         pkg["_root"] = project_root
 
-        progress(25, "Step 1: 构建 Web 前端...")
-        _log(on_log, "Step 1: 构建 Web 前端...")
+        step(1, 25, "Step 1: 构建 Web 前端...")
         if not _should_skip_npm_install(project_root, on_log=on_log):
-            _run_cmd([npm_cmd, "install", "--legacy-peer-deps"], cwd=project_root, env=process_env, on_log=on_log)
+            _run_cmd([npm_cmd, "install", "--legacy-peer-deps"], cwd=project_root, env=process_env, on_log=on_log, on_output=on_output)
             _mark_npm_install(project_root)
-        _run_cmd([npm_cmd, "run", "build"], cwd=project_root, env=process_env, on_log=on_log)
+        _run_cmd([npm_cmd, "run", "build"], cwd=project_root, env=process_env, on_log=on_log, on_output=on_output)
 
         web_dir = project_root / "dist"
         if not web_dir.exists():
@@ -837,10 +868,9 @@ def run_local_build(
         if not web_dir.exists():
             raise RuntimeError("????????? dist/build")
 
-        progress(35, "Step 2: 准备 Capacitor...")
-        _log(on_log, "Step 2: 准备 Capacitor...")
-        _ensure_dep(pkg, process_env, "@capacitor/core", dev=False, on_log=on_log)
-        _ensure_dep(pkg, process_env, "@capacitor/cli", dev=True, on_log=on_log)
+        step(2, 35, "Step 2: 准备 Capacitor...")
+        _ensure_dep(pkg, process_env, "@capacitor/core", dev=False, on_log=on_log, on_output=on_output)
+        _ensure_dep(pkg, process_env, "@capacitor/cli", dev=True, on_log=on_log, on_output=on_output)
 
         config_text = (
             "import type { CapacitorConfig } from '@capacitor/cli';\n\n"
@@ -854,24 +884,21 @@ def run_local_build(
         )
         (project_root / "capacitor.config.ts").write_text(config_text, encoding="utf-8")
 
-        progress(45, "Step 3: 生成 Android 工程...")
-        _log(on_log, "Step 3: 生成 Android 工程...")
-        _ensure_dep(pkg, process_env, "@capacitor/android", dev=False, on_log=on_log)
+        step(3, 45, "Step 3: 生成 Android 工程...")
+        _ensure_dep(pkg, process_env, "@capacitor/android", dev=False, on_log=on_log, on_output=on_output)
         if not (project_root / "android").exists():
-            _run_cmd([npx_cmd, "cap", "add", "android"], cwd=project_root, env=process_env, on_log=on_log)
+            _run_cmd([npx_cmd, "cap", "add", "android"], cwd=project_root, env=process_env, on_log=on_log, on_output=on_output)
 
-        progress(55, "Step 4: 生成应用图标...")
-        _log(on_log, "Step 4: 生成应用图标...")
+        step(4, 55, "Step 4: 生成应用图标...")
         assets_dir = project_root / "assets"
         assets_dir.mkdir(parents=True, exist_ok=True)
         logo = task_input_dir / "logo.png"
         if logo.exists():
             shutil.copy2(logo, assets_dir / "logo.png")
-            _run_assets_generate(project_root, process_env, npx_cmd, on_log=on_log)
+            _run_assets_generate(project_root, process_env, npx_cmd, on_log=on_log, on_output=on_output)
 
-        progress(60, "Step 5: 同步 Android 配置...")
-        _log(on_log, "Step 5: 同步 Android 配置...")
-        _run_cmd([npx_cmd, "cap", "sync", "android"], cwd=project_root, env=process_env, on_log=on_log)
+        step(5, 60, "Step 5: 同步 Android 配置...")
+        _run_cmd([npx_cmd, "cap", "sync", "android"], cwd=project_root, env=process_env, on_log=on_log, on_output=on_output)
 
     android_project_root = project_root if is_web_task else project_root / "android"
     android_app_dir = android_project_root / "app"
@@ -899,8 +926,7 @@ def run_local_build(
         if main_candidates:
             _patch_capacitor_main_activity(main_candidates[0], package_name, on_log=on_log)
 
-    progress(65, "Step 6: 配置 Android 项目...")
-    _log(on_log, "Step 6: 配置 Android 项目...")
+    step(6, 65, "Step 6: 配置 Android 项目...")
     android_home = _find_android_home()
     process_env["ANDROID_HOME"] = str(android_home)
     process_env["ANDROID_SDK_ROOT"] = str(android_home)
@@ -915,8 +941,7 @@ def run_local_build(
             gradle_text = gradle_text.replace("versionCode 1", f"versionCode {env.get('VERSION_CODE', '1')}")
             gradle_file.write_text(gradle_text, encoding="utf-8")
 
-    progress(70, "Step 7: 构建 Release 产物...")
-    _log(on_log, "Step 7: 构建 Release 产物...")
+    step(7, 70, "Step 7: 构建 Release 产物...")
     gradlew = android_project_root / ("gradlew.bat" if os.name == "nt" else "gradlew")
     if not gradlew.exists():
         raise RuntimeError("未找到 gradlew")
@@ -924,13 +949,13 @@ def run_local_build(
     _ensure_gradle_properties(android_project_root, on_log=on_log)
     gradle_cmd = [str(gradlew)]
     gradle_cmd.append("bundleRelease" if output_format == "aab" else "assembleRelease")
-    gradle_cmd.extend(["--stacktrace", "--info", "--build-cache"])
+    gradle_cmd.extend(["--stacktrace", "--build-cache"])
+    gradle_cmd.extend(gradle_log_args(env.get("BUILD_LOG_LEVEL", "info")))
     init_script = _write_gradle_init(task_dir, on_log=on_log)
     gradle_cmd.extend(["--init-script", str(init_script)])
-    _run_cmd(gradle_cmd, cwd=gradlew.parent, env=process_env, on_log=on_log)
+    _run_cmd(gradle_cmd, cwd=gradlew.parent, env=process_env, on_log=on_log, on_output=on_output)
 
-    progress(80, "Step 8: 准备签名密钥...")
-    _log(on_log, "Step 8: 准备签名密钥...")
+    step(8, 80, "Step 8: 准备签名密钥...")
     keystore_file = task_keystore_dir / "release.keystore"
     keystore_reused = env.get("KEYSTORE_REUSED", "false").lower() == "true"
 
@@ -955,10 +980,9 @@ def run_local_build(
                 "-storepass", env.get("KEYSTORE_PASSWORD", "android"),
                 "-keypass", env.get("KEY_PASSWORD", "android"),
                 "-dname", "CN=APK Builder, OU=Dev, O=Company, L=City, ST=State, C=CN"
-            ], env=process_env, on_log=on_log)
+            ], env=process_env, on_log=on_log, on_output=on_output)
 
-    progress(90, "Step 9: 处理构建产物...")
-    _log(on_log, "Step 9: 处理构建产物...")
+    step(9, 90, "Step 9: 处理构建产物...")
 
     if output_format == "aab":
         bundle_dir = android_app_dir / "build" / "outputs" / "bundle" / "release"
@@ -980,7 +1004,7 @@ def run_local_build(
             "-signedjar", str(signed_aab),
             str(unsigned_aab),
             env.get("KEY_ALIAS", "key0")
-        ], env=process_env, on_log=on_log)
+        ], env=process_env, on_log=on_log, on_output=on_output)
         output_file = signed_aab
     else:
         apk_dir = android_app_dir / "build" / "outputs" / "apk" / "release"
@@ -994,7 +1018,7 @@ def run_local_build(
         zipalign = _find_build_tool(android_home, "zipalign.exe" if os.name == "nt" else "zipalign")
         apksigner = _find_build_tool(android_home, "apksigner.bat" if os.name == "nt" else "apksigner")
 
-        _run_cmd([str(zipalign), "-p", "-f", "4", str(unsigned_apk), str(aligned_apk)], env=process_env, on_log=on_log)
+        _run_cmd([str(zipalign), "-p", "-f", "4", str(unsigned_apk), str(aligned_apk)], env=process_env, on_log=on_log, on_output=on_output)
         _run_cmd([
             str(apksigner),
             "sign",
@@ -1004,11 +1028,10 @@ def run_local_build(
             "--key-pass", f"pass:{env.get('KEY_PASSWORD', 'android')}",
             "--out", str(signed_apk),
             str(aligned_apk)
-        ], env=process_env, on_log=on_log)
+        ], env=process_env, on_log=on_log, on_output=on_output)
         output_file = signed_apk
 
-    progress(100, "Step 10: 构建完成")
-    _log(on_log, "Step 10: 构建完成")
+    step(10, 100, "Step 10: 构建完成")
 
     return {
         "output_file": str(output_file),
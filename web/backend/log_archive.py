@@ -0,0 +1,151 @@
+"""
+已结束任务的日志压缩归档
+- 日志按 chunk_size 字节（按行对齐）分块，每块压缩为独立的 gzip member（或 zstd frame），
+  整个文件仍是标准的多 member gzip，可以直接用 gzip -d / zcat 查看
+- 旁路索引 <id>.log.idx 记录每块的原始偏移和压缩偏移，读取任意字节范围或末尾若干行时只解压相关的块
+- 索引里的偏移都是原始日志的字节偏移，按偏移量增量读取日志的接口不受归档影响
+"""
+import gzip
+import json
+import os
+import zlib
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖
+    zstandard = None
+
+ARCHIVE_SUFFIXES = {"gzip": ".log.gz", "zstd": ".log.zst"}
+
+
+def select_codec(name: str) -> Optional[str]:
+    """APK_BUILDER_LOG_COMPRESSION：gzip（默认）/ zstd（未安装 zstandard 时退回 gzip）/ off"""
+    name = (name or "gzip").strip().lower()
+    if name in ("off", "none", "0", "false"):
+        return None
+    if name == "zstd" and zstandard is not None:
+        return "zstd"
+    return "gzip"
+
+
+def _compress(codec: str, data: bytes) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=6).compress(data)
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+def _decompress(codec: str, data: bytes) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data, 31)
+
+
+class LogArchive:
+    """已归档日志的只读视图"""
+
+    def __init__(self, path: Path, index: dict):
+        self.path = Path(path)
+        self.codec = index["codec"]
+        self.size = index["size"]
+        self.compressed = index["compressed"]
+        self.lines = index["lines"]
+        # [(原始偏移, 压缩偏移, 压缩长度)]，按原始偏移升序
+        self.members: List[Tuple[int, int, int]] = [tuple(member) for member in index["members"]]
+        self._cached: Tuple[int, bytes] = (-1, b"")
+
+    @classmethod
+    def open(cls, index_path: Path) -> Optional["LogArchive"]:
+        try:
+            index = json.loads(Path(index_path).read_text(encoding="utf-8"))
+            path = Path(index_path).with_name(index["file"])
+            return cls(path, index) if path.exists() else None
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _member(self, pos: int) -> bytes:
+        if self._cached[0] == pos:
+            return self._cached[1]
+        _, offset, length = self.members[pos]
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            data = _decompress(self.codec, f.read(length))
+        # 从末尾向前读取时会连续访问同一块，缓存最近解压的一块
+        self._cached = (pos, data)
+        return data
+
+    def read(self, start: int, end: int) -> bytes:
+        """返回原始日志 [start, end) 范围的字节"""
+        start = max(0, start)
+        end = min(end, self.size)
+        parts = []
+        for pos, (member_start, _, _) in enumerate(self.members):
+            member_end = self.members[pos + 1][0] if pos + 1 < len(self.members) else self.size
+            if member_end <= start:
+                continue
+            if member_start >= end:
+                break
+            data = self._member(pos)
+            parts.append(data[max(0, start - member_start):end - member_start])
+        return b"".join(parts)
+
+
+def archive_log(
+    log_path: Path,
+    archive_path: Path,
+    index_path: Path,
+    codec: str,
+    chunk_size: int = 256 * 1024,
+) -> dict:
+    """压缩日志文件并写入索引（先写临时文件再改名，索引存在即表示归档完整），返回大小统计"""
+    members = []
+    lines = 0
+    raw_offset = 0
+    compressed_offset = 0
+    tmp_archive = archive_path.with_name(archive_path.name + ".tmp")
+    with open(log_path, "rb") as src, open(tmp_archive, "wb") as dst:
+        pending = b""
+        while True:
+            block = src.read(chunk_size)
+            data = pending + block
+            if not data:
+                break
+            # 按行对齐：块末尾不完整的行留到下一块（文件末尾除外）
+            cut = data.rfind(b"\n") + 1 if block else len(data)
+            if cut == 0:
+                cut = len(data) if len(data) >= chunk_size or not block else 0
+            if cut == 0:
+                pending = data
+                continue
+            chunk, pending = data[:cut], data[cut:]
+            member = _compress(codec, chunk)
+            dst.write(member)
+            members.append((raw_offset, compressed_offset, len(member)))
+            lines += chunk.count(b"\n")
+            raw_offset += len(chunk)
+            compressed_offset += len(member)
+            if not block:
+                break
+    index = {
+        "file": archive_path.name,
+        "codec": codec,
+        "size": raw_offset,
+        "compressed": compressed_offset,
+        "lines": lines,
+        "members": members,
+    }
+    tmp_index = index_path.with_name(index_path.name + ".tmp")
+    tmp_index.write_text(json.dumps(index, separators=(",", ":")), encoding="utf-8")
+    os.replace(tmp_archive, archive_path)
+    os.replace(tmp_index, index_path)
+    return {"size": raw_offset, "compressed": compressed_offset}
+
+
+def restore_log(archive: LogArchive, log_path: Path) -> None:
+    """把归档解压回普通日志文件（重新构建时继续追加）"""
+    tmp_path = log_path.with_name(log_path.name + ".tmp")
+    with open(tmp_path, "wb") as dst:
+        for pos in range(len(archive.members)):
+            dst.write(archive._member(pos))
+    os.replace(tmp_path, log_path)
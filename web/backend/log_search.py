@@ -0,0 +1,224 @@
+"""
+跨任务日志搜索
+构建结束后由后台线程把日志逐行写入 SQLite FTS5 全文索引（按任务 / 步骤 / 字节偏移），
+排查反复出现的构建失败时不再需要手动 grep logs/*.log：
+- 增量索引：每个任务只在构建结束后（重新）索引一次，已索引的任务记录日志大小，启动时只补齐缺失的任务
+- SQLite 未编译 FTS5 时退回普通表 + LIKE 查询（结果相同，只是更慢）
+- 索引只在后台线程中写入，查询线程各自使用独立的连接（WAL 模式下读写互不阻塞）
+"""
+import queue
+import re
+import sqlite3
+import threading
+import time
+from bisect import bisect_right
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional
+
+from task_logs import TaskLogStore
+
+# 单行最多索引的字符数（超长的堆栈 / 依赖列表只保留开头）
+MAX_LINE_CHARS = 1000
+_BATCH_SIZE = 5000
+
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS log_lines USING fts5(
+    text,
+    task_id UNINDEXED,
+    client_id UNINDEXED,
+    step UNINDEXED,
+    offset UNINDEXED,
+    tokenize = 'unicode61'
+);
+"""
+
+_PLAIN_SCHEMA = """
+CREATE TABLE IF NOT EXISTS log_lines (
+    text TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    client_id TEXT NOT NULL,
+    step INTEGER,
+    offset INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_log_lines_task ON log_lines (task_id);
+"""
+
+_META_SCHEMA = """
+CREATE TABLE IF NOT EXISTS indexed_tasks (
+    task_id TEXT PRIMARY KEY,
+    log_size INTEGER NOT NULL,
+    lines INTEGER NOT NULL,
+    indexed_at REAL NOT NULL
+);
+"""
+
+
+def _fts_query(text: str) -> str:
+    """把用户输入转为 FTS5 查询：每个词作为短语（转义引号），多个词之间为 AND"""
+    terms = [term.replace('"', '""') for term in text.split()]
+    return " ".join(f'"{term}"' for term in terms)
+
+
+class LogSearchIndex:
+    def __init__(self, db_path: Path, log_store: TaskLogStore):
+        self.db_path = Path(db_path)
+        self.log_store = log_store
+        self.fts5: Optional[bool] = None
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._local = threading.local()
+        self.stats = {"indexed_tasks": 0, "indexed_lines": 0, "last_index_ms": 0.0}
+
+    # ---- 连接 ----
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if self.fts5 is None:
+                self.fts5 = self._create_schema(conn)
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self, conn: sqlite3.Connection) -> bool:
+        conn.executescript(_META_SCHEMA)
+        existing = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'log_lines'").fetchone()
+        if existing:
+            return "fts5" in (existing[0] or "").lower()
+        try:
+            conn.executescript(_FTS_SCHEMA)
+            return True
+        except sqlite3.OperationalError:
+            print("[LogSearch] SQLite 不支持 FTS5，使用普通表 + LIKE 查询")
+            conn.executescript(_PLAIN_SCHEMA)
+            return False
+
+    # ---- 后台索引 ----
+
+    def start(self, finished_task_ids: Callable[[], Iterable[tuple]]) -> None:
+        """启动索引线程；finished_task_ids 返回已结束任务的 (task_id, client_id)，用于补齐尚未索引的任务"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, args=(finished_task_ids,), daemon=True, name="LogSearch")
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout=timeout)
+        self._thread = None
+
+    def enqueue(self, task_id: str, client_id: str) -> None:
+        """任务构建结束后（重新）索引它的日志"""
+        self._queue.put(("index", task_id, client_id or ""))
+
+    def forget(self, task_id: str) -> None:
+        self._queue.put(("delete", task_id, ""))
+
+    def _run(self, finished_task_ids: Callable[[], Iterable[tuple]]) -> None:
+        try:
+            conn = self._connect()
+            indexed = {task_id for (task_id,) in conn.execute("SELECT task_id FROM indexed_tasks")}
+            for task_id, client_id in finished_task_ids():
+                if task_id not in indexed:
+                    self._queue.put(("index", task_id, client_id or ""))
+        except Exception as exc:
+            print(f"[LogSearch] 初始化索引失败: {exc}")
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            action, task_id, client_id = item
+            try:
+                if action == "index":
+                    self._index_task(task_id, client_id)
+                else:
+                    self._delete_task(self._connect(), task_id)
+            except Exception as exc:
+                print(f"[LogSearch] 索引任务 {task_id} 的日志失败: {exc}")
+
+    def _delete_task(self, conn: sqlite3.Connection, task_id: str) -> None:
+        conn.execute("DELETE FROM log_lines WHERE task_id = ?", (task_id,))
+        conn.execute("DELETE FROM indexed_tasks WHERE task_id = ?", (task_id,))
+
+    def _index_task(self, task_id: str, client_id: str) -> None:
+        started = time.perf_counter()
+        conn = self._connect()
+        sections = self.log_store.step_sections(task_id)
+        starts = [section["start"] for section in sections]
+        steps = [section["step"] for section in sections]
+        count = 0
+        conn.execute("BEGIN")
+        try:
+            self._delete_task(conn, task_id)
+            batch: List[tuple] = []
+            for offset, line in self.log_store.iter_lines(task_id):
+                text = line.strip()
+                if not text:
+                    continue
+                pos = bisect_right(starts, offset) - 1
+                step = steps[pos] if pos >= 0 else None
+                batch.append((text[:MAX_LINE_CHARS], task_id, client_id, step, offset))
+                if len(batch) >= _BATCH_SIZE:
+                    conn.executemany(
+                        "INSERT INTO log_lines (text, task_id, client_id, step, offset) VALUES (?, ?, ?, ?, ?)", batch
+                    )
+                    count += len(batch)
+                    batch.clear()
+            if batch:
+                conn.executemany(
+                    "INSERT INTO log_lines (text, task_id, client_id, step, offset) VALUES (?, ?, ?, ?, ?)", batch
+                )
+                count += len(batch)
+            conn.execute(
+                "INSERT OR REPLACE INTO indexed_tasks (task_id, log_size, lines, indexed_at) VALUES (?, ?, ?, ?)",
+                (task_id, self.log_store.log_size(task_id), count, time.time()),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self.stats["indexed_tasks"] += 1
+        self.stats["indexed_lines"] += count
+        self.stats["last_index_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    # ---- 查询 ----
+
+    def search(self, query: str, client_id: str, limit: int = 200, per_task: int = 5) -> dict:
+        """
+        搜索某个客户端的任务日志，按任务分组返回匹配的行：
+        {"tasks": [{"task_id", "matches": [{"offset", "step", "line"}], "total"}], "lines": 匹配行数}
+        """
+        query = query.strip()
+        if not query:
+            return {"tasks": [], "lines": 0}
+        conn = self._connect()
+        if self.fts5:
+            rows = conn.execute(
+                "SELECT task_id, step, offset, text FROM log_lines "
+                "WHERE log_lines MATCH ? AND client_id = ? ORDER BY rank LIMIT ?",
+                (_fts_query(query), client_id or "", limit),
+            ).fetchall()
+        else:
+            pattern = "%" + re.sub(r"([%_\\])", r"\\\1", query) + "%"
+            rows = conn.execute(
+                "SELECT task_id, step, offset, text FROM log_lines "
+                "WHERE text LIKE ? ESCAPE '\\' AND client_id = ? LIMIT ?",
+                (pattern, client_id or "", limit),
+            ).fetchall()
+        tasks: dict = {}
+        for task_id, step, offset, text in rows:
+            entry = tasks.setdefault(task_id, {"task_id": task_id, "matches": [], "total": 0})
+            entry["total"] += 1
+            if len(entry["matches"]) < per_task:
+                entry["matches"].append({"offset": offset, "step": step, "line": text})
+        for entry in tasks.values():
+            entry["matches"].sort(key=lambda match: match["offset"])
+        return {"tasks": list(tasks.values()), "lines": len(rows)}
+
+    def metrics(self) -> dict:
+        return {**self.stats, "fts5": self.fts5, "queued": self._queue.qsize()}
@@ -2,13 +2,16 @@ from typing_compat import patch_typing_eval_type
 
 patch_typing_eval_type()
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, Body, Request, Form
+from fastapi import FastAPI, UploadFile, File, HTTPException, Body, Request, Response, Form
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
-from typing import List
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from typing import Iterable, List
 from datetime import datetime
 from pathlib import Path
 import uuid
+import asyncio
+import base64
 import sys
 import os
 import json
@@ -19,21 +22,23 @@ import urllib.request
 import urllib.error
 
 from models import (
-    BuildTask, BuildTaskCreate, BuildTaskResponse, 
+    BuildTask, BuildTaskCreate, BuildTaskResponse, BuildTaskSummary, TaskRecord, TaskStatus,
     BuildStatus, AppConfig, UpdateTaskRequest
 )
-from builder import init_task_runner, get_task_runner, BACKEND_OUTPUT_DIR, LOGS_DIR, TASKS_DIR, UPLOAD_DIR as BACKEND_UPLOAD_DIR
+from builder import init_task_runner, get_task_runner, task_log_store, log_search_index, task_event_stream, task_event_bus, BACKEND_OUTPUT_DIR, LOGS_DIR, TASKS_DIR, UPLOAD_DIR as BACKEND_UPLOAD_DIR
 import env_setup
 from admin_client import (
-    report_task_start,
     fetch_announcements,
     check_update,
     submit_feedback,
-    upload_task_assets,
-    flush_task_assets_queue,
     check_admin_service,
 )
 from system_info import get_system_info
+from task_store import TaskStoreWriter, create_task_store
+from event_bus import TaskEventType
+from task_events import TaskRevisionWaiters
+from task_gc import TaskGarbageCollector, task_dir_locks
+from task_codec import TaskBodyCache, dumps, encode_task_response, encode_task_summary, task_summary_dict
 
 app = FastAPI(
     title="APK转换服务",
@@ -56,7 +61,7 @@ def _require_client_id(value: str | None) -> str:
     return client_id
 
 
-def _assert_task_owner(task: BuildTask, client_id: str) -> None:
+def _assert_task_owner(task: TaskRecord, client_id: str) -> None:
     if not task.client_id or task.client_id != client_id:
         raise HTTPException(status_code=403, detail="无权操作此任务")
 
@@ -143,6 +148,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "X-Task-Revision"],
 )
 
 
@@ -181,71 +187,71 @@ async def ensure_env_ready(request: Request, call_next):
                 )
     return await call_next(request)
 
-# 内存存储（MVP版本）
-tasks_db = {}
-TASKS_STATE_PATH = TASKS_DIR / "tasks.json"
-TASKS_STATE_LOCK = threading.Lock()
+# 任务存储：内存中保存任务对象，只持久化变化的任务（首次启动时自动迁移旧的 tasks.json）
+# APK_BUILDER_TASK_STORE=sqlite（默认，按行 upsert）/ journal（追加日志 + 定期快照）
+tasks_db = create_task_store(TASKS_DIR)
+# 后台写线程：合并短时间内的多次变更，请求处理不再同步写盘
+tasks_writer = TaskStoreWriter(tasks_db)
+# 长轮询等待中的请求，任务变化时唤醒
+task_waiters = TaskRevisionWaiters()
+# 预编码的任务响应体（详情 / 列表摘要），按任务修订号失效
+task_body_cache = TaskBodyCache(encode_task_response)
+task_summary_cache = TaskBodyCache(encode_task_summary)
+
+
+def _json_body(body: bytes, headers: dict | None = None) -> Response:
+    """直接返回已编码的 JSON，不再经过 response_model 校验"""
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def persist_tasks_db(force: bool = False, task_ids: Iterable[str] | None = None, wait: bool = False) -> None:
+    task_ids = list(task_ids or ())
+    tasks_writer.mark_dirty(task_ids, urgent=force)
+    for task_id in task_ids:
+        task = tasks_db.get(task_id)
+        if task is not None:
+            task_event_stream.publish_task(task)
+    task_waiters.notify(task_ids)
+    if wait:
+        tasks_writer.flush(wait=True)
+
+
+def _remove_task(task_id: str) -> None:
+    """从任务存储中删除任务并通知客户端（不删除文件）"""
+    task = tasks_db[task_id]
+    del tasks_db[task_id]
+    task_log_store.discard(task_id)
+    task_event_stream.publish_deleted(task)
+    task_waiters.notify([task_id])
+    task_body_cache.discard(task_id)
+    task_summary_cache.discard(task_id)
+    task_gc.forget(task_id)
+    log_search_index.forget(task_id)
+    try:
+        persist_tasks_db(force=True, wait=True)
+    except Exception:
+        pass
 
 
-def _task_to_dict(task: BuildTask) -> dict:
-    data = task.model_dump()
-    status = task.status
-    data["status"] = status.value if hasattr(status, "value") else str(status)
-    data["created_at"] = task.created_at.isoformat()
-    data["updated_at"] = task.updated_at.isoformat()
-    return data
+# 后台回收过期任务和超出磁盘配额的工作目录（APK_BUILDER_GC_*）
+task_gc = TaskGarbageCollector(tasks_db, TASKS_DIR, BACKEND_OUTPUT_DIR, LOGS_DIR, remove_task=_remove_task)
 
 
-def _task_from_dict(data: dict) -> BuildTask | None:
+def _verify_task_dirs() -> None:
     try:
-        status = data.get("status")
-        if status:
-            try:
-                data["status"] = BuildStatus(status)
-            except Exception:
-                data["status"] = BuildStatus.PENDING
-        if data.get("created_at"):
-            data["created_at"] = datetime.fromisoformat(data["created_at"])
-        if data.get("updated_at"):
-            data["updated_at"] = datetime.fromisoformat(data["updated_at"])
-        task = BuildTask(**data)
-        if task.status == BuildStatus.PROCESSING:
-            task.status = BuildStatus.PENDING
-            task.message = "上次运行中断，等待重新开始"
-            task.updated_at = datetime.now()
-        return task
-    except Exception:
-        return None
-
-
-def persist_tasks_db(force: bool = False) -> None:
-    TASKS_STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
-    with TASKS_STATE_LOCK:
-        payload = [_task_to_dict(task) for task in tasks_db.values()]
-        tmp_path = TASKS_STATE_PATH.with_suffix(".json.tmp")
-        tmp_path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
-        tmp_path.replace(TASKS_STATE_PATH)
+        tasks_db.verify_tasks(lambda task_id: (TASKS_DIR / task_id).exists())
+    except Exception as exc:
+        print(f"[TaskStore] 校验任务目录失败: {exc}")
 
 
 def load_tasks_db() -> None:
-    if not TASKS_STATE_PATH.exists():
-        return
+    """启动时只加载任务索引；任务目录是否存在在后台线程中校验，不阻塞端口监听"""
     try:
-        data = json.loads(TASKS_STATE_PATH.read_text(encoding="utf-8"))
-    except Exception:
+        tasks_db.load()
+    except Exception as exc:
+        print(f"[TaskStore] 加载任务失败: {exc}")
         return
-    if not isinstance(data, list):
-        return
-    for item in data:
-        if not isinstance(item, dict):
-            continue
-        task = _task_from_dict(item)
-        if not task:
-            continue
-        task_dir = TASKS_DIR / task.id
-        if not task_dir.exists():
-            continue
-        tasks_db[task.id] = task
+    threading.Thread(target=_verify_task_dirs, daemon=True, name="TaskVerify").start()
 
 # 上传/输出目录（支持通过环境变量 APK_BUILDER_DATA_DIR 迁移到数据卷）
 BACKEND_UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
@@ -401,7 +407,8 @@ async def create_task(task_data: BuildTaskCreate):
             dst_keystore = task_keystore_dir / "release.keystore"
             shutil.copy2(str(src_keystore), str(dst_keystore))
     
-    task = BuildTask(
+    # 请求参数经 BuildTask 校验后，转为内存中的任务记录
+    task = TaskRecord.from_model(BuildTask(
         id=task_id,
         client_id=client_id,
         mode=mode,
@@ -415,53 +422,238 @@ async def create_task(task_data: BuildTaskCreate):
         progress=0,
         message="??????????",
         reuse_keystore_from=reuse_from,
-    )
+    ))
 
     tasks_db[task_id] = task
+    # 新任务会占用磁盘，顺便检查一次配额
+    task_gc.trigger()
     try:
-        persist_tasks_db(force=True)
+        # 等待落盘在线程池中进行，不阻塞事件循环（SSE / 长轮询）
+        await run_in_threadpool(persist_tasks_db, force=True, task_ids=[task_id], wait=True)
     except Exception:
         pass
+    task_event_bus.publish(TaskEventType.CREATED, task_id, client_id)
+    return task
+
+
+TASK_LIST_DEFAULT_LIMIT = 50
+TASK_LIST_MAX_LIMIT = 200
+
+
+def _encode_task_cursor(task: TaskRecord) -> str:
+    raw = f"{task.updated_ts!r}|{task.id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_task_cursor(cursor: str) -> tuple[float, str]:
     try:
-        config_data = task.config.model_dump() if hasattr(task.config, "model_dump") else task.config.dict()
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8")
+        updated_at, task_id = raw.split("|", 1)
+        return float(updated_at), task_id
     except Exception:
-        config_data = {}
-    zip_path = task_input_dir / "project.zip"
-    icon_path = task_input_dir / "logo.png"
-    zip_info = {}
-    if zip_path.exists():
-        zip_info = {"name": zip_path.name, "size": zip_path.stat().st_size}
-    upload_task_assets(
-        task_id,
-        task.client_id or "",
-        task.updated_at.isoformat(),
-        zip_info,
-        config_data,
-        zip_path=str(zip_path) if zip_path.exists() else None,
-        icon_path=str(icon_path) if icon_path.exists() else None,
-        keystore_path=None,
-        keystore_info={},
+        raise HTTPException(status_code=400, detail="after 游标无效")
+
+
+def _revision_etag(kind: str, revision: int) -> str:
+    return f'"{tasks_db.epoch}-{kind}{revision}"'
+
+
+def _not_modified(request: Request, etag: str) -> Response | None:
+    """If-None-Match 命中时直接返回 304，不做任何模型序列化"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return None
+    candidates = [item.strip().removeprefix("W/") for item in header.split(",")]
+    if "*" in candidates or etag in candidates:
+        return Response(status_code=304, headers={"ETag": etag})
+    return None
+
+
+def _split_query_list(value: str | None) -> list[str]:
+    return [item.strip() for item in (value or "").split(",") if item.strip()]
+
+
+@app.get("/api/tasks", response_model=List[BuildTaskSummary])
+async def list_tasks(
+    request: Request,
+    client_id: str = None,
+    limit: int | None = None,
+    after: str | None = None,
+    status: str | None = None,
+    fields: str | None = None,
+):
+    """
+    获取任务列表，按client_id筛选
+    - 不带 limit/after 时按 created_at 返回全部任务
+    - limit/after：按 updated_at 倒序的游标分页，下一页游标在 X-Next-Cursor 响应头中
+    - status：按状态筛选（逗号分隔，如 pending,processing）
+    - fields：只返回指定字段（逗号分隔，id 总是返回）
+    - 响应带 ETag（客户端修订号），If-None-Match 未变化时返回 304
+    """
+    client_id = _require_client_id(client_id)
+    etag = _revision_etag("c", tasks_db.client_revision(client_id))
+    not_modified = _not_modified(request, etag)
+    if not_modified:
+        return not_modified
+    tasks = tasks_db.tasks_for_client(client_id)
+
+    statuses = _split_query_list(status)
+    if statuses:
+        allowed = {item.value for item in BuildStatus}
+        invalid = [item for item in statuses if item not in allowed]
+        if invalid:
+            raise HTTPException(status_code=400, detail=f"未知的任务状态: {', '.join(invalid)}")
+        tasks = [task for task in tasks if BuildStatus(task.status).value in statuses]
+
+    field_names = _split_query_list(fields)
+    if field_names:
+        invalid = [name for name in field_names if name not in BuildTaskSummary.model_fields]
+        if invalid:
+            raise HTTPException(status_code=400, detail=f"未知的字段: {', '.join(invalid)}")
+        if "id" not in field_names:
+            field_names.insert(0, "id")
+
+    paginated = limit is not None or after is not None
+    if not paginated and not field_names:
+        return _json_body(task_summary_cache.get_many(tasks, tasks_db.task_revision), {"ETag": etag})
+
+    next_cursor = None
+    if paginated:
+        tasks.sort(key=lambda task: (task.updated_ts, task.id), reverse=True)
+        if after:
+            cursor_key = _decode_task_cursor(after)
+            tasks = [task for task in tasks if (task.updated_ts, task.id) < cursor_key]
+        page_size = min(max(limit or TASK_LIST_DEFAULT_LIMIT, 1), TASK_LIST_MAX_LIMIT)
+        if len(tasks) > page_size:
+            tasks = tasks[:page_size]
+            next_cursor = _encode_task_cursor(tasks[-1])
+
+    headers = {"ETag": etag}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    if field_names:
+        items = [task_summary_dict(task) for task in tasks]
+        body = dumps([{name: item[name] for name in field_names} for item in items])
+    else:
+        body = task_summary_cache.get_many(tasks, tasks_db.task_revision)
+    return _json_body(body, headers)
+
+
+# SSE 心跳间隔（秒），防止代理断开空闲连接
+TASK_EVENTS_HEARTBEAT = float(os.getenv("APK_BUILDER_SSE_HEARTBEAT", "15"))
+
+
+@app.get("/api/tasks/events")
+async def stream_task_events(request: Request, client_id: str = None, last_event_id: str | None = None):
+    """
+    SSE：推送该客户端任务的状态/进度变化（task）、新日志行（log）和删除（deleted）
+    - 断线重连时浏览器自动带 Last-Event-ID，补发之后的事件
+    - 收到 resync 事件时客户端应重新拉取任务列表（正在查看日志时也重新拉取日志）
+    """
+    client_id = _require_client_id(client_id)
+    resume_from = request.headers.get("last-event-id") or last_event_id
+    subscriber = task_event_stream.subscribe(client_id, asyncio.get_running_loop(), resume_from)
+
+    async def event_source():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                events = await subscriber.wait(TASK_EVENTS_HEARTBEAT)
+                if await request.is_disconnected():
+                    break
+                if events is None:
+                    yield ": ping\n\n"
+                elif events:
+                    yield "".join(events)
+        finally:
+            task_event_stream.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
-    flush_task_assets_queue()
-    return task
 
 
-@app.get("/api/tasks", response_model=List[BuildTaskResponse])
-async def list_tasks(client_id: str = None):
-    """获取任务列表，按client_id筛选"""
+@app.get("/api/tasks/changes")
+async def list_task_changes(client_id: str = None, since: int = 0, epoch: str | None = None):
+    """
+    增量同步：返回修订号 since 之后新建/更新的任务和删除的任务ID，以及新的修订号
+    - 第一次同步传 since=0；之后传上次返回的 revision 和 epoch
+    - reset=true 时 tasks 为全部任务，客户端应丢弃本地副本（后端重启或删除记录已过期）
+    """
     client_id = _require_client_id(client_id)
-    return [task for task in tasks_db.values() if task.client_id == client_id]
+    changes = None
+    if since > 0 and epoch == tasks_db.epoch:
+        changes = tasks_db.changes_since(client_id, since)
+    if changes is None:
+        revision = tasks_db.revision
+        tasks, deleted, reset = tasks_db.tasks_for_client(client_id), [], True
+    else:
+        tasks, deleted, revision = changes
+        reset = False
+    return _json_body(dumps({
+        "epoch": tasks_db.epoch,
+        "revision": revision,
+        "reset": reset,
+        "tasks": [task_summary_dict(task) for task in tasks],
+        "deleted": deleted,
+    }))
 
 
 @app.get("/api/tasks/{task_id}", response_model=BuildTaskResponse)
-async def get_task(task_id: str, client_id: str = None):
-    """获取任务详情"""
+async def get_task(task_id: str, request: Request, client_id: str = None):
+    """获取任务详情，响应带 ETag（任务修订号）"""
     if task_id not in tasks_db:
         raise HTTPException(status_code=404, detail="任务不存在")
     client_id = _require_client_id(client_id)
     task = tasks_db[task_id]
     _assert_task_owner(task, client_id)
-    return task
+    revision = tasks_db.task_revision(task_id)
+    etag = _revision_etag("t", revision)
+    not_modified = _not_modified(request, etag)
+    if not_modified:
+        return not_modified
+    return _json_body(task_body_cache.get(task, revision), {"ETag": etag})
+
+
+# 长轮询最长等待时间（秒）
+TASK_WAIT_MAX_TIMEOUT = 60
+
+
+@app.get("/api/tasks/{task_id}/wait", response_model=BuildTaskResponse)
+async def wait_task(
+    task_id: str,
+    request: Request,
+    rev: int = 0,
+    timeout: float = 30,
+    client_id: str = None,
+):
+    """
+    长轮询：任务修订号大于 rev 时立即返回任务详情，否则挂起直到任务变化或超时
+    - 当前修订号在 X-Task-Revision 响应头中，下次请求作为 rev 传入
+    - 超时未变化返回 304
+    """
+    if task_id not in tasks_db:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    client_id = _require_client_id(client_id)
+    _assert_task_owner(tasks_db[task_id], client_id)
+    timeout = min(max(timeout, 0), TASK_WAIT_MAX_TIMEOUT)
+
+    changed = await task_waiters.wait(
+        task_id,
+        lambda: task_id not in tasks_db or tasks_db.task_revision(task_id) > rev,
+        timeout,
+    )
+    task = tasks_db.get(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    revision = tasks_db.task_revision(task_id)
+    headers = {"ETag": _revision_etag("t", revision), "X-Task-Revision": str(revision)}
+    if not changed:
+        return Response(status_code=304, headers=headers)
+    return _json_body(task_body_cache.get(task, revision), headers)
 
 
 @app.delete("/api/tasks/{task_id}")
@@ -474,27 +666,31 @@ async def delete_task(task_id: str, client_id: str = None):
     client_id = _require_client_id(client_id)
     _assert_task_owner(task, client_id)
     
-    del tasks_db[task_id]
+    # _remove_task 会等待落盘，放到线程池中执行
     try:
-        persist_tasks_db(force=True)
-    except Exception:
-        pass
+        await run_in_threadpool(_remove_task, task_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="任务不存在")
 
-    def _cleanup_task_files(task_id: str) -> None:
+    def _cleanup_task_files(task_id: str, output_filename: str | None) -> None:
         try:
             task_dir = TASKS_DIR / task_id
             if task_dir.exists():
                 shutil.rmtree(task_dir)
         except Exception:
             pass
+        for log_file in task_log_store.log_files(task_id):
+            try:
+                log_file.unlink(missing_ok=True)
+            except Exception:
+                pass
         try:
-            log_file = LOGS_DIR / f"{task_id}.log"
-            if log_file.exists():
-                log_file.unlink()
+            if output_filename:
+                (BACKEND_OUTPUT_DIR / output_filename).unlink(missing_ok=True)
         except Exception:
             pass
 
-    threading.Thread(target=_cleanup_task_files, args=(task_id,), daemon=True).start()
+    threading.Thread(target=_cleanup_task_files, args=(task_id, task.output_filename), daemon=True).start()
     return {"message": "任务已删除"}
 
 
@@ -531,31 +727,7 @@ async def start_task(task_id: str, client_id: str = None):
     task.message = "正在启动构建..."
     task.updated_at = datetime.now()
 
-    try:
-        config_data = task.config.model_dump() if hasattr(task.config, 'model_dump') else task.config.dict()
-    except Exception:
-        config_data = {}
-    zip_path = TASKS_DIR / task_id / "input" / "project.zip"
-    icon_path = TASKS_DIR / task_id / "input" / "logo.png"
-    zip_info = {}
-    if zip_path.exists():
-        zip_info = {"name": zip_path.name, "size": zip_path.stat().st_size}
-    report_task_start(task_id, task.client_id or '', task.updated_at.isoformat(), zip_info, config_data)
-    upload_task_assets(
-        task_id,
-        task.client_id or "",
-        task.updated_at.isoformat(),
-        zip_info,
-        config_data,
-        zip_path=str(zip_path) if zip_path.exists() else None,
-        icon_path=str(icon_path) if icon_path.exists() else None,
-        keystore_path=None,
-        keystore_info={},
-    )
-    flush_task_assets_queue()
-
-    
-    # 启动后台构建任务
+    # 启动后台构建任务（开始构建的上报由事件总线订阅者处理）
     try:
         runner = get_task_runner()
         runner.start_build(task_id)
@@ -564,7 +736,7 @@ async def start_task(task_id: str, client_id: str = None):
         task.message = f"启动构建失败: {str(e)}"
         task.updated_at = datetime.now()
     try:
-        persist_tasks_db(force=True)
+        persist_tasks_db(force=True, task_ids=[task_id])
     except Exception:
         pass
 
@@ -584,7 +756,7 @@ async def cancel_task(task_id: str, payload: dict = Body(...)):
     if not ok:
         raise HTTPException(status_code=400, detail="任务无法取消")
     try:
-        persist_tasks_db(force=True)
+        persist_tasks_db(force=True, task_ids=[task_id])
     except Exception:
         pass
     return task
@@ -639,6 +811,7 @@ async def download_file(task_id: str, client_id: str = None):
     
     if not file_path.exists():
         raise HTTPException(status_code=404, detail="构建文件不存在")
+    task_gc.mark_used(task_id)
 
     # 根据文件类型设置正确的 Content-Type
     suffix = file_path.suffix.lower()
@@ -671,12 +844,12 @@ async def retry_task(task_id: str, client_id: str = None):
     task.status = BuildStatus.PENDING
     task.progress = 0
     task.message = "任务已重置，等待重新构建"
-    task.logs = []
+    task_log_store.reset(task_id)
     task.download_url = None
     task.output_filename = None
     task.updated_at = datetime.now()
     try:
-        persist_tasks_db(force=True)
+        persist_tasks_db(force=True, task_ids=[task_id])
     except Exception:
         pass
 
@@ -688,120 +861,192 @@ async def update_task(task_id: str, update_data: UpdateTaskRequest):
     """更新已完成的任务（用于发布新版本）"""
     if task_id not in tasks_db:
         raise HTTPException(status_code=404, detail="任务不存在")
-    
+
     task = tasks_db[task_id]
     client_id = _require_client_id(update_data.client_id)
     _assert_task_owner(task, client_id)
-    
+
     if task.status != BuildStatus.SUCCESS:
         raise HTTPException(status_code=400, detail="只能更新已成功的任务")
-    
+
     # 验证版本号必须递增
     if update_data.version_code <= task.config.version_code:
         raise HTTPException(status_code=400, detail=f"版本号必须大于 {task.config.version_code}")
-    
-    # 获取任务目录
-    task_dir = TASKS_DIR / task_id
-    task_input_dir = task_dir / "input"
-    task_output_dir = task_dir / "output"
-    
-    # 清理output目录
-    if task_output_dir.exists():
-        for f in task_output_dir.iterdir():
-            if f.is_file():
-                f.unlink()
-    
-    # 如果有新的ZIP文件，替换旧的
-    if update_data.filename:
-        src_zip = BACKEND_UPLOAD_DIR / update_data.filename
-        if src_zip.exists():
-            dst_zip = task_input_dir / "project.zip"
-            if dst_zip.exists():
-                dst_zip.unlink()
-            shutil.move(str(src_zip), str(dst_zip))
-    
-    # 如果有新的图标，替换旧的
-    if update_data.icon_filename:
-        src_icon = BACKEND_UPLOAD_DIR / update_data.icon_filename
-        if src_icon.exists():
-            dst_icon = task_input_dir / "logo.png"
-            if dst_icon.exists():
-                dst_icon.unlink()
-            shutil.copy2(str(src_icon), str(dst_icon))
-            task.icon_filename = "logo.png"
-    
-    # 更新版本信息
-    task.config.version_name = update_data.version_name
-    task.config.version_code = update_data.version_code
+
+    # 先校验请求并生成新的配置，校验失败时任务和磁盘上的文件都保持不变
+    config_data = task.config.model_dump() if hasattr(task.config, "model_dump") else task.config.dict()
+    config_data["version_name"] = update_data.version_name
+    config_data["version_code"] = update_data.version_code
 
     # 更新输出格式（可选）
     if update_data.output_format is not None:
         output_format = update_data.output_format.strip().lower()
         if output_format not in {"apk", "aab"}:
             raise HTTPException(status_code=400, detail="output_format 只支持 apk 或 aab")
-        task.config.output_format = output_format
+        config_data["output_format"] = output_format
 
-    style_updates = {}
     if update_data.orientation is not None:
-        style_updates["orientation"] = update_data.orientation
+        config_data["orientation"] = update_data.orientation
     if update_data.double_click_exit is not None:
-        style_updates["double_click_exit"] = update_data.double_click_exit
+        config_data["double_click_exit"] = update_data.double_click_exit
     if update_data.status_bar_hidden is not None:
-        style_updates["status_bar_hidden"] = update_data.status_bar_hidden
+        config_data["status_bar_hidden"] = update_data.status_bar_hidden
     if update_data.status_bar_style is not None:
-        style_updates["status_bar_style"] = update_data.status_bar_style
+        config_data["status_bar_style"] = update_data.status_bar_style
     if update_data.status_bar_color is not None:
-        style_updates["status_bar_color"] = update_data.status_bar_color
+        config_data["status_bar_color"] = update_data.status_bar_color
     if update_data.permissions is not None:
-        style_updates["permissions"] = update_data.permissions
-    if style_updates:
-        try:
-            config_data = task.config.model_dump() if hasattr(task.config, "model_dump") else task.config.dict()
-            config_data.update(style_updates)
-            task.config = AppConfig(**config_data)
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=str(e))
-    
-    # 重置任务状态
-    task.status = BuildStatus.PENDING
+        config_data["permissions"] = update_data.permissions
+    try:
+        new_config = AppConfig(**config_data)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # 回收 / 构建后清理正在删除该任务的文件时不能修改，状态改为 pending 后回收不会再处理该任务
+    if not task_dir_locks.try_acquire(task_id):
+        raise HTTPException(status_code=409, detail="任务文件正在清理，请稍后重试")
+    try:
+        # 获取任务目录
+        task_dir = TASKS_DIR / task_id
+        task_input_dir = task_dir / "input"
+        task_output_dir = task_dir / "output"
+
+        # 清理output目录
+        if task_output_dir.exists():
+            for f in task_output_dir.iterdir():
+                if f.is_file():
+                    f.unlink()
+
+        # 如果有新的ZIP文件，替换旧的
+        if update_data.filename:
+            src_zip = BACKEND_UPLOAD_DIR / update_data.filename
+            if src_zip.exists():
+                dst_zip = task_input_dir / "project.zip"
+                if dst_zip.exists():
+                    dst_zip.unlink()
+                shutil.move(str(src_zip), str(dst_zip))
+
+        # 如果有新的图标，替换旧的
+        if update_data.icon_filename:
+            src_icon = BACKEND_UPLOAD_DIR / update_data.icon_filename
+            if src_icon.exists():
+                dst_icon = task_input_dir / "logo.png"
+                if dst_icon.exists():
+                    dst_icon.unlink()
+                shutil.copy2(str(src_icon), str(dst_icon))
+                task.icon_filename = "logo.png"
+
+        # 更新版本信息、输出格式和样式
+        task.config = new_config
+
+        # 重置任务状态
+        task.status = BuildStatus.PENDING
+    finally:
+        task_dir_locks.release(task_id)
     task.progress = 0
     task.message = f"版本更新至 {update_data.version_name}，等待构建"
-    task.logs = []
+    task_log_store.reset(task_id)
     task.download_url = None
     task.output_filename = None
     task.updated_at = datetime.now()
     try:
-        persist_tasks_db(force=True)
+        persist_tasks_db(force=True, task_ids=[task_id])
     except Exception:
         pass
 
     return task
 
 
+LOG_READ_DEFAULT_BYTES = 256 * 1024
+LOG_READ_MAX_BYTES = 4 * 1024 * 1024
+
+
 @app.get("/api/tasks/{task_id}/logs")
-async def get_task_logs(task_id: str, lines: int = 100, client_id: str = None):
-    """获取任务日志"""
+async def get_task_logs(
+    task_id: str,
+    lines: int = 100,
+    client_id: str = None,
+    from_offset: int | None = None,
+    max_bytes: int = LOG_READ_DEFAULT_BYTES,
+):
+    """
+    获取任务日志
+    - 默认返回最近 lines 行（日志文件从末尾向前按块读取）
+    - 带 from_offset 时从该字节偏移开始返回最多 max_bytes 字节的完整日志行；
+      响应中的 next_offset 作为下一次请求的 from_offset，即可增量跟踪日志
+    """
     if task_id not in tasks_db:
         raise HTTPException(status_code=404, detail="任务不存在")
     
     task = tasks_db[task_id]
     client_id = _require_client_id(client_id)
     _assert_task_owner(task, client_id)
-    
-    # 优先从内存中获取日志
-    if hasattr(task, 'logs') and task.logs:
-        logs = task.logs[-lines:] if len(task.logs) > lines else task.logs
-        return {"logs": logs, "total": len(task.logs)}
-    
-    # 如果内存中没有，尝试从日志文件读取
-    log_file = LOGS_DIR / f"{task_id}.log"
-    if log_file.exists():
-        with open(log_file, "r", encoding="utf-8") as f:
-            all_logs = f.readlines()
-            logs = [line.strip() for line in all_logs[-lines:]]
-            return {"logs": logs, "total": len(all_logs)}
-    
-    return {"logs": [], "total": 0}
+
+    if from_offset is not None:
+        if from_offset < 0:
+            raise HTTPException(status_code=400, detail="from_offset 不能为负数")
+        max_bytes = min(max(1, max_bytes), LOG_READ_MAX_BYTES)
+        logs, next_offset, size = task_log_store.read_from(task_id, from_offset, max_bytes)
+        return {"logs": logs, "next_offset": next_offset, "size": size, "eof": next_offset >= size}
+
+    # 先取文件大小（会先写入缓冲的日志）再取最近日志：从 next_offset 继续读取不会漏行
+    next_offset = task_log_store.log_size(task_id)
+    logs, total = task_log_store.tail(task_id, lines)
+    return {"logs": logs, "total": total, "next_offset": next_offset}
+
+
+def _owned_task(task_id: str, client_id: str | None):
+    if task_id not in tasks_db:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    task = tasks_db[task_id]
+    _assert_task_owner(task, _require_client_id(client_id))
+    return task
+
+
+@app.get("/api/tasks/{task_id}/logs/steps")
+async def get_task_log_steps(task_id: str, client_id: str = None):
+    """最近一次构建中每个步骤在日志中的字节范围、名称、起止时间和结果"""
+    _owned_task(task_id, client_id)
+    return {"steps": task_log_store.step_sections(task_id)}
+
+
+@app.get("/api/tasks/{task_id}/logs/steps/{step}")
+async def get_task_log_step(task_id: str, step: int, client_id: str = None, max_bytes: int = LOG_READ_DEFAULT_BYTES):
+    """某个步骤的日志（只读取该步骤的字节范围）"""
+    _owned_task(task_id, client_id)
+    section = task_log_store.read_section(task_id, step, min(max(1, max_bytes), LOG_READ_MAX_BYTES))
+    if section is None:
+        raise HTTPException(status_code=404, detail="日志中没有该步骤")
+    return section
+
+
+@app.get("/api/tasks/{task_id}/logs/errors")
+async def get_task_log_errors(task_id: str, client_id: str = None, level: str = "error", limit: int = 500):
+    """最近一次构建中的全部错误行（level=warning 时返回警告行）"""
+    _owned_task(task_id, client_id)
+    if level not in ("error", "warning"):
+        raise HTTPException(status_code=400, detail="level 只能是 error 或 warning")
+    lines, total = task_log_store.level_lines(task_id, level, min(max(0, limit), 5000))
+    return {"level": level, "lines": lines, "total": total}
+
+
+@app.get("/api/tasks/{task_id}/logs/raw")
+async def download_task_raw_output(task_id: str, client_id: str = None):
+    """下载构建工具的完整原始输出（gzip），包含按输出级别未写入日志的行"""
+    _owned_task(task_id, client_id)
+    capture_path = task_log_store.capture_path(task_id)
+    if not capture_path.exists():
+        raise HTTPException(status_code=404, detail="没有原始输出")
+    return FileResponse(str(capture_path), media_type="application/gzip", filename=capture_path.name)
+
+
+@app.get("/api/logs/search")
+async def search_logs(q: str, client_id: str = None, limit: int = 200, per_task: int = 5):
+    """在当前客户端所有已结束任务的日志中搜索，按任务分组返回匹配的行和字节偏移"""
+    client_id = _require_client_id(client_id)
+    limit = min(max(1, limit), 1000)
+    per_task = min(max(1, per_task), 50)
+    return {"query": q, **log_search_index.search(q, client_id, limit=limit, per_task=per_task)}
 
 
 @app.get("/api/queue/status")
@@ -819,6 +1064,18 @@ async def get_queue_status():
         }
 
 
+@app.get("/api/store/metrics")
+async def get_store_metrics():
+    """任务持久化指标（flush 延迟、合并比例）"""
+    return {
+        **tasks_writer.metrics(),
+        "load": tasks_db.load_stats,
+        "gc": task_gc.metrics(),
+        "log_archive": task_log_store.archive_stats,
+        "log_search": log_search_index.metrics(),
+    }
+
+
 @app.get("/api/env/status")
 async def get_env_status():
     return env_setup.get_status()
@@ -982,12 +1239,35 @@ async def adminhub_feedback(
     return {"ok": True}
 
 
+def _finished_tasks() -> list:
+    """已结束任务的 (task_id, client_id)，日志搜索启动时补齐尚未索引的任务"""
+    # 只读取任务摘要，不解析全部任务记录
+    return [
+        (summary.id, summary.client_id)
+        for summary in tasks_db.summaries()
+        if summary.status_code in (TaskStatus.SUCCESS, TaskStatus.FAILED)
+    ]
+
+
 @app.on_event("startup")
 async def startup_event():
     """应用启动时初始化"""
-    init_task_runner(tasks_db, on_state_change=persist_tasks_db)
+    tasks_writer.start()
+    task_gc.start()
+    log_search_index.start(_finished_tasks)
+    runner = init_task_runner(tasks_db, on_state_change=persist_tasks_db, stop_event=task_gc.stop_event)
     env_setup.start_background_check()
-    print("[OK] 构建任务运行器已初始化（最大并发数: 1）")
+    print(f"[OK] 构建任务运行器已初始化（最大并发数: {runner.MAX_CONCURRENT_BUILDS}）")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """退出前处理完已排队的任务事件，并写入尚未持久化的任务状态"""
+    # 先停止回收：置位的停止事件也让排队中的工作目录清理不再限速等待
+    task_gc.stop()
+    task_event_bus.close(timeout=10)
+    log_search_index.stop()
+    tasks_writer.stop()
 
 
 @app.get("/{path:path}", include_in_schema=False)
@@ -3,10 +3,11 @@ from typing_compat import patch_typing_eval_type
 patch_typing_eval_type()
 
 import re
+import time
 
 from pydantic import BaseModel, ConfigDict, field_validator
 from typing import Optional, List
-from enum import Enum
+from enum import Enum, IntEnum
 from datetime import datetime
 
 
@@ -17,6 +18,32 @@ class BuildStatus(str, Enum):
     FAILED = "failed"
 
 
+class TaskStatus(IntEnum):
+    """内部任务状态（小整数），对外仍使用 BuildStatus"""
+    PENDING = 0
+    PROCESSING = 1
+    SUCCESS = 2
+    FAILED = 3
+
+
+_STATUS_BY_CODE = (BuildStatus.PENDING, BuildStatus.PROCESSING, BuildStatus.SUCCESS, BuildStatus.FAILED)
+_CODE_BY_STATUS = {status.value: TaskStatus(code) for code, status in enumerate(_STATUS_BY_CODE)}
+
+
+def _status_code(value) -> TaskStatus:
+    if isinstance(value, TaskStatus):
+        return value
+    return _CODE_BY_STATUS[value.value if isinstance(value, BuildStatus) else str(value)]
+
+
+def _timestamp(value) -> float:
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.timestamp()
+
+
 class AppConfig(BaseModel):
     """APK构建配置"""
     model_config = ConfigDict(from_attributes=True)
@@ -135,7 +162,6 @@ class BuildTask(BaseModel):
     message: str = ""
     download_url: Optional[str] = None
     output_filename: Optional[str] = None
-    logs: List[str] = []
     reuse_keystore_from: Optional[str] = None  # 复用某个任务的签名密钥
 
 
@@ -167,10 +193,37 @@ class BuildTaskResponse(BaseModel):
     message: str
     download_url: Optional[str] = None
     output_filename: Optional[str] = None
-    logs: List[str] = []
     reuse_keystore_from: Optional[str] = None
 
 
+class AppConfigSummary(BaseModel):
+    """任务列表中展示用的配置摘要"""
+    model_config = ConfigDict(from_attributes=True)
+    app_name: str
+    package_name: str
+    version_name: str = "1.0.0"
+    version_code: int = 1
+    output_format: str = "apk"
+
+
+class BuildTaskSummary(BaseModel):
+    """任务列表项（不含日志和完整配置，完整信息通过任务详情接口获取）"""
+    model_config = ConfigDict(from_attributes=True)
+    id: str
+    client_id: str = ""
+    mode: str = "convert"
+    web_url: Optional[str] = None
+    icon_filename: Optional[str] = None
+    config: AppConfigSummary
+    status: BuildStatus
+    created_at: datetime
+    updated_at: datetime
+    progress: int
+    message: str
+    download_url: Optional[str] = None
+    output_filename: Optional[str] = None
+
+
 class UpdateTaskRequest(BaseModel):
     """更新任务请求"""
     client_id: str  # 客户端ID（用于验证所有权）
@@ -186,3 +239,154 @@ class UpdateTaskRequest(BaseModel):
     status_bar_style: Optional[str] = None  # light | dark
     status_bar_color: Optional[str] = None  # transparent | #FFFFFF
     permissions: Optional[List[str]] = None
+
+
+class TaskRecord:
+    """
+    内存中的任务记录（tasks_db / 构建线程使用）
+    - __slots__ 存储，状态为 TaskStatus 小整数，时间为 float 时间戳
+    - status / created_at / updated_at 属性仍返回 BuildStatus / datetime，响应模型可直接读取
+    - 只在 HTTP 边界和持久化时转换
+    """
+
+    __slots__ = (
+        "id", "client_id", "mode", "web_url", "filename", "icon_filename", "config",
+        "status_code", "created_ts", "updated_ts", "progress", "message",
+        "download_url", "output_filename", "reuse_keystore_from",
+    )
+
+    def __init__(
+        self,
+        id: str,
+        config: AppConfig,
+        client_id: str = "",
+        mode: str = "convert",
+        web_url: Optional[str] = None,
+        filename: Optional[str] = None,
+        icon_filename: Optional[str] = None,
+        status=TaskStatus.PENDING,
+        created_at=None,
+        updated_at=None,
+        progress: int = 0,
+        message: str = "",
+        download_url: Optional[str] = None,
+        output_filename: Optional[str] = None,
+        reuse_keystore_from: Optional[str] = None,
+    ):
+        now = time.time()
+        self.id = id
+        self.client_id = client_id or ""
+        self.mode = mode
+        self.web_url = web_url
+        self.filename = filename
+        self.icon_filename = icon_filename
+        self.config = config
+        self.status_code = _status_code(status)
+        self.created_ts = _timestamp(created_at) if created_at is not None else now
+        self.updated_ts = _timestamp(updated_at) if updated_at is not None else now
+        self.progress = progress
+        self.message = message
+        self.download_url = download_url
+        self.output_filename = output_filename
+        self.reuse_keystore_from = reuse_keystore_from
+
+    @property
+    def status(self) -> BuildStatus:
+        return _STATUS_BY_CODE[self.status_code]
+
+    @status.setter
+    def status(self, value) -> None:
+        self.status_code = _status_code(value)
+
+    @property
+    def created_at(self) -> datetime:
+        return datetime.fromtimestamp(self.created_ts)
+
+    @created_at.setter
+    def created_at(self, value) -> None:
+        self.created_ts = _timestamp(value)
+
+    @property
+    def updated_at(self) -> datetime:
+        return datetime.fromtimestamp(self.updated_ts)
+
+    @updated_at.setter
+    def updated_at(self, value) -> None:
+        self.updated_ts = _timestamp(value)
+
+    def touch(self) -> None:
+        self.updated_ts = time.time()
+
+    @classmethod
+    def from_model(cls, task: BuildTask) -> "TaskRecord":
+        return cls(**{name: getattr(task, name) for name in BuildTask.model_fields})
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "TaskRecord":
+        """从持久化的字典构造；未知状态按 pending 处理，config 仍经过 AppConfig 校验"""
+        try:
+            status = _status_code(data.get("status") or "pending")
+        except KeyError:
+            status = TaskStatus.PENDING
+        return cls(
+            id=data["id"],
+            config=AppConfig.model_validate(data["config"]),
+            client_id=data.get("client_id") or "",
+            mode=data.get("mode") or "convert",
+            web_url=data.get("web_url"),
+            filename=data.get("filename"),
+            icon_filename=data.get("icon_filename"),
+            status=status,
+            created_at=data["created_at"],
+            updated_at=data["updated_at"],
+            progress=int(data.get("progress") or 0),
+            message=data.get("message") or "",
+            download_url=data.get("download_url"),
+            output_filename=data.get("output_filename"),
+            reuse_keystore_from=data.get("reuse_keystore_from"),
+        )
+
+    def to_dict(self) -> dict:
+        """与 BuildTask JSON 结构相同的字典（用于持久化和任务详情响应）"""
+        return {
+            "id": self.id,
+            "client_id": self.client_id,
+            "mode": self.mode,
+            "web_url": self.web_url,
+            "filename": self.filename,
+            "icon_filename": self.icon_filename,
+            "config": self.config.model_dump(mode="json"),
+            "status": _STATUS_BY_CODE[self.status_code].value,
+            "created_at": datetime.fromtimestamp(self.created_ts).isoformat(),
+            "updated_at": datetime.fromtimestamp(self.updated_ts).isoformat(),
+            "progress": self.progress,
+            "message": self.message,
+            "download_url": self.download_url,
+            "output_filename": self.output_filename,
+            "reuse_keystore_from": self.reuse_keystore_from,
+        }
+
+    def summary_dict(self) -> dict:
+        """与 BuildTaskSummary 结构相同的字典"""
+        config = self.config
+        return {
+            "id": self.id,
+            "client_id": self.client_id,
+            "mode": self.mode,
+            "web_url": self.web_url,
+            "icon_filename": self.icon_filename,
+            "config": {
+                "app_name": config.app_name,
+                "package_name": config.package_name,
+                "version_name": config.version_name,
+                "version_code": config.version_code,
+                "output_format": config.output_format,
+            },
+            "status": _STATUS_BY_CODE[self.status_code].value,
+            "created_at": datetime.fromtimestamp(self.created_ts).isoformat(),
+            "updated_at": datetime.fromtimestamp(self.updated_ts).isoformat(),
+            "progress": self.progress,
+            "message": self.message,
+            "download_url": self.download_url,
+            "output_filename": self.output_filename,
+        }
@@ -0,0 +1,100 @@
+"""
+任务编解码
+- 持久化和 API 响应统一使用紧凑 JSON（无缩进），任务记录直接转为字典，不再经过响应模型校验
+- 安装了 orjson / msgspec 时使用它们编码，否则退回标准库 json（APK_BUILDER_JSON_CODEC 可强制指定）
+- 任务详情 / 摘要的响应体按任务修订号缓存编码结果，列表接口只拼接字节
+"""
+import json
+import os
+import threading
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from models import TaskRecord
+
+try:
+    import orjson
+except ImportError:  # 可选依赖
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # 可选依赖
+    msgspec = None
+
+
+def _select_codec(name: str) -> Tuple[str, Callable[[object], bytes], Callable[[object], object]]:
+    if name in ("auto", "orjson") and orjson is not None:
+        return "orjson", orjson.dumps, orjson.loads
+    if name in ("auto", "msgspec") and msgspec is not None:
+        encoder = msgspec.json.Encoder()
+        decoder = msgspec.json.Decoder()
+        return "msgspec", encoder.encode, decoder.decode
+
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    return "json", _dumps, json.loads
+
+
+JSON_CODEC, dumps, loads = _select_codec(os.getenv("APK_BUILDER_JSON_CODEC", "auto").strip().lower())
+
+
+def task_to_dict(task: TaskRecord) -> dict:
+    """持久化用的完整字典（status 为字符串，datetime 为 ISO 格式）"""
+    return task.to_dict()
+
+
+def encode_task(task: TaskRecord) -> str:
+    """持久化用的完整 JSON 文本"""
+    return dumps(task.to_dict()).decode("utf-8")
+
+
+def task_summary_dict(task: TaskRecord) -> dict:
+    """与 BuildTaskSummary 相同结构的字典"""
+    return task.summary_dict()
+
+
+def encode_task_response(task: TaskRecord) -> bytes:
+    """与 BuildTaskResponse 相同结构的 JSON"""
+    return dumps(task.to_dict())
+
+
+def encode_task_summary(task: TaskRecord) -> bytes:
+    """与 BuildTaskSummary 相同结构的 JSON"""
+    return dumps(task.summary_dict())
+
+
+def decode_task(raw) -> Optional[TaskRecord]:
+    """从 JSON 文本解析任务记录；数据不完整时返回 None"""
+    try:
+        data = loads(raw)
+        return TaskRecord.from_dict(data) if isinstance(data, dict) else None
+    except Exception:
+        return None
+
+
+class TaskBodyCache:
+    """按 (task_id, 修订号) 缓存任务的 JSON 编码，任务没变化时直接复用"""
+
+    def __init__(self, encode: Callable[[TaskRecord], bytes]):
+        self.encode = encode
+        self._entries: Dict[str, Tuple[int, bytes]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, task: TaskRecord, revision: int) -> bytes:
+        entry = self._entries.get(task.id)
+        if entry is not None and entry[0] == revision:
+            return entry[1]
+        body = self.encode(task)
+        with self._lock:
+            self._entries[task.id] = (revision, body)
+        return body
+
+    def get_many(self, tasks: Iterable[TaskRecord], revision_of: Callable[[str], int]) -> bytes:
+        """编码任务列表（JSON 数组）"""
+        return b"[" + b",".join(self.get(task, revision_of(task.id)) for task in tasks) + b"]"
+
+    def discard(self, task_id: str) -> None:
+        with self._lock:
+            self._entries.pop(task_id, None)
+
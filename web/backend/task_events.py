@@ -0,0 +1,232 @@
+"""
+任务事件推送（SSE）与长轮询等待
+构建线程发布任务状态/进度变化和新日志行，按 client_id 分发给订阅者：
+- 每个事件带递增的 id（前缀为进程 epoch，后端重启后旧 id 不会误匹配），每个客户端保留最近 history_size 条事件，用于 Last-Event-ID 断线续传
+- 每个订阅者有独立的有界缓冲区，消费太慢时丢弃最旧的事件并通知客户端重新同步，发布方永不阻塞
+- 客户端的最后一个连接断开且 history_ttl 秒内没有新事件后，丢弃它的历史事件
+"""
+import asyncio
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from models import BuildStatus
+
+RESYNC_EVENT = "event: resync\ndata: {}\n\n"
+
+
+def _format_event(event_id: str, event: str, data: dict) -> str:
+    payload = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return f"id: {event_id}\nevent: {event}\ndata: {payload}\n\n"
+
+
+class TaskEventSubscriber:
+    """单个 SSE 连接；事件在发布时已编码为文本，这里只做排队"""
+
+    def __init__(self, stream: "TaskEventStream", client_id: str, loop: asyncio.AbstractEventLoop, max_events: int):
+        self.stream = stream
+        self.client_id = client_id
+        self.loop = loop
+        self.events: Deque[str] = deque(maxlen=max_events)
+        self.overflowed = False
+        self._ready = asyncio.Event()
+
+    def _push(self, text: str) -> None:
+        # 调用方持有 stream 的锁；可能在构建线程中执行，只能通过 call_soon_threadsafe 唤醒
+        if len(self.events) == self.events.maxlen:
+            self.overflowed = True
+        self.events.append(text)
+        try:
+            self.loop.call_soon_threadsafe(self._ready.set)
+        except RuntimeError:
+            pass  # 事件循环已关闭
+
+    async def wait(self, timeout: float) -> Optional[List[str]]:
+        """等待新事件；超时返回 None（调用方发送心跳），否则返回待发送的事件文本"""
+        if not self.events:
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        self._ready.clear()
+        return self.stream._drain(self)
+
+
+class TaskEventStream:
+    def __init__(
+        self,
+        history_size: int = 1000,
+        subscriber_buffer: int = 500,
+        history_ttl: float = 600.0,
+        resync_interval: float = 1.0,
+    ):
+        self.history_size = history_size
+        self.subscriber_buffer = subscriber_buffer
+        self.history_ttl = history_ttl
+        self.resync_interval = resync_interval
+        self.epoch = uuid.uuid4().hex[:8]
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._history: Dict[str, Deque[Tuple[int, str]]] = {}
+        self._subscribers: Dict[str, Set[TaskEventSubscriber]] = {}
+        self._last_state: Dict[str, tuple] = {}
+        self._last_activity: Dict[str, float] = {}  # client_id -> 最近一次发布 / 断开的时间
+        self._last_resync: Dict[str, float] = {}
+        self._last_sweep = time.monotonic()
+
+    def publish(self, client_id: str, event: str, data: dict) -> int:
+        client_id = client_id or ""
+        with self._lock:
+            self._seq += 1
+            text = _format_event(f"{self.epoch}.{self._seq}", event, data)
+            history = self._history.get(client_id)
+            if history is None:
+                history = self._history[client_id] = deque(maxlen=self.history_size)
+            history.append((self._seq, text))
+            for subscriber in self._subscribers.get(client_id, ()):
+                subscriber._push(text)
+            now = time.monotonic()
+            self._last_activity[client_id] = now
+            if now - self._last_sweep >= self.history_ttl:
+                self._evict_idle_locked(now)
+            return self._seq
+
+    def _evict_idle_locked(self, now: float) -> None:
+        """丢弃没有连接、且超过 history_ttl 没有新事件的客户端历史"""
+        self._last_sweep = now
+        for client_id, last in list(self._last_activity.items()):
+            if client_id not in self._subscribers and now - last >= self.history_ttl:
+                self._history.pop(client_id, None)
+                self._last_activity.pop(client_id, None)
+                self._last_resync.pop(client_id, None)
+
+    def publish_resync(self, client_id: str) -> None:
+        """事件在总线上被丢弃（例如日志太多）时通知客户端重新拉取任务和日志；每个客户端最多每 resync_interval 秒一次"""
+        client_id = client_id or ""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_resync.get(client_id, 0.0) < self.resync_interval:
+                return
+            self._last_resync[client_id] = now
+        self.publish(client_id, "resync", {"reason": "dropped"})
+
+    def publish_task(self, task) -> None:
+        """推送任务状态/进度；和上次推送相同时跳过（例如只追加了日志）"""
+        status = BuildStatus(task.status).value
+        state = (status, task.progress, task.message, task.download_url, task.output_filename)
+        with self._lock:
+            if self._last_state.get(task.id) == state:
+                return
+            self._last_state[task.id] = state
+        self.publish(task.client_id, "task", {
+            "id": task.id,
+            "status": status,
+            "progress": task.progress,
+            "message": task.message,
+            "updated_at": task.updated_at.isoformat(),
+            "download_url": task.download_url,
+            "output_filename": task.output_filename,
+        })
+
+    def publish_log(self, client_id: str, task_id: str, line: str) -> None:
+        self.publish(client_id, "log", {"task_id": task_id, "line": line})
+
+    def publish_deleted(self, task) -> None:
+        with self._lock:
+            self._last_state.pop(task.id, None)
+        self.publish(task.client_id, "deleted", {"id": task.id})
+
+    def subscribe(
+        self,
+        client_id: str,
+        loop: asyncio.AbstractEventLoop,
+        last_event_id: Optional[str] = None,
+    ) -> TaskEventSubscriber:
+        """注册订阅者；带 last_event_id 时先补发之后的历史事件，历史不够时要求客户端重新同步"""
+        client_id = client_id or ""
+        subscriber = TaskEventSubscriber(self, client_id, loop, self.subscriber_buffer)
+        with self._lock:
+            if last_event_id:
+                last_seq = self._parse_event_id(last_event_id)
+                history = self._history.get(client_id) or ()
+                oldest = history[0][0] if history else self._seq + 1
+                if last_seq is None or last_seq > self._seq or last_seq < oldest - 1:
+                    subscriber._push(RESYNC_EVENT)
+                else:
+                    for event_id, text in history:
+                        if event_id > last_seq:
+                            subscriber._push(text)
+            self._subscribers.setdefault(client_id, set()).add(subscriber)
+        return subscriber
+
+    def _parse_event_id(self, value: str) -> Optional[int]:
+        epoch, _, seq = value.strip().partition(".")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def unsubscribe(self, subscriber: TaskEventSubscriber) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscriber.client_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[subscriber.client_id]
+                    self._last_activity[subscriber.client_id] = time.monotonic()
+            self._evict_idle_locked(time.monotonic())
+
+    def _drain(self, subscriber: TaskEventSubscriber) -> List[str]:
+        with self._lock:
+            events = list(subscriber.events)
+            subscriber.events.clear()
+            if subscriber.overflowed:
+                # 缓冲区溢出丢过事件，先让客户端重新拉取完整状态
+                subscriber.overflowed = False
+                events.insert(0, RESYNC_EVENT)
+            return events
+
+
+class TaskRevisionWaiters:
+    """长轮询：请求在事件循环中等待任务变化，构建线程通过 call_soon_threadsafe 唤醒"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters: Dict[str, Set[Tuple[asyncio.AbstractEventLoop, asyncio.Event]]] = {}
+
+    def notify(self, task_ids) -> None:
+        with self._lock:
+            waiters = [waiter for task_id in task_ids for waiter in self._waiters.get(task_id, ())]
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                pass
+
+    async def wait(self, task_id: str, changed: Callable[[], bool], timeout: float) -> bool:
+        """等待 changed() 为真，最多 timeout 秒；返回是否已变化"""
+        loop = asyncio.get_running_loop()
+        waiter = (loop, asyncio.Event())
+        with self._lock:
+            self._waiters.setdefault(task_id, set()).add(waiter)
+        try:
+            deadline = loop.time() + timeout
+            while not changed():
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return False
+                try:
+                    await asyncio.wait_for(waiter[1].wait(), remaining)
+                except asyncio.TimeoutError:
+                    return changed()
+                waiter[1].clear()
+            return True
+        finally:
+            with self._lock:
+                waiters = self._waiters.get(task_id)
+                if waiters is not None:
+                    waiters.discard(waiter)
+                    if not waiters:
+                        del self._waiters[task_id]
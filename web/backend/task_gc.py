@@ -0,0 +1,469 @@
+"""
+任务目录回收（保留期限 / 磁盘配额）
+每个任务会留下 tasks/<id>/project（完整 node_modules 和 Gradle 构建目录）、tasks/<id>/output、
+outputs/ 中的产物副本和 logs/<id>.log，后台线程按策略回收：
+- 超过 max_age 没有更新的已结束任务整体删除
+- 每个客户端只保留最近 keep_last 个已结束任务
+- 总占用超过 max_bytes 时，先按最近使用时间从旧到新删除工作目录（保留输入、签名和产物），仍超出再整体删除任务
+- 遍历和删除文件按 io_ops_per_sec 限速，避免和正在进行的构建抢磁盘
+- 构建、构建后清理和回收通过 task_dir_locks 互斥使用 tasks/<id>，回收跳过正在使用的任务，
+  每删除一项前重新确认任务仍已结束
+"""
+import os
+import stat
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from models import TaskStatus
+
+# 可以删除的工作文件：重新构建时会重新解压 / 生成
+WORK_ENTRIES = ("project", "output", "gradle", "gradle-init.gradle")
+FINISHED_STATUSES = (TaskStatus.SUCCESS, TaskStatus.FAILED)
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, "").strip() or default)
+    except ValueError:
+        return default
+
+
+# 回收和构建后清理共用的文件操作限速（每秒次数，0 表示不限速）
+GC_IO_OPS = _env_float("APK_BUILDER_GC_IO_OPS", 2000)
+
+
+class _IOThrottle:
+    """每执行 batch 次文件操作检查一次速率，超过 ops_per_sec 时休眠"""
+
+    def __init__(self, ops_per_sec: float, stop: threading.Event, batch: int = 100):
+        self.ops_per_sec = ops_per_sec
+        self.stop = stop
+        self.batch = batch
+        self._count = 0
+        self._window_start = time.monotonic()
+
+    def tick(self) -> None:
+        if self.ops_per_sec <= 0:
+            return
+        self._count += 1
+        if self._count < self.batch:
+            return
+        expected = self._count / self.ops_per_sec
+        elapsed = time.monotonic() - self._window_start
+        if elapsed < expected:
+            self.stop.wait(expected - elapsed)
+        self._count = 0
+        self._window_start = time.monotonic()
+
+
+class TaskDirLocks:
+    """
+    tasks/<id> 的使用标记：构建线程在准备构建前等待获取，构建结束后释放；
+    回收和清理只尝试获取，任务正在使用时直接跳过
+    """
+
+    def __init__(self):
+        self._busy: set = set()
+        self._cond = threading.Condition()
+
+    def acquire(self, task_id: str) -> None:
+        with self._cond:
+            while task_id in self._busy:
+                self._cond.wait()
+            self._busy.add(task_id)
+
+    def try_acquire(self, task_id: str) -> bool:
+        with self._cond:
+            if task_id in self._busy:
+                return False
+            self._busy.add(task_id)
+            return True
+
+    def release(self, task_id: str) -> None:
+        with self._cond:
+            self._busy.discard(task_id)
+            self._cond.notify_all()
+
+    def busy(self, task_id: str) -> bool:
+        with self._cond:
+            return task_id in self._busy
+
+    @contextmanager
+    def hold(self, task_id: str):
+        self.acquire(task_id)
+        try:
+            yield
+        finally:
+            self.release(task_id)
+
+
+task_dir_locks = TaskDirLocks()
+
+
+class TaskGarbageCollector:
+    def __init__(
+        self,
+        tasks_db,
+        tasks_dir: Path,
+        outputs_dir: Path,
+        logs_dir: Path,
+        remove_task: Callable[[str], None],
+    ):
+        """
+        remove_task: 从任务存储中删除任务并通知客户端（与 DELETE /api/tasks/{id} 相同），文件由这里删除
+        """
+        self.tasks_db = tasks_db
+        self.tasks_dir = Path(tasks_dir)
+        self.outputs_dir = Path(outputs_dir)
+        self.logs_dir = Path(logs_dir)
+        self.remove_task = remove_task
+        self.interval = _env_float("APK_BUILDER_GC_INTERVAL", 3600)  # 秒，0 表示不自动运行
+        self.max_age = _env_float("APK_BUILDER_GC_MAX_AGE_DAYS", 0) * 86400  # 0 表示不限
+        self.max_bytes = int(_env_float("APK_BUILDER_GC_MAX_GB", 0) * 1024 ** 3)  # 0 表示不限
+        self.keep_last = int(_env_float("APK_BUILDER_GC_KEEP_LAST", 0))  # 0 表示不限
+        self.io_ops_per_sec = GC_IO_OPS
+        # task_id -> (修订号, 工作目录字节数, 保留部分字节数)；任务没变化时不重复遍历目录
+        self._usage: Dict[str, Tuple[int, int, int]] = {}
+        # task_id -> 最近一次使用（如下载产物）的时间戳
+        self._last_used: Dict[str, float] = {}
+        self.last_run: dict = {}
+        self._run_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.max_age or self.max_bytes or self.keep_last)
+
+    @property
+    def stop_event(self) -> threading.Event:
+        """应用退出时置位；工作目录清理等其他限速 IO 共用，退出时不再休眠"""
+        return self._stop
+
+    def start(self) -> None:
+        if self._thread is not None or self.interval <= 0 or not self.enabled:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="TaskGC")
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def trigger(self) -> None:
+        """尽快执行一次回收（不阻塞调用方）"""
+        self._wakeup.set()
+
+    def mark_used(self, task_id: str) -> None:
+        self._last_used[task_id] = time.time()
+
+    def forget(self, task_id: str) -> None:
+        self._usage.pop(task_id, None)
+        self._last_used.pop(task_id, None)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.collect()
+            except Exception as exc:
+                print(f"[TaskGC] 回收失败: {exc}")
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+    # ---- 回收 ----
+
+    def collect(self) -> dict:
+        """按策略执行一次回收，返回统计信息"""
+        with self._run_lock:
+            started = time.perf_counter()
+            throttle = _IOThrottle(self.io_ops_per_sec, self._stop)
+            stats = {"tasks_removed": 0, "workdirs_removed": 0, "reclaimed_bytes": 0}
+            now = time.time()
+
+            finished = self._finished_tasks()
+            expired = set()
+            if self.max_age:
+                expired.update(task.id for task in finished if now - self._last_use(task) > self.max_age)
+            if self.keep_last:
+                by_client: Dict[str, list] = {}
+                for task in finished:
+                    by_client.setdefault(task.client_id or "", []).append(task)
+                for tasks in by_client.values():
+                    tasks.sort(key=lambda task: task.created_ts, reverse=True)
+                    expired.update(task.id for task in tasks[self.keep_last:])
+            for task_id in expired:
+                if self._stop.is_set():
+                    break
+                reclaimed = self._evict_task(task_id, throttle)
+                if reclaimed is not None:
+                    stats["reclaimed_bytes"] += reclaimed
+                    stats["tasks_removed"] += 1
+
+            total = None
+            if self.max_bytes:
+                finished = [task for task in finished if task.id not in expired]
+                total = self._total_usage(throttle)
+                # 最近使用时间从旧到新：先删工作目录，仍超出配额再整体删除任务
+                finished.sort(key=self._last_use)
+                for task in finished:
+                    if total <= self.max_bytes or self._stop.is_set():
+                        break
+                    work_bytes = self._usage.get(task.id, (0, 0, 0))[1]
+                    reclaimed = self._evict_workdir(task.id, throttle) if work_bytes else None
+                    if reclaimed is not None:
+                        total -= reclaimed
+                        stats["reclaimed_bytes"] += reclaimed
+                        stats["workdirs_removed"] += 1
+                for task in finished:
+                    if total <= self.max_bytes or self._stop.is_set():
+                        break
+                    reclaimed = self._evict_task(task.id, throttle)
+                    if reclaimed is not None:
+                        total -= reclaimed
+                        stats["reclaimed_bytes"] += reclaimed
+                        stats["tasks_removed"] += 1
+
+            stats["total_bytes"] = total
+            stats["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            stats["finished_at"] = time.time()
+            self.last_run = stats
+            if stats["tasks_removed"] or stats["workdirs_removed"]:
+                print(
+                    f"[TaskGC] 删除 {stats['tasks_removed']} 个任务、{stats['workdirs_removed']} 个工作目录，"
+                    f"回收 {stats['reclaimed_bytes'] / 1024 / 1024:.1f} MB，用时 {stats['elapsed_ms']:.0f}ms"
+                )
+            return stats
+
+    def _finished_tasks(self) -> list:
+        # 任务摘要（id / client_id / 状态 / 时间），遍历全部任务时不解析任务记录
+        return [task for task in self.tasks_db.summaries() if task.status_code in FINISHED_STATUSES]
+
+    def _is_finished(self, task_id: str) -> bool:
+        # 删除前再确认一次：任务可能已被重试 / 更新版本重新开始构建
+        task = self.tasks_db.summary(task_id)
+        return task is not None and task.status_code in FINISHED_STATUSES
+
+    def _last_use(self, task) -> float:
+        return max(task.updated_ts, self._last_used.get(task.id, 0.0))
+
+    def _total_usage(self, throttle: _IOThrottle) -> int:
+        total = 0
+        for task_id in list(self.tasks_db):
+            revision = self.tasks_db.task_revision(task_id)
+            cached = self._usage.get(task_id)
+            if cached is None or cached[0] != revision:
+                work_bytes, kept_bytes = self._measure(task_id, throttle)
+                cached = self._usage[task_id] = (revision, work_bytes, kept_bytes)
+            total += cached[1] + cached[2]
+        return total
+
+    def _measure(self, task_id: str, throttle: _IOThrottle) -> Tuple[int, int]:
+        """返回 (工作目录字节数, 输入/签名/产物/日志字节数)"""
+        task_dir = self.tasks_dir / task_id
+        work_bytes = kept_bytes = 0
+        if task_dir.exists():
+            for entry in os.scandir(task_dir):
+                size = tree_size(Path(entry.path), throttle)
+                if entry.name in WORK_ENTRIES:
+                    work_bytes += size
+                else:
+                    kept_bytes += size
+        for path in self._task_files(task_id):
+            kept_bytes += tree_size(path, throttle)
+        return work_bytes, kept_bytes
+
+    def _task_files(self, task_id: str) -> List[Path]:
+        # 日志可能已压缩归档（<id>.log.gz / .log.zst 和索引 .log.idx）
+        paths = list(self.logs_dir.glob(f"{task_id}.log*"))
+        # 产物副本命名为 <task_id>_<文件名>，按前缀查找，不用解析任务记录
+        paths += self.outputs_dir.glob(f"{task_id}_*")
+        return paths
+
+    def _evict_workdir(self, task_id: str, throttle: _IOThrottle) -> Optional[int]:
+        """删除工作目录，返回释放的字节数；任务正在使用或已不是结束状态时返回 None"""
+        task_dir = self.tasks_dir / task_id
+        reclaimed = None
+        complete = True
+        for name in WORK_ENTRIES:
+            # 每一项单独获取：删除期间任务被重试时，构建线程只需等待当前这一项删完
+            if not task_dir_locks.try_acquire(task_id):
+                complete = False
+                break
+            try:
+                if not self._is_finished(task_id):
+                    complete = False
+                    break
+                reclaimed = (reclaimed or 0) + remove_tree(task_dir / name, throttle)
+            finally:
+                task_dir_locks.release(task_id)
+        cached = self._usage.get(task_id)
+        if cached is not None and reclaimed is not None:
+            # 中途停止时下次重新统计
+            self._usage[task_id] = (cached[0], 0, cached[2]) if complete else (-1, cached[1], cached[2])
+        return reclaimed
+
+    def _evict_task(self, task_id: str, throttle: _IOThrottle) -> Optional[int]:
+        """整体删除任务，返回释放的字节数；任务正在使用或已不是结束状态时返回 None"""
+        if not task_dir_locks.try_acquire(task_id):
+            return None
+        try:
+            if not self._is_finished(task_id):
+                return None
+            paths = self._task_files(task_id)
+            try:
+                self.remove_task(task_id)
+            except KeyError:
+                pass
+            # 任务已从存储中删除，之后不会再被重试
+        finally:
+            task_dir_locks.release(task_id)
+        reclaimed = remove_tree(self.tasks_dir / task_id, throttle)
+        for path in paths:
+            reclaimed += remove_tree(path, throttle)
+        self.forget(task_id)
+        return reclaimed
+
+    def metrics(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "interval": self.interval,
+            "max_age_days": self.max_age / 86400,
+            "max_bytes": self.max_bytes,
+            "keep_last": self.keep_last,
+            "last_run": self.last_run,
+        }
+
+
+def tree_size(path: Path, throttle: Optional[_IOThrottle] = None) -> int:
+    """目录（或文件）占用的字节数，不跟随符号链接"""
+    total = 0
+    stack = [str(path)]
+    while stack:
+        current = stack.pop()
+        if throttle:
+            throttle.tick()
+        try:
+            st = os.lstat(current)
+        except OSError:
+            continue
+        if os.path.isdir(current) and not os.path.islink(current):
+            try:
+                stack.extend(entry.path for entry in os.scandir(current))
+            except OSError:
+                pass
+        else:
+            total += st.st_size
+    return total
+
+
+def _unlink(path) -> int:
+    try:
+        size = os.lstat(path).st_size
+    except OSError:
+        return 0
+    try:
+        os.unlink(path)
+    except PermissionError:
+        # Windows 下只读文件（如 node_modules 中的部分文件）需要先去掉只读属性
+        try:
+            os.chmod(path, stat.S_IWRITE)
+            os.unlink(path)
+        except OSError:
+            return 0
+    except OSError:
+        return 0
+    return size
+
+
+def remove_tree(path: Path, throttle: Optional[_IOThrottle] = None) -> int:
+    """逐个删除文件（每次删除都计入限速），返回释放的字节数"""
+    if not os.path.lexists(path):
+        return 0
+    if not os.path.isdir(path) or os.path.islink(path):
+        return _unlink(path)
+    reclaimed = 0
+    for root, dirs, files in os.walk(path, topdown=False):
+        for name in files:
+            file_path = os.path.join(root, name)
+            if throttle:
+                throttle.tick()
+            reclaimed += _unlink(file_path)
+        for name in dirs:
+            dir_path = os.path.join(root, name)
+            if throttle:
+                throttle.tick()
+            try:
+                if os.path.islink(dir_path):
+                    os.unlink(dir_path)
+                else:
+                    os.rmdir(dir_path)
+            except OSError:
+                pass
+    try:
+        os.rmdir(path)
+    except OSError:
+        pass
+    return reclaimed
+
+
+# ---- 构建成功后清理工作目录 ----
+
+# off：不清理；intermediates：删除依赖和构建中间产物，保留源码（便于排查）；all（默认）：删除整个 project 目录
+# 每次构建都会删除并重新解压 / 复制 project 目录，其中的内容（包括项目 .gradle 和 npm 安装标记）不会被下一次构建用到，
+# 跨构建复用的只有任务目录下的 gradle/ 缓存
+WORKSPACE_PRUNE_MODE = os.getenv("APK_BUILDER_WORKSPACE_PRUNE", "all").strip().lower()
+if WORKSPACE_PRUNE_MODE not in {"off", "intermediates", "all"}:
+    WORKSPACE_PRUNE_MODE = "all"
+
+# intermediates 模式删除的目录
+_PRUNE_DIR_NAMES = {"node_modules", ".gradle", ".cxx"}
+_GRADLE_MARKERS = ("build.gradle", "build.gradle.kts", "settings.gradle", "settings.gradle.kts")
+
+
+def _prune_targets(project_dir: Path) -> List[Path]:
+    targets = []
+    for root, dirs, files in os.walk(project_dir):
+        is_gradle_module = any(name in files for name in _GRADLE_MARKERS)
+        is_web_root = "package.json" in files
+        remaining = []
+        for name in dirs:
+            if name in _PRUNE_DIR_NAMES or (name == "build" and is_gradle_module) or (name == "dist" and is_web_root):
+                targets.append(Path(root) / name)
+            else:
+                remaining.append(name)
+        dirs[:] = remaining
+    return targets
+
+
+def prune_workspace(
+    task_dir: Path,
+    mode: str = WORKSPACE_PRUNE_MODE,
+    io_ops_per_sec: float = GC_IO_OPS,
+    stop: Optional[threading.Event] = None,
+) -> Tuple[int, int]:
+    """
+    清理任务工作目录（Gradle 缓存目录 gradle/、输入、签名和产物保留），返回清理前后任务目录的字节数
+    在任务完成后的后台线程中执行，遍历和删除按 io_ops_per_sec 限速；stop 置位后不再限速，尽快结束
+    """
+    task_dir = Path(task_dir)
+    throttle = _IOThrottle(io_ops_per_sec, stop if stop is not None else threading.Event())
+    before = tree_size(task_dir, throttle)
+    if mode == "off" or not before:
+        return before, before
+    project_dir = task_dir / "project"
+    if mode == "all":
+        targets = [project_dir, task_dir / "gradle-init.gradle"]
+    else:
+        targets = _prune_targets(project_dir) if project_dir.exists() else []
+    # zipalign 的中间文件，签名后的 APK 已单独生成
+    targets.append(task_dir / "output" / "app-release-aligned.apk")
+    reclaimed = sum(remove_tree(path, throttle) for path in targets)
+    return before, before - reclaimed
@@ -0,0 +1,622 @@
+"""
+构建日志存储
+日志与 BuildTask 分离：内存中只保留每个任务最近的若干行，完整日志在 logs/<task_id>.log，
+任务列表和任务持久化都不再携带日志；构建结束后日志压缩归档（见 log_archive），读取接口对归档透明
+"""
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from itertools import islice
+from pathlib import Path
+from typing import Callable, Deque, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from build_steps import StepEvent, StepMarker, StepTracker, match_step_marker
+from log_archive import ARCHIVE_SUFFIXES, LogArchive, archive_log, restore_log, select_codec
+
+# 内存中每个任务保留的最近日志行数
+LOG_TAIL_LINES = int(os.getenv("APK_BUILDER_LOG_TAIL_LINES", "500"))
+# 从文件末尾向前查找日志行时每次读取的块大小
+TAIL_BLOCK_SIZE = 64 * 1024
+# 构建结束后的日志压缩：gzip（默认）/ zstd / off
+LOG_COMPRESSION = select_codec(os.getenv("APK_BUILDER_LOG_COMPRESSION", "gzip"))
+
+# 日志文件批量写入：缓冲超过 LOG_FLUSH_BYTES 字节或距上次写入超过 LOG_FLUSH_INTERVAL 秒时落盘
+LOG_FLUSH_INTERVAL = float(os.getenv("APK_BUILDER_LOG_FLUSH_INTERVAL", "0.5"))
+LOG_FLUSH_BYTES = int(os.getenv("APK_BUILDER_LOG_FLUSH_BYTES", str(64 * 1024)))
+
+# 日志标记：写入时识别步骤开始 / 结束（见 build_steps）和错误 / 警告行，
+# 把字节偏移记录到旁路文件 <task_id>.log.marks（每行一个 JSON）
+LEVEL_PATTERN = re.compile(
+    r"(?P<error>(?i:\b(?:error|failed|failure|exception)\b)|错误|失败|异常)"
+    r"|(?P<warning>(?i:\bwarn(?:ing)?\b)|警告)"
+)
+
+
+# 先用子串查找过滤掉绝大多数普通行，只有可能匹配的行才跑正则
+_LEVEL_KEYWORDS = ("error", "fail", "exception", "warn", "错误", "失败", "异常", "警告")
+
+
+def _classify_level(line: str) -> Optional[str]:
+    lower = line.lower()
+    for keyword in _LEVEL_KEYWORDS:
+        if keyword in lower:
+            match = LEVEL_PATTERN.search(line)
+            return match.lastgroup if match else None
+    return None
+
+
+class ParsedLine(NamedTuple):
+    """一行日志的解析结果：步骤标记和错误 / 警告级别（步骤开始 / 结束行不再判断级别）"""
+    marker: Optional[StepMarker]
+    level: Optional[str]
+
+
+def parse_line(line: str) -> ParsedLine:
+    """
+    每行只解析一次：Docker 构建的输出循环解析后把结果交给步骤跟踪、输出级别过滤和日志写入器，
+    不再各自重新匹配
+    """
+    marker = match_step_marker(line)
+    level = _classify_level(line) if marker is None or marker.kind == "done" else None
+    return ParsedLine(marker, level)
+
+
+def classify_line(line: str, parsed: Optional[ParsedLine] = None) -> Optional[Tuple[str, Optional[int]]]:
+    """返回 ("step", 步骤号) / ("step_end", 步骤号) / ("error", None) / ("warning", None)，普通行返回 None"""
+    marker, level = parsed or parse_line(line)
+    if marker is not None and marker.kind != "done":
+        return ("step" if marker.kind == "start" else "step_end"), marker.step
+    return (level, None) if level else None
+
+
+class TaskLogWriter:
+    """单个任务的日志文件：构建期间保持文件打开，按大小 / 时间批量写入，构建结束时关闭"""
+
+    def __init__(
+        self,
+        path: Path,
+        flush_interval: float = LOG_FLUSH_INTERVAL,
+        flush_bytes: int = LOG_FLUSH_BYTES,
+        on_close: Optional[Callable[["TaskLogWriter"], None]] = None,
+    ):
+        self.path = Path(path)
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.on_close = on_close
+        self.marks_path = self.path.with_name(self.path.name + ".marks")
+        self._file = None
+        self._pending: List[bytes] = []
+        self._pending_bytes = 0
+        # 下一行在日志文件中的字节偏移（追加写入，从现有文件末尾开始）
+        try:
+            self._offset = self.path.stat().st_size
+        except OSError:
+            self._offset = 0
+        # 每次构建以 run 标记开头，读取时只使用最近一次构建的标记
+        self._start = self._offset
+        self._lines = 0  # 本次写入的行数，关闭时写入标记文件，重启后统计行数不用重新扫描日志
+        self._marks: List[str] = [_format_mark("run", self._offset)]
+        self._steps = StepTracker()
+        self._last_flush = time.monotonic()
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def write(self, line: str, parsed: Optional[ParsedLine] = None) -> None:
+        """parsed 为调用方已经解析好的结果（见 parse_line），为 None 时在这里解析"""
+        data = (line + "\n").encode("utf-8")
+        marker, level = parsed or parse_line(line)
+        with self._lock:
+            if self._closed:
+                # 关闭后（构建已结束、日志可能正在归档）不再写文件，内存中的日志尾部仍会记录
+                return
+            if marker is not None:
+                for event in self._steps.apply(marker):
+                    if event.type != "done":
+                        self._marks.append(_format_step_mark(event, self._offset))
+            elif level is not None:
+                self._marks.append(_format_mark(level, self._offset))
+            self._pending.append(data)
+            self._pending_bytes += len(data)
+            self._offset += len(data)
+            self._lines += data.count(b"\n")
+            if (
+                self._pending_bytes >= self.flush_bytes
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            ):
+                self._flush_locked()
+
+    def flush(self) -> None:
+        """立即写入缓冲的日志（步骤切换、构建结束时调用）"""
+        with self._lock:
+            self._flush_locked()
+
+    def finish_step(self, status: str) -> None:
+        """构建结束时结束当前步骤（status 为 ok / failed）"""
+        with self._lock:
+            if self._closed:
+                return
+            for event in self._steps.finish(status):
+                self._marks.append(_format_step_mark(event, self._offset))
+
+    def close(self) -> None:
+        """结束写入；重复调用时不做任何事"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._marks.append(_format_lines_mark(self._start, self._offset, self._lines))
+            self._flush_locked()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        if self.on_close:
+            self.on_close(self)
+
+    def _flush_locked(self) -> None:
+        self._last_flush = time.monotonic()
+        if self._pending:
+            if self._file is None:
+                # 第一次落盘时以追加模式打开
+                self._file = open(self.path, "ab")
+            self._file.write(b"".join(self._pending))
+            self._file.flush()
+            self._pending.clear()
+            self._pending_bytes = 0
+        if self._marks:
+            # 标记在对应的日志行落盘之后再写入，读取方看到的偏移总是有效的
+            with open(self.marks_path, "a", encoding="utf-8") as f:
+                f.write("".join(self._marks))
+            self._marks.clear()
+
+    def __enter__(self) -> "TaskLogWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def _format_mark(kind: str, offset: int, step: Optional[int] = None) -> str:
+    mark = {"type": kind, "offset": offset}
+    if step is not None:
+        mark["step"] = step
+    return json.dumps(mark, separators=(",", ":")) + "\n"
+
+
+def _format_lines_mark(start: int, size: int, count: int) -> str:
+    """日志 [start, size) 字节范围内的行数"""
+    return json.dumps({"type": "lines", "offset": start, "size": size, "count": count}, separators=(",", ":")) + "\n"
+
+
+def _format_step_mark(event: StepEvent, offset: int) -> str:
+    mark = {"type": "step" if event.type == "start" else "step_end", "offset": offset, "step": event.step}
+    if event.type == "start":
+        mark["name"] = event.name
+    else:
+        mark["status"] = event.status
+    mark["ts"] = round(event.timestamp, 3)
+    return json.dumps(mark, separators=(",", ":")) + "\n"
+
+
+class TaskLogStore:
+    """按任务保存最近的构建日志，内存中没有时回退到日志文件"""
+
+    def __init__(self, logs_dir: Path, max_lines: int = LOG_TAIL_LINES):
+        self.logs_dir = Path(logs_dir)
+        self.max_lines = max(1, max_lines)
+        # 定长环形缓冲区：追加 O(1)，超出容量时自动丢弃最旧的行
+        self._tails: Dict[str, Deque[str]] = {}
+        self._totals: Dict[str, int] = {}
+        # 正在构建的任务的日志文件写入器；按偏移量读取前先把缓冲写入文件
+        self._writers: Dict[str, TaskLogWriter] = {}
+        # 日志文件行数缓存：task_id -> (已统计的字节数, 行数)，文件增长时只统计新增部分
+        self._line_counts: Dict[str, Tuple[int, int]] = {}
+        self._archives: Dict[str, LogArchive] = {}
+        self.archive_stats = {"archived": 0, "size": 0, "compressed": 0}
+        self._lock = threading.Lock()
+        self._archive_lock = threading.Lock()  # 串行化归档和解压恢复
+
+    def log_path(self, task_id: str) -> Path:
+        return self.logs_dir / f"{task_id}.log"
+
+    def marks_path(self, task_id: str) -> Path:
+        return self.logs_dir / f"{task_id}.log.marks"
+
+    def index_path(self, task_id: str) -> Path:
+        return self.logs_dir / f"{task_id}.log.idx"
+
+    def capture_path(self, task_id: str) -> Path:
+        """构建工具的完整原始输出（见 build_output）"""
+        return self.logs_dir / f"{task_id}.log.raw.gz"
+
+    def log_files(self, task_id: str) -> List[Path]:
+        """任务的所有日志文件（普通日志、归档、索引和原始输出），删除任务时使用"""
+        paths = [self.log_path(task_id), self.index_path(task_id), self.marks_path(task_id), self.capture_path(task_id)]
+        paths += [self.logs_dir / f"{task_id}{suffix}" for suffix in ARCHIVE_SUFFIXES.values()]
+        return paths
+
+    def open_writer(self, task_id: str) -> TaskLogWriter:
+        # 重新构建（重试 / 更新版本）时先把归档恢复为普通文件，新日志继续追加
+        with self._archive_lock:
+            archive = self._archive(task_id)
+            if archive is not None:
+                try:
+                    if not self.log_path(task_id).exists():
+                        restore_log(archive, self.log_path(task_id))
+                        # 归档索引中的行数随归档一起删除，先记到标记文件
+                        with open(self.marks_path(task_id), "a", encoding="utf-8") as f:
+                            f.write(_format_lines_mark(0, archive.size, archive.lines))
+                    self._drop_archive(task_id, archive)
+                except OSError as exc:
+                    print(f"[TaskLogs] 恢复归档日志失败 {task_id}: {exc}")
+
+        def release(writer: TaskLogWriter) -> None:
+            with self._lock:
+                if self._writers.get(task_id) is writer:
+                    del self._writers[task_id]
+
+        writer = TaskLogWriter(self.log_path(task_id), on_close=release)
+        with self._lock:
+            self._writers[task_id] = writer
+        return writer
+
+    def flush_writer(self, task_id: str) -> None:
+        with self._lock:
+            writer = self._writers.get(task_id)
+        if writer is not None:
+            writer.flush()
+
+    def append(self, task_id: str, line: str) -> None:
+        with self._lock:
+            tail = self._tails.get(task_id)
+            if tail is None:
+                tail = self._tails[task_id] = deque(maxlen=self.max_lines)
+            tail.append(line)
+            self._totals[task_id] = self._totals.get(task_id, 0) + 1
+
+    def reset(self, task_id: str) -> None:
+        """开始新一轮构建（重试/更新版本）时清空内存中的日志"""
+        with self._lock:
+            self._tails[task_id] = deque(maxlen=self.max_lines)
+            self._totals[task_id] = 0
+
+    def discard(self, task_id: str) -> None:
+        with self._lock:
+            self._tails.pop(task_id, None)
+            self._totals.pop(task_id, None)
+            self._line_counts.pop(task_id, None)
+            self._archives.pop(task_id, None)
+
+    def tail(self, task_id: str, lines: int = 100) -> Tuple[List[str], int]:
+        """返回最近 lines 行日志和日志总行数"""
+        lines = max(0, lines)
+        with self._lock:
+            tail = self._tails.get(task_id)
+            if tail:
+                selected = list(islice(tail, max(0, len(tail) - lines), None)) if lines else []
+                return selected, self._totals.get(task_id, len(tail))
+
+        # 内存中没有（例如后端重启后），从日志文件（或归档）末尾向前读取
+        archive = self._archive(task_id)
+        if archive is not None:
+            selected = _read_last_lines(archive.read, archive.size, lines) if lines else []
+            return selected, archive.lines
+        log_file = self.log_path(task_id)
+        if not log_file.exists():
+            return [], 0
+        with open(log_file, "rb") as f:
+            size = f.seek(0, os.SEEK_END)
+            selected = _read_last_lines(_file_reader(f), size, lines) if lines else []
+        return selected, self._count_lines(task_id, log_file, size)
+
+    def log_size(self, task_id: str) -> int:
+        """日志当前大小（先写入缓冲中的日志），客户端可以从这里开始增量读取"""
+        self.flush_writer(task_id)
+        archive = self._archive(task_id)
+        if archive is not None:
+            return archive.size
+        try:
+            return self.log_path(task_id).stat().st_size
+        except OSError:
+            return 0
+
+    def read_from(self, task_id: str, offset: int, max_bytes: int) -> Tuple[List[str], int, int]:
+        """
+        从字节偏移 offset 开始读取最多 max_bytes 字节的完整日志行
+        返回 (日志行, 下一次读取的偏移量, 文件大小)；末尾不完整的行留到下一次读取
+        """
+        self.flush_writer(task_id)
+        archive = self._archive(task_id)
+        if archive is not None:
+            size = archive.size
+            offset = min(max(0, offset), size)
+            chunk = archive.read(offset, offset + max(1, max_bytes))
+        else:
+            log_file = self.log_path(task_id)
+            if not log_file.exists():
+                return [], 0, 0
+            with open(log_file, "rb") as f:
+                size = f.seek(0, os.SEEK_END)
+                offset = min(max(0, offset), size)
+                f.seek(offset)
+                chunk = f.read(max(1, max_bytes))
+        end = chunk.rfind(b"\n") + 1
+        if end == 0:
+            # 单行超过 max_bytes 时整块返回，保证每次读取都有进展
+            end = len(chunk) if len(chunk) >= max_bytes else 0
+        return _decode_lines(chunk[:end]), offset + end, size
+
+    def _count_lines(self, task_id: str, log_file: Path, size: int) -> int:
+        with self._lock:
+            cached = self._line_counts.get(task_id)
+        # 后端重启后先用标记文件中记录的行数，只统计之后追加的部分
+        counted, count = cached if cached is not None else self._recorded_lines(task_id)
+        if counted > size:
+            counted, count = 0, 0  # 文件被替换或截断，重新统计
+        if counted < size:
+            with open(log_file, "rb") as f:
+                f.seek(counted)
+                while counted < size:
+                    block = f.read(min(TAIL_BLOCK_SIZE * 16, size - counted))
+                    if not block:
+                        break
+                    count += block.count(b"\n")
+                    counted += len(block)
+            with self._lock:
+                self._line_counts[task_id] = (counted, count)
+        return count
+
+
+    def _recorded_lines(self, task_id: str) -> Tuple[int, int]:
+        """标记文件中记录的行数：把每次写入的 [offset, size) 范围从文件开头依次连接，返回 (字节数, 行数)"""
+        ranges: Dict[int, Tuple[int, int]] = {}
+        try:
+            with open(self.marks_path(task_id), "r", encoding="utf-8") as f:
+                for raw in f:
+                    if '"lines"' not in raw:
+                        continue
+                    try:
+                        mark = json.loads(raw)
+                        ranges[mark["offset"]] = (mark["size"], mark["count"])
+                    except (ValueError, KeyError, TypeError):
+                        continue
+        except OSError:
+            return 0, 0
+        counted = count = 0
+        while counted in ranges and ranges[counted][0] > counted:
+            size, lines = ranges.pop(counted)
+            counted, count = size, count + lines
+        return counted, count
+
+    # ---- 步骤 / 错误行索引 ----
+
+    def _read_range(self, task_id: str, start: int, end: int) -> Tuple[bytes, int]:
+        """读取日志 [start, end) 范围的字节（归档透明），返回 (数据, 日志大小)"""
+        archive = self._archive(task_id)
+        if archive is not None:
+            return archive.read(start, end), archive.size
+        try:
+            with open(self.log_path(task_id), "rb") as f:
+                size = f.seek(0, os.SEEK_END)
+                return _file_reader(f)(min(start, size), min(end, size)), size
+        except OSError:
+            # 普通日志可能刚被归档删除
+            archive = self._archive(task_id)
+            if archive is not None:
+                return archive.read(start, end), archive.size
+            return b"", 0
+
+    def iter_lines(self, task_id: str, block_size: int = 1024 * 1024) -> Iterator[Tuple[int, str]]:
+        """按块顺序读取完整日志（归档透明），逐行返回 (字节偏移, 日志行)"""
+        offset = 0
+        while True:
+            data, size = self._read_range(task_id, offset, offset + block_size)
+            if not data:
+                return
+            cut = data.rfind(b"\n") + 1
+            if cut == 0:
+                cut = len(data)  # 超长行或文件末尾没有换行
+            line_offset = offset
+            for raw in data[:cut].split(b"\n"):
+                if line_offset >= offset + cut:
+                    break
+                yield line_offset, raw.decode("utf-8", errors="replace").rstrip("\r")
+                line_offset += len(raw) + 1
+            offset += cut
+            if offset >= size:
+                return
+
+    def log_marks(self, task_id: str) -> dict:
+        """
+        最近一次构建的日志标记：{"steps": [{step, offset, name, started, ended, status}], "error": [偏移], "warning": [偏移]}
+        （旧日志的标记没有名称和时间，对应字段为 None）
+        """
+        self.flush_writer(task_id)
+        marks = {"steps": [], "error": [], "warning": []}
+        try:
+            f = open(self.marks_path(task_id), "r", encoding="utf-8")
+        except OSError:
+            return marks
+        with f:
+            for raw in f:
+                try:
+                    mark = json.loads(raw)
+                except ValueError:
+                    continue
+                kind = mark.get("type")
+                if kind == "run":
+                    marks = {"steps": [], "error": [], "warning": []}
+                elif kind == "step":
+                    # 同一步骤连续出现多次时只保留第一次
+                    if not marks["steps"] or marks["steps"][-1]["step"] != mark["step"]:
+                        marks["steps"].append({
+                            "step": mark["step"],
+                            "offset": mark["offset"],
+                            "name": mark.get("name"),
+                            "started": mark.get("ts"),
+                            "ended": None,
+                            "status": None,
+                        })
+                elif kind == "step_end":
+                    if marks["steps"] and marks["steps"][-1]["step"] == mark.get("step"):
+                        marks["steps"][-1]["ended"] = mark.get("ts")
+                        marks["steps"][-1]["status"] = mark.get("status")
+                elif kind in ("error", "warning"):
+                    marks[kind].append(mark["offset"])
+        return marks
+
+    def step_sections(self, task_id: str, marks: Optional[dict] = None) -> List[dict]:
+        """每个步骤在日志中的字节范围 [start, end)，以及步骤名称、起止时间和结果"""
+        marks = marks or self.log_marks(task_id)
+        steps = marks["steps"]
+        if not steps:
+            return []
+        size = self.log_size(task_id)
+        sections = []
+        for pos, step in enumerate(steps):
+            started, ended = step["started"], step["ended"]
+            sections.append({
+                "step": step["step"],
+                "name": step["name"],
+                "start": step["offset"],
+                "end": steps[pos + 1]["offset"] if pos + 1 < len(steps) else size,
+                "started": started,
+                "ended": ended,
+                "duration": round(ended - started, 3) if started is not None and ended is not None else None,
+                "status": step["status"],
+            })
+        return sections
+
+    def read_section(self, task_id: str, step: int, max_bytes: int) -> Optional[dict]:
+        """读取某个步骤的日志（最后一次出现的该步骤），只读取该步骤的字节范围"""
+        sections = [section for section in self.step_sections(task_id) if section["step"] == step]
+        if not sections:
+            return None
+        section = sections[-1]
+        end = min(section["end"], section["start"] + max(1, max_bytes))
+        data, _ = self._read_range(task_id, section["start"], end)
+        truncated = end < section["end"]
+        return {**section, "logs": _complete_lines(data, truncated), "truncated": truncated}
+
+    def _line_at(self, task_id: str, offset: int, max_length: int = 4096) -> str:
+        data, _ = self._read_range(task_id, offset, offset + max_length)
+        end = data.find(b"\n")
+        return data[:end if end >= 0 else len(data)].decode("utf-8", errors="replace").rstrip("\r")
+
+    def level_lines(self, task_id: str, level: str = "error", limit: int = 500) -> Tuple[List[dict], int]:
+        """最近一次构建中的错误（或警告）行，每行只按索引中的偏移读取，返回 (行列表, 总数)"""
+        offsets = self.log_marks(task_id).get(level, [])
+        lines = [{"offset": offset, "line": self._line_at(task_id, offset)} for offset in offsets[:max(0, limit)]]
+        return lines, len(offsets)
+
+    def error_region(self, task_id: str, max_lines: int = 50) -> List[str]:
+        """
+        失败报告用的错误区域：从失败步骤（最后一个步骤）中的第一条错误行开始的 max_lines 行；
+        该步骤没有错误行时从最后一条错误行开始；没有任何错误行时返回空列表
+        """
+        marks = self.log_marks(task_id)
+        errors = marks["error"]
+        if not errors:
+            return []
+        sections = self.step_sections(task_id, marks)
+        last_start = sections[-1]["start"] if sections else 0
+        in_last_step = [offset for offset in errors if offset >= last_start]
+        start = in_last_step[0] if in_last_step else errors[-1]
+        limit = max_lines * 1024
+        data, _ = self._read_range(task_id, start, start + limit)
+        return _complete_lines(data, len(data) >= limit)[:max_lines]
+
+    # ---- 归档 ----
+
+    def _archive(self, task_id: str) -> Optional[LogArchive]:
+        archive = self._archives.get(task_id)
+        if archive is not None:
+            return archive
+        index_path = self.index_path(task_id)
+        if not index_path.exists():
+            return None
+        archive = LogArchive.open(index_path)
+        if archive is not None:
+            with self._lock:
+                self._archives[task_id] = archive
+        return archive
+
+    def _drop_archive(self, task_id: str, archive: LogArchive) -> None:
+        with self._lock:
+            self._archives.pop(task_id, None)
+        # 先删索引：索引不存在时读取方就不会再使用归档
+        self.index_path(task_id).unlink(missing_ok=True)
+        archive.path.unlink(missing_ok=True)
+
+    def archive(self, task_id: str) -> Optional[dict]:
+        """压缩已结束任务的日志（在后台线程中调用），返回压缩前后的大小；不需要归档时返回 None"""
+        if LOG_COMPRESSION is None:
+            return None
+        with self._archive_lock:
+            with self._lock:
+                if task_id in self._writers:
+                    return None  # 又开始了新的构建
+            log_file = self.log_path(task_id)
+            if not log_file.exists() or self.index_path(task_id).exists():
+                return None
+            archive_path = self.logs_dir / f"{task_id}{ARCHIVE_SUFFIXES[LOG_COMPRESSION]}"
+            stats = archive_log(log_file, archive_path, self.index_path(task_id), LOG_COMPRESSION)
+            try:
+                log_file.unlink()
+            except OSError:
+                pass  # Windows 下文件可能正被读取；读取时优先使用归档，删除任务时一并清理
+            with self._lock:
+                self._line_counts.pop(task_id, None)
+                self.archive_stats["archived"] += 1
+                self.archive_stats["size"] += stats["size"]
+                self.archive_stats["compressed"] += stats["compressed"]
+        saved = stats["size"] - stats["compressed"]
+        ratio = stats["compressed"] / stats["size"] if stats["size"] else 1.0
+        print(
+            f"[TaskLogs] 已压缩任务 {task_id} 的日志（{LOG_COMPRESSION}）: "
+            f"{stats['size'] / 1024:.0f} KB -> {stats['compressed'] / 1024:.0f} KB，"
+            f"节省 {saved / 1024:.0f} KB（压缩后为原来的 {ratio:.0%}）"
+        )
+        return stats
+
+
+def _file_reader(f) -> Callable[[int, int], bytes]:
+    def read(start: int, end: int) -> bytes:
+        f.seek(start)
+        return f.read(end - start)
+
+    return read
+
+
+def _decode_lines(data: bytes) -> List[str]:
+    return [line.rstrip("\r") for line in data.decode("utf-8", errors="replace").split("\n")[:-1]] if data else []
+
+
+def _complete_lines(data: bytes, truncated: bool) -> List[str]:
+    """解码日志行；读取被截断时去掉末尾不完整的行"""
+    if truncated:
+        cut = data.rfind(b"\n") + 1
+        if cut:
+            data = data[:cut]
+    if data and not data.endswith(b"\n"):
+        data += b"\n"
+    return _decode_lines(data)
+
+
+def _read_last_lines(read: Callable[[int, int], bytes], size: int, lines: int) -> List[str]:
+    """从末尾按块向前读取，直到凑够 lines 行，不需要读取整个文件；read(start, end) 返回该范围的字节"""
+    end = size
+    data = b""
+    # 文件末尾的换行符属于最后一行，不计入
+    while end > 0 and data.count(b"\n", 0, max(0, len(data) - 1)) < lines:
+        start = max(0, end - TAIL_BLOCK_SIZE)
+        data = read(start, end) + data
+        end = start
+    if not data.endswith(b"\n"):
+        data += b"\n"
+    selected = _decode_lines(data)
+    if end > 0:
+        selected = selected[1:]  # 第一行可能不完整
+    return selected[-lines:]
@@ -0,0 +1,807 @@
+"""
+任务存储模块
+tasks_db 的持久化实现：内存中保存 TaskRecord，只持久化发生变化的任务，
+避免每次状态变化都重写整个 tasks.json
+- sqlite:  按行 upsert 到 SQLite（WAL 模式，默认）
+- journal: 追加写变更日志，定期生成快照并截断日志
+"""
+import bisect
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional
+
+from models import TaskRecord, TaskStatus
+from task_codec import decode_task, dumps, loads, task_to_dict
+
+
+def _reset_interrupted(task: TaskRecord) -> TaskRecord:
+    if task.status_code == TaskStatus.PROCESSING:
+        task.status_code = TaskStatus.PENDING
+        task.message = "上次运行中断，等待重新开始"
+        task.touch()
+    return task
+
+
+def task_from_dict(data: dict) -> TaskRecord | None:
+    try:
+        return _reset_interrupted(TaskRecord.from_dict(data))
+    except Exception:
+        return None
+
+
+def task_from_json(raw) -> TaskRecord | None:
+    """解析持久化的 JSON 文本"""
+    task = decode_task(raw)
+    return _reset_interrupted(task) if task is not None else None
+
+
+class TaskSummary(NamedTuple):
+    """不解析任务记录就能得到的字段（回收、日志索引补齐等遍历全部任务的场景使用）"""
+    id: str
+    client_id: str
+    status_code: TaskStatus
+    created_ts: float
+    updated_ts: float
+
+
+def _parse_ts(value) -> float:
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except (ValueError, OverflowError, OSError):
+        return 0.0
+
+
+def _parse_status(value) -> TaskStatus:
+    try:
+        return TaskStatus[str(value).upper()]
+    except KeyError:
+        return TaskStatus.PENDING
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id TEXT PRIMARY KEY,
+    client_id TEXT NOT NULL DEFAULT '',
+    status TEXT NOT NULL DEFAULT 'pending',
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_client_id ON tasks(client_id);
+CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status);
+CREATE INDEX IF NOT EXISTS idx_tasks_updated_at ON tasks(updated_at);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+_UPSERT_SQL = """
+INSERT INTO tasks (id, client_id, status, created_at, updated_at, data)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT(id) DO UPDATE SET
+    client_id = excluded.client_id,
+    status = excluded.status,
+    created_at = excluded.created_at,
+    updated_at = excluded.updated_at,
+    data = excluded.data
+"""
+
+
+def _task_row(task: TaskRecord) -> tuple:
+    data = task_to_dict(task)
+    return (
+        task.id,
+        task.client_id or "",
+        data["status"],
+        data["created_at"],
+        data["updated_at"],
+        dumps(data).decode("utf-8"),
+    )
+
+
+class TaskStore(MutableMapping):
+    """
+    任务存储基类
+    - 对外保持 dict 接口（task_id -> TaskRecord），可直接替换原来的 tasks_db
+    - 修改过的任务记为 dirty，flush 时只写入这些任务
+    - 维护 client_id -> 按 created_at 排序的任务索引，列表查询不再扫描全部任务
+    - 每次变化递增全局修订号，并记录每个任务 / 每个客户端最近一次变化的修订号（用于 ETag）
+    - 按修订号顺序保存最近变化的任务和删除记录，增量同步只遍历变化部分
+    - 启动时只加载轻量索引，TaskRecord 在第一次访问时才解析；任务目录校验在后台线程池中进行
+    """
+
+    def __init__(self, legacy_json_path: Optional[Path] = None):
+        self.legacy_json_path = Path(legacy_json_path) if legacy_json_path else None
+        self._tasks: dict[str, TaskRecord] = {}
+        # 尚未解析的任务：task_id -> (client_id, created_at 时间戳, 原始数据, 状态, updated_at 时间戳)
+        self._raw: dict[str, tuple[str, float, object, TaskStatus, float]] = {}
+        self.load_stats: dict = {}
+        self._client_index: dict[str, list[tuple[float, str]]] = {}
+        self._dirty: set[str] = set()
+        self._deleted: set[str] = set()
+        # 修订号只在内存中递增，epoch 区分不同的进程生命周期
+        self.epoch = uuid.uuid4().hex[:8]
+        self._revision = 0
+        # task_id -> 修订号，按修订号升序（每次变化移到末尾）
+        self._task_revisions: "OrderedDict[str, int]" = OrderedDict()
+        self._client_revisions: dict[str, int] = {}
+        # 已删除任务：task_id -> (修订号, client_id)，只保留最近 max_tombstones 条
+        self._tombstones: "OrderedDict[str, tuple[int, str]]" = OrderedDict()
+        self._tombstone_floor = 0  # 早于该修订号的删除记录已丢弃
+        self.max_tombstones = 10000
+        self._lock = threading.RLock()  # 保护内存字典和 dirty 集合
+        self._write_lock = threading.RLock()  # 串行化落盘，编码和写入时不持有 _lock
+
+    # ---- dict 接口 ----
+
+    def __getitem__(self, task_id: str) -> TaskRecord:
+        task = self._tasks.get(task_id)
+        if task is None:
+            task = self._hydrate(task_id)
+        return task
+
+    def __setitem__(self, task_id: str, task: TaskRecord) -> None:
+        with self._lock:
+            previous = self._pop_entry(task_id)
+            self._tasks[task_id] = task
+            self._index_add(task.client_id, task.created_ts, task_id)
+            self._deleted.discard(task_id)
+            self._dirty.add(task_id)
+            if previous is not None and previous[0] != (task.client_id or ""):
+                self._bump(task_id, previous[0])
+            self._bump(task_id, task.client_id)
+
+    def __delitem__(self, task_id: str) -> None:
+        with self._lock:
+            previous = self._pop_entry(task_id)
+            if previous is None:
+                raise KeyError(task_id)
+            client_id = previous[0]
+            self._dirty.discard(task_id)
+            self._deleted.add(task_id)
+            revision = self._bump(task_id, client_id)
+            self._task_revisions.pop(task_id, None)
+            self._tombstones[task_id] = (revision, client_id)
+            while len(self._tombstones) > self.max_tombstones:
+                _, (dropped, _) = self._tombstones.popitem(last=False)
+                self._tombstone_floor = dropped
+
+    def __contains__(self, task_id: object) -> bool:
+        return task_id in self._tasks or task_id in self._raw
+
+    def __iter__(self) -> Iterator[str]:
+        # 返回快照，避免构建线程遍历时与请求线程的增删冲突
+        with self._lock:
+            return iter(list(self._tasks) + list(self._raw))
+
+    def __len__(self) -> int:
+        return len(self._tasks) + len(self._raw)
+
+    def _pop_entry(self, task_id: str) -> Optional[tuple[str, float]]:
+        """移除任务（不解析）并返回它的 (client_id, created_at)"""
+        task = self._tasks.pop(task_id, None)
+        if task is not None:
+            entry = (task.client_id or "", task.created_ts)
+        elif task_id in self._raw:
+            client_id, created_at = self._raw.pop(task_id)[:2]
+            entry = (client_id, created_at)
+        else:
+            return None
+        self._index_remove(entry[0], entry[1], task_id)
+        return entry
+
+    def _hydrate(self, task_id: str) -> TaskRecord:
+        """第一次访问时把原始数据解析为 TaskRecord"""
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is not None:
+                return task
+            client_id, created_at, raw = self._raw.pop(task_id)[:3]
+            if isinstance(raw, (str, bytes)):
+                task = task_from_json(raw)
+            else:
+                task = task_from_dict(dict(raw))
+            if task is None:
+                # 数据损坏：从索引中去掉，下次 flush 时删除
+                self._index_remove(client_id, created_at, task_id)
+                self._deleted.add(task_id)
+                raise KeyError(task_id)
+            if task.created_ts != created_at or (task.client_id or "") != client_id:
+                self._index_remove(client_id, created_at, task_id)
+                self._index_add(task.client_id, task.created_ts, task_id)
+            self._tasks[task_id] = task
+            return task
+
+    # ---- client_id 索引 ----
+
+    def _index_add(self, client_id: Optional[str], created_at: float, task_id: str) -> None:
+        entries = self._client_index.setdefault(client_id or "", [])
+        bisect.insort(entries, (created_at, task_id))
+
+    def _index_remove(self, client_id: Optional[str], created_at: float, task_id: str) -> None:
+        client_id = client_id or ""
+        entries = self._client_index.get(client_id)
+        if not entries:
+            return
+        key = (created_at, task_id)
+        pos = bisect.bisect_left(entries, key)
+        if pos < len(entries) and entries[pos] == key:
+            del entries[pos]
+        if not entries:
+            del self._client_index[client_id]
+
+    def task_ids_for_client(self, client_id: str) -> List[str]:
+        """按 created_at 升序返回某个客户端的任务ID"""
+        with self._lock:
+            return [task_id for _, task_id in self._client_index.get(client_id, ())]
+
+    def tasks_for_client(self, client_id: str) -> List[TaskRecord]:
+        tasks = (self.get(task_id) for task_id in self.task_ids_for_client(client_id))
+        return [task for task in tasks if task is not None]
+
+    # ---- 不解析任务的摘要 ----
+
+    def summary(self, task_id: str) -> Optional[TaskSummary]:
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is not None:
+                return TaskSummary(task.id, task.client_id or "", task.status_code, task.created_ts, task.updated_ts)
+            entry = self._raw.get(task_id)
+            if entry is None:
+                return None
+            client_id, created_at, _, status, updated_at = entry
+            return TaskSummary(task_id, client_id, status, created_at, updated_at)
+
+    def summaries(self) -> List[TaskSummary]:
+        """全部任务的摘要：已解析的任务读取字段，其余使用加载索引时的状态和时间，不触发解析"""
+        with self._lock:
+            items = [
+                TaskSummary(task.id, task.client_id or "", task.status_code, task.created_ts, task.updated_ts)
+                for task in self._tasks.values()
+            ]
+            items += [
+                TaskSummary(task_id, client_id, status, created_at, updated_at)
+                for task_id, (client_id, created_at, _, status, updated_at) in self._raw.items()
+            ]
+        return items
+
+    # ---- 修订号 ----
+
+    def _bump(self, task_id: str, client_id: Optional[str]) -> int:
+        self._revision += 1
+        self._task_revisions[task_id] = self._revision
+        self._task_revisions.move_to_end(task_id)
+        self._tombstones.pop(task_id, None)
+        self._client_revisions[client_id or ""] = self._revision
+        return self._revision
+
+    @property
+    def revision(self) -> int:
+        return self._revision
+
+    def task_revision(self, task_id: str) -> int:
+        return self._task_revisions.get(task_id, 0)
+
+    def client_revision(self, client_id: str) -> int:
+        return self._client_revisions.get(client_id or "", 0)
+
+    def changes_since(self, client_id: str, since: int) -> Optional[tuple[List[TaskRecord], List[str], int]]:
+        """
+        返回某个客户端在修订号 since 之后变化的任务、删除的任务ID和当前修订号
+        since 超出可追溯范围（删除记录已丢弃或大于当前修订号）时返回 None，调用方需全量同步
+        """
+        client_id = client_id or ""
+        with self._lock:
+            if since > self._revision or since < self._tombstone_floor:
+                return None
+            changed: List[TaskRecord] = []
+            for task_id in reversed(self._task_revisions):
+                if self._task_revisions[task_id] <= since:
+                    break
+                task = self.get(task_id)
+                if task is not None and (task.client_id or "") == client_id:
+                    changed.append(task)
+            deleted: List[str] = []
+            for task_id in reversed(self._tombstones):
+                revision, owner = self._tombstones[task_id]
+                if revision <= since:
+                    break
+                if owner == client_id:
+                    deleted.append(task_id)
+            changed.reverse()
+            deleted.reverse()
+            return changed, deleted, self._revision
+
+    # ---- 持久化 ----
+
+    def mark_dirty(self, task_id: str) -> None:
+        """任务被修改后调用：登记待写入并递增修订号"""
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is not None:
+                # 未解析的任务不可能被修改过，不需要登记
+                self._dirty.add(task_id)
+                self._bump(task_id, task.client_id)
+
+    def flush(self, task_ids: Optional[Iterable[str]] = None, sync: bool = False) -> None:
+        """写入 dirty 的任务（以及显式传入的 task_ids）和待删除的任务"""
+        with self._write_lock:
+            with self._lock:
+                if task_ids:
+                    for task_id in task_ids:
+                        if task_id in self._tasks:
+                            self._dirty.add(task_id)
+                if not self._dirty and not self._deleted:
+                    return
+                changed = [self._tasks[task_id] for task_id in self._dirty if task_id in self._tasks]
+                deleted = list(self._deleted)
+                self._dirty.clear()
+                self._deleted.clear()
+            try:
+                self._write_changes(changed, deleted, sync)
+            except Exception:
+                with self._lock:
+                    self._dirty.update(task.id for task in changed if task.id in self._tasks)
+                    self._deleted.update(task_id for task_id in deleted if task_id not in self._tasks)
+                raise
+
+    def load(self) -> None:
+        """
+        加载任务索引（client_id / created_at / 原始数据），不解析任务记录
+        只有上次中断（processing）或带旧日志字段的任务会立即解析并写回
+        """
+        started = time.perf_counter()
+        hydrated = 0
+        with self._lock:
+            for task_id, client_id, status, created_at, updated_at, raw in self._read_index():
+                created = _parse_ts(created_at)
+                self._raw[task_id] = (client_id or "", created, raw, _parse_status(status), _parse_ts(updated_at))
+                self._index_add(client_id, created, task_id)
+                self._bump(task_id, client_id)
+                if status == "processing" or (isinstance(raw, dict) and "logs" in raw):
+                    # 中断的任务需重置为 pending / 旧数据中带有日志，需要写回
+                    try:
+                        self._hydrate(task_id)
+                    except KeyError:
+                        continue
+                    self._dirty.add(task_id)
+                    hydrated += 1
+            count = len(self._raw) + len(self._tasks)
+        self.flush(sync=True)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.load_stats = {"tasks": count, "hydrated": hydrated, "index_ms": round(elapsed_ms, 1)}
+        print(f"[TaskStore] 已加载 {count} 个任务索引（立即解析 {hydrated} 个），用时 {elapsed_ms:.1f}ms")
+
+    def verify_tasks(self, keep: Callable[[str], bool], max_workers: int = 8) -> List[str]:
+        """用有界线程池并发检查任务（如任务目录是否存在），删除 keep 返回 False 的任务"""
+        started = time.perf_counter()
+        task_ids = list(self)
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="TaskVerify") as pool:
+            results = list(pool.map(keep, task_ids))
+        removed = []
+        with self._lock:
+            for task_id, ok in zip(task_ids, results):
+                if not ok and task_id in self:
+                    del self[task_id]
+                    removed.append(task_id)
+        if removed:
+            self.flush()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.load_stats.update({"verified": len(task_ids), "removed": len(removed), "verify_ms": round(elapsed_ms, 1)})
+        print(f"[TaskStore] 已校验 {len(task_ids)} 个任务目录，移除 {len(removed)} 个，用时 {elapsed_ms:.1f}ms")
+        return removed
+
+    def _read_legacy_json(self) -> list:
+        if not self.legacy_json_path or not self.legacy_json_path.exists():
+            return []
+        try:
+            data = json.loads(self.legacy_json_path.read_text(encoding="utf-8"))
+        except Exception:
+            return []
+        return [item for item in data if isinstance(item, dict)] if isinstance(data, list) else []
+
+    def _retire_legacy_json(self, count: int) -> None:
+        try:
+            self.legacy_json_path.replace(self.legacy_json_path.with_suffix(".json.migrated"))
+        except Exception:
+            pass
+        print(f"[TaskStore] 已从 {self.legacy_json_path.name} 迁移 {count} 个任务")
+
+    def _read_all(self) -> Iterable[dict]:
+        raise NotImplementedError
+
+    def _read_index(self) -> Iterable[tuple]:
+        """返回 (id, client_id, status, created_at, updated_at, 原始数据)；子类可以跳过 JSON 解析"""
+        for item in self._read_all():
+            if isinstance(item, dict) and item.get("id"):
+                yield (
+                    item["id"], item.get("client_id") or "", item.get("status"),
+                    item.get("created_at"), item.get("updated_at"), item,
+                )
+
+    def _write_changes(self, changed: List[TaskRecord], deleted: List[str], sync: bool) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class SqliteTaskStore(TaskStore):
+    """基于 SQLite 的任务存储（WAL 模式，按行 upsert）"""
+
+    def __init__(self, db_path: Path, legacy_json_path: Optional[Path] = None):
+        super().__init__(legacy_json_path)
+        self.db_path = Path(db_path)
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _write_changes(self, changed: List[TaskRecord], deleted: List[str], sync: bool) -> None:
+        rows = [_task_row(task) for task in changed]
+        conn = self._connect()
+        conn.execute("BEGIN")
+        try:
+            if rows:
+                conn.executemany(_UPSERT_SQL, rows)
+            if deleted:
+                conn.executemany("DELETE FROM tasks WHERE id = ?", [(task_id,) for task_id in deleted])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _migrate_legacy_json(self, conn: sqlite3.Connection) -> None:
+        """一次性把旧版 tasks.json 导入 SQLite，完成后重命名为 tasks.json.migrated"""
+        if not self.legacy_json_path or not self.legacy_json_path.exists():
+            return
+        done = conn.execute("SELECT value FROM meta WHERE key = 'migrated_from_json'").fetchone()
+        if done:
+            return
+        rows = []
+        for item in self._read_legacy_json():
+            task = task_from_dict(item)
+            if task:
+                rows.append(_task_row(task))
+        conn.execute("BEGIN")
+        try:
+            if rows:
+                conn.executemany(_UPSERT_SQL, rows)
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_from_json', ?)",
+                (datetime.now().isoformat(),),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._retire_legacy_json(len(rows))
+
+    def _read_all(self) -> Iterable[dict]:
+        conn = self._connect()
+        self._migrate_legacy_json(conn)
+        for (raw,) in conn.execute("SELECT data FROM tasks ORDER BY created_at").fetchall():
+            try:
+                yield loads(raw)
+            except Exception:
+                continue
+
+    def _read_index(self) -> Iterable[tuple]:
+        conn = self._connect()
+        self._migrate_legacy_json(conn)
+        yield from conn.execute(
+            "SELECT id, client_id, status, created_at, updated_at, data FROM tasks ORDER BY created_at"
+        ).fetchall()
+
+    def close(self) -> None:
+        with self._write_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class JournalTaskStore(TaskStore):
+    """
+    基于追加日志的任务存储
+    - 每次 flush 只把变化的字段追加到 tasks.journal（一行一个 JSON）
+    - fsync 按时间间隔批量执行；状态切换等关键写入可要求立即 fsync
+    - 日志超过阈值时写入快照 tasks.snapshot.json 并截断日志
+    """
+
+    def __init__(
+        self,
+        snapshot_path: Path,
+        journal_path: Path,
+        legacy_json_path: Optional[Path] = None,
+        fsync_interval: float = 1.0,
+        compact_bytes: int = 8 * 1024 * 1024,
+    ):
+        super().__init__(legacy_json_path)
+        self.snapshot_path = Path(snapshot_path)
+        self.journal_path = Path(journal_path)
+        self.fsync_interval = fsync_interval
+        self.compact_bytes = compact_bytes
+        self._persisted: dict[str, dict] = {}  # 已落盘的任务数据，用于计算增量
+        self._seq = 0
+        self._journal = None
+        self._journal_bytes = 0
+        self._last_fsync = 0.0
+
+    def _open_journal(self):
+        if self._journal is None:
+            self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+            self._journal = open(self.journal_path, "ab")
+            self._journal_bytes = self._journal.tell()
+        return self._journal
+
+    def _task_delta(self, task: TaskRecord) -> Optional[dict]:
+        data = task_to_dict(task)
+        old = self._persisted.get(task.id)
+        self._persisted[task.id] = data
+        # 新记录或有字段被移除（例如旧版的 logs）时写入完整记录，重放时整体替换
+        if old is None or any(key not in data for key in old):
+            return {"op": "put", "id": task.id, "fields": data, "full": True}
+        fields = {key: value for key, value in data.items() if old.get(key) != value}
+        if not fields:
+            return None
+        return {"op": "put", "id": task.id, "fields": fields}
+
+    def _write_changes(self, changed: List[TaskRecord], deleted: List[str], sync: bool) -> None:
+        entries = []
+        for task in changed:
+            entry = self._task_delta(task)
+            if entry:
+                entries.append(entry)
+        for task_id in deleted:
+            self._persisted.pop(task_id, None)
+            entries.append({"op": "del", "id": task_id})
+        if not entries:
+            return
+        chunks = []
+        for entry in entries:
+            self._seq += 1
+            entry["seq"] = self._seq
+            chunks.append(dumps(entry))
+        payload = b"\n".join(chunks) + b"\n"
+        journal = self._open_journal()
+        journal.write(payload)
+        journal.flush()
+        self._journal_bytes += len(payload)
+        now = time.monotonic()
+        if sync or (now - self._last_fsync) >= self.fsync_interval:
+            os.fsync(journal.fileno())
+            self._last_fsync = now
+        if self._journal_bytes >= self.compact_bytes:
+            self.compact()
+
+    def compact(self) -> None:
+        """写入完整快照并截断日志"""
+        with self._write_lock:
+            snapshot = {"seq": self._seq, "tasks": list(self._persisted.values())}
+            self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.snapshot_path.with_suffix(".json.tmp")
+            with open(tmp_path, "wb") as f:
+                f.write(dumps(snapshot))
+                f.flush()
+                os.fsync(f.fileno())
+            tmp_path.replace(self.snapshot_path)
+            # 快照已包含日志中的全部变更；截断前崩溃也没关系，重放时会跳过 seq 不大于快照的条目
+            journal = self._open_journal()
+            journal.truncate(0)
+            journal.seek(0)
+            os.fsync(journal.fileno())
+            self._journal_bytes = 0
+            self._last_fsync = time.monotonic()
+
+    def _read_all(self) -> Iterable[dict]:
+        state: dict[str, dict] = {}
+        snapshot_seq = 0
+        migrated = False
+        if self.snapshot_path.exists():
+            try:
+                snapshot = loads(self.snapshot_path.read_bytes())
+                snapshot_seq = int(snapshot.get("seq", 0))
+                for item in snapshot.get("tasks", []):
+                    if isinstance(item, dict) and item.get("id"):
+                        state[item["id"]] = item
+            except Exception as exc:
+                print(f"[TaskStore] 读取任务快照失败: {exc}")
+        elif not self.journal_path.exists():
+            for item in self._read_legacy_json():
+                if item.get("id"):
+                    state[item["id"]] = item
+            migrated = bool(self.legacy_json_path and self.legacy_json_path.exists())
+
+        seq = snapshot_seq
+        if self.journal_path.exists():
+            with open(self.journal_path, "rb") as f:
+                for raw in f:
+                    try:
+                        entry = loads(raw)
+                    except Exception:
+                        # 最后一行可能因崩溃只写了一半
+                        continue
+                    entry_seq = int(entry.get("seq", 0))
+                    if entry_seq <= snapshot_seq:
+                        continue
+                    seq = max(seq, entry_seq)
+                    task_id = entry.get("id")
+                    if entry.get("op") == "del":
+                        state.pop(task_id, None)
+                        continue
+                    if entry.get("full"):
+                        state[task_id] = dict(entry.get("fields") or {})
+                    else:
+                        state.setdefault(task_id, {}).update(entry.get("fields") or {})
+
+        self._seq = seq
+        self._persisted = state
+        if migrated:
+            self.compact()
+            self._retire_legacy_json(len(state))
+        items = sorted(state.values(), key=lambda item: str(item.get("created_at") or ""))
+        return [dict(item) for item in items]
+
+    def close(self) -> None:
+        with self._write_lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+
+class TaskStoreWriter:
+    """
+    后台持久化线程
+    - mark_dirty 只登记变化并唤醒线程，请求处理和构建回调不再承担编码和磁盘写入
+    - 普通变化在 interval 内合并为一次 flush；urgent 的变化（状态切换）立即写入
+    - flush(wait=True) 用于返回前必须落盘的场景
+    """
+
+    def __init__(self, store: TaskStore, interval: float = 1.0):
+        self.store = store
+        self.interval = interval
+        self._cond = threading.Condition()
+        self._requested = 0  # 已登记的变更序号
+        self._flushed = 0  # 已落盘的变更序号
+        self._pending_since: Optional[float] = None
+        self._urgent = False
+        self._sync = False
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+        # 指标
+        self._mark_count = 0
+        self._flush_count = 0
+        self._error_count = 0
+        self._latency_last = 0.0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True, name="TaskStoreWriter")
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+        self._flush_once(sync=True)
+
+    def mark_dirty(self, task_ids: Optional[Iterable[str]] = None, urgent: bool = False) -> None:
+        for task_id in task_ids or ():
+            self.store.mark_dirty(task_id)
+        with self._cond:
+            self._requested += 1
+            self._mark_count += 1
+            if self._pending_since is None:
+                self._pending_since = time.monotonic()
+            if urgent:
+                self._urgent = True
+                self._sync = True
+            self._cond.notify_all()
+
+    def flush(self, wait: bool = True, timeout: float = 10.0) -> bool:
+        """立即写入所有待持久化的变化；wait=True 时阻塞到写入完成"""
+        if self._thread is None or not self._thread.is_alive():
+            self._flush_once(sync=True)
+            return True
+        with self._cond:
+            self._requested += 1
+            target = self._requested
+            self._urgent = True
+            self._sync = True
+            self._cond.notify_all()
+            if not wait:
+                return True
+            return self._cond.wait_for(lambda: self._flushed >= target, timeout)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stopped and self._flushed >= self._requested:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                # 合并窗口：等待更多变化，直到超时或有 urgent 请求
+                while not self._urgent and not self._stopped and self._pending_since is not None:
+                    remaining = self._pending_since + self.interval - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                target = self._requested
+                sync = self._sync
+                self._urgent = False
+                self._sync = False
+                self._pending_since = None
+            self._flush_once(sync)
+            with self._cond:
+                self._flushed = max(self._flushed, target)
+                self._cond.notify_all()
+
+    def _flush_once(self, sync: bool) -> None:
+        started = time.perf_counter()
+        try:
+            self.store.flush(sync=sync)
+        except Exception as exc:
+            self._error_count += 1
+            print(f"[TaskStore] 持久化失败: {exc}")
+            return
+        elapsed = time.perf_counter() - started
+        self._flush_count += 1
+        self._latency_last = elapsed
+        self._latency_total += elapsed
+        self._latency_max = max(self._latency_max, elapsed)
+
+    def metrics(self) -> dict:
+        flushes = self._flush_count
+        return {
+            "backend": type(self.store).__name__,
+            "marks": self._mark_count,
+            "flushes": flushes,
+            "errors": self._error_count,
+            "pending": max(0, self._requested - self._flushed),
+            # 平均每次 flush 合并了多少次变更
+            "coalescing_ratio": round(self._mark_count / flushes, 2) if flushes else 0.0,
+            "flush_latency_ms": {
+                "last": round(self._latency_last * 1000, 3),
+                "avg": round(self._latency_total / flushes * 1000, 3) if flushes else 0.0,
+                "max": round(self._latency_max * 1000, 3),
+            },
+        }
+
+
+TASK_STORE_BACKEND = os.getenv("APK_BUILDER_TASK_STORE", "sqlite").strip().lower()
+
+
+def create_task_store(tasks_dir: Path) -> TaskStore:
+    """根据 APK_BUILDER_TASK_STORE 创建任务存储（sqlite / journal）"""
+    legacy_json_path = tasks_dir / "tasks.json"
+    if TASK_STORE_BACKEND == "journal":
+        return JournalTaskStore(
+            tasks_dir / "tasks.snapshot.json",
+            tasks_dir / "tasks.journal",
+            legacy_json_path=legacy_json_path,
+        )
+    return SqliteTaskStore(tasks_dir / "tasks.db", legacy_json_path=legacy_json_path)
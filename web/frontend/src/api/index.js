@@ -125,6 +125,26 @@ export const getTaskLogs = async (taskId, lines = 100) => {
   return response.data
 }
 
+// 长轮询等待任务变化：返回变化后的任务（超时未变化时 task 为 null）和新的修订号
+export const waitTask = async (taskId, rev = 0, timeout = 30) => {
+  const clientId = getClientId()
+  const response = await api.get(`/tasks/${taskId}/wait`, {
+    params: { rev, timeout, client_id: clientId },
+    timeout: (timeout + 10) * 1000,
+    validateStatus: (status) => status === 200 || status === 304
+  })
+  return {
+    task: response.status === 200 ? response.data : null,
+    revision: Number(response.headers['x-task-revision'] || rev)
+  }
+}
+
+// 订阅任务状态和日志的实时推送（SSE）
+export const openTaskEvents = () => {
+  const clientId = getClientId()
+  return new EventSource(`/api/tasks/events?client_id=${encodeURIComponent(clientId)}`)
+}
+
 // 获取下载链接
 export const getDownloadUrl = (taskId) => {
   const clientId = getClientId()